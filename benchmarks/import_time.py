@@ -0,0 +1,63 @@
+"""
+    Measures the cold start time of importing pypenumbra and of the
+    pypenumbra command line interface, each in a fresh interpreter.
+    Exits with status 1 if a case is slower than its limit or loads a
+    module it should leave to first use.
+
+    With pypenumbra installed, run: python benchmarks/import_time.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+REPEATS = 5
+
+# Each case is (name, code, limit in seconds over a bare interpreter)
+CASES = (
+    ("import pypenumbra", "import pypenumbra", 0.1),
+    ("import pypenumbra.cli", "import pypenumbra.cli", 0.1),
+    # Fire renders help with IPython when it is installed, which is
+    # most of this case's time
+    ("pypenumbra --help", "import sys; sys.argv = ['pypenumbra', '--help']\n"
+                          "from pypenumbra.cli import main\n"
+                          "try:\n    main()\nexcept SystemExit:\n    pass", 1.0),
+    ("import pypenumbra.api", "import pypenumbra.api", 1.5),
+)
+
+# Modules only the reconstruction itself (or nothing at all) should load
+HEAVY_MODULES = ("cv2", "scipy", "skimage", "matplotlib")
+LIGHT_CASES = ("import pypenumbra", "import pypenumbra.cli", "pypenumbra --help")
+
+
+def run_python(code):
+    env = dict(os.environ, PAGER="cat")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def loaded_heavy_modules(code):
+    # Printing the loaded heavy modules after running the code
+    script = "%s\nimport sys\nprint(' '.join(m for m in %r if m in sys.modules))" % (code, HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], check=True, env=dict(os.environ, PAGER="cat"),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    return output.split()
+
+
+baseline = min(run_python("pass") for _ in range(REPEATS))
+print("Bare interpreter: %.1fms" % (baseline * 1000))
+
+failures = 0
+for name, code, limit in CASES:
+    seconds = min(run_python(code) for _ in range(REPEATS)) - baseline
+    heavy = loaded_heavy_modules(code) if name in LIGHT_CASES else []
+    failed = seconds > limit or bool(heavy)
+    failures += failed
+    print("%-24s | %8.1fms | limit %6.1fms%s%s"
+          % (name, seconds * 1000, limit * 1000, " | loaded " + ", ".join(heavy) if heavy else "",
+             " | FAILED" if failed else ""))
+
+if failures:
+    sys.exit(1)
@@ -0,0 +1,257 @@
+"""
+    Benchmarks the reconstruction pipeline on simulated penumbra plates
+    over a grid of image sizes, blob radii and angular steps. Each stage
+    and the end-to-end reconstruction are timed, and the peak traced
+    memory is recorded. Results are saved as JSON and can be compared
+    against a saved baseline to flag regressions.
+
+    With pypenumbra installed, run:
+        python benchmarks/pipeline.py run --output=results.json
+        python benchmarks/pipeline.py run --quick --baseline=results.json
+        python benchmarks/pipeline.py compare results.json new_results.json
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import fire
+import numpy as np
+
+from pypenumbra import api
+from pypenumbra import fbp
+from pypenumbra import polar
+from pypenumbra import profiling
+from pypenumbra import sart
+from pypenumbra import simulate as psim
+
+SIZES = ("1024x1024", "2370x1770")
+RADII = (100, 250, 400)
+ANGULAR_STEPS = (180, 360, 720)
+QUICK_SIZES = ("1024x1024",)
+QUICK_RADII = (100, 250)
+QUICK_ANGULAR_STEPS = (360,)
+
+# The source kernel every plate is blurred with
+KERNEL_SIZE = 69
+KERNEL_DISTANCE = 35
+
+RESULTS_VERSION = 1
+
+
+def parse_size(size):
+    width, height = (int(value) for value in str(size).lower().split("x"))
+    return width, height
+
+
+def as_tuple(values):
+    # Fire parses comma separated values as tuples and single values as is
+    if isinstance(values, (list, tuple)):
+        return tuple(values)
+    return (values,)
+
+
+def clear_caches():
+    polar.grid_cache.clear()
+    fbp.operator_cache.clear()
+    sart.solver_cache.clear()
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def benchmark_case(image, angular_steps, method, repeats):
+    """Times one plate and geometry. The first run is made with empty
+    geometry caches and reported separately, the rest are warm.
+    """
+
+    clear_caches()
+    start = time.perf_counter()
+    api.reconstruct_from_array(image, angular_steps=angular_steps, method=method)
+    cold_seconds = time.perf_counter() - start
+
+    seconds = []
+    stage_seconds = {}
+    for _ in range(repeats):
+        timings = profiling.Timings()
+        start = time.perf_counter()
+        api.reconstruct_from_array(image, angular_steps=angular_steps, method=method, timings=timings)
+        seconds.append(time.perf_counter() - start)
+        for stage_name, stage in timings.as_dict().items():
+            stage_seconds.setdefault(stage_name, []).append(stage["seconds"])
+
+    # Memory is traced in a separate run, as tracing slows every allocation
+    timings = profiling.Timings()
+    tracemalloc.start()
+    try:
+        api.reconstruct_from_array(image, angular_steps=angular_steps, method=method, timings=timings)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "cold_seconds": cold_seconds,
+        "seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "stages": {stage_name: statistics.median(values) for stage_name, values in stage_seconds.items()},
+        "peak_bytes": peak_bytes,
+        "stage_bytes": {stage_name: stage["bytes"] for stage_name, stage in timings.as_dict().items()},
+    }
+
+
+def case_key(case):
+    return (case["width"], case["height"], case["radius"], case["angular_steps"], case["method"])
+
+
+def case_name(case):
+    return "%dx%d r=%d steps=%d %s" % case_key(case)
+
+
+def compare_results(baseline, results, time_tolerance=0.15, memory_tolerance=0.05, min_seconds=0.001):
+    """Compares benchmark results against a baseline.
+
+    :param baseline: The baseline results
+    :param results: The new results
+    :param time_tolerance: The relative slowdown flagged as a regression
+    :param memory_tolerance: The relative peak memory growth flagged as a regression
+    :param min_seconds: Slowdowns smaller than this many seconds are ignored as noise
+    :returns: A list of (case name, message) regressions
+    """
+
+    baseline_cases = {case_key(case): case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        base = baseline_cases.get(case_key(case))
+        if base is None:
+            continue
+
+        name = case_name(case)
+        slowdown = case["seconds"] - base["seconds"]
+        if slowdown > min_seconds and slowdown > time_tolerance * base["seconds"]:
+            regressions.append((name, "time %.1fms -> %.1fms" % (base["seconds"] * 1000, case["seconds"] * 1000)))
+        for stage_name, seconds in case["stages"].items():
+            base_seconds = base["stages"].get(stage_name)
+            if base_seconds is None:
+                continue
+            slowdown = seconds - base_seconds
+            if slowdown > min_seconds and slowdown > time_tolerance * base_seconds:
+                regressions.append((name, "%s %.1fms -> %.1fms"
+                                    % (stage_name, base_seconds * 1000, seconds * 1000)))
+        if case["peak_bytes"] > (1 + memory_tolerance) * base["peak_bytes"]:
+            regressions.append((name, "peak memory %.1fMB -> %.1fMB"
+                                % (base["peak_bytes"] / 1e6, case["peak_bytes"] / 1e6)))
+
+    return regressions
+
+
+def print_comparison(baseline, results, regressions):
+    baseline_cases = {case_key(case): case for case in baseline["cases"]}
+    for case in results["cases"]:
+        base = baseline_cases.get(case_key(case))
+        if base is None:
+            print("%-36s | new case" % case_name(case))
+            continue
+        print("%-36s | %8.1fms -> %8.1fms (%+6.1f%%) | %7.1fMB -> %7.1fMB"
+              % (case_name(case), base["seconds"] * 1000, case["seconds"] * 1000,
+                 (case["seconds"] / base["seconds"] - 1) * 100,
+                 base["peak_bytes"] / 1e6, case["peak_bytes"] / 1e6))
+
+    if regressions:
+        print("---")
+        print("%d regression(s):" % len(regressions))
+        for name, message in regressions:
+            print("%s | %s" % (name, message))
+    else:
+        print("---")
+        print("No regressions")
+
+
+class PipelineBenchmark():
+    """Benchmarks the reconstruction pipeline on simulated plates.
+
+    Commands:
+        run - Benchmarks a grid of plates and saves the results as JSON.
+        compare - Compares two saved results and flags regressions.
+    """
+
+    def run(self, output="benchmark_results.json", sizes=SIZES, radii=RADII, angular_steps=ANGULAR_STEPS,
+            method="fbp", repeats=5, quick=False, baseline=None, time_tolerance=0.15, memory_tolerance=0.05):
+        """Benchmarks every combination of plate size, blob radius and
+        angular steps.
+
+        :param output: The path to save the JSON results at
+        :param sizes: The plate sizes as "WIDTHxHEIGHT"
+        :param radii: The radii of the penumbra blobs
+        :param angular_steps: The numbers of slices taken of each blob
+        :param method: The reconstruction method
+        :param repeats: How many warm runs are timed per case
+        :param quick: Benchmarks a small grid instead
+        :param baseline: The path to saved results to compare against
+        :param time_tolerance: The relative slowdown flagged as a regression
+        :param memory_tolerance: The relative peak memory growth flagged as a regression
+        """
+
+        if quick:
+            sizes, radii, angular_steps = QUICK_SIZES, QUICK_RADII, QUICK_ANGULAR_STEPS
+
+        kernel = psim.create_dual_point_kernel(KERNEL_SIZE, KERNEL_DISTANCE)
+        cases = []
+        for size in as_tuple(sizes):
+            width, height = parse_size(size)
+            for radius in as_tuple(radii):
+                radius = int(radius)
+                # Simulating a plate is far slower than reconstructing
+                # one, so each plate is reused for every angular step
+                image = psim.generate_penumbra(psim.generate_blank_penumbra_rectangle(width, height, radius), kernel)
+                for steps in as_tuple(angular_steps):
+                    case = {"width": width, "height": height, "radius": radius,
+                            "angular_steps": int(steps), "method": method}
+                    case.update(benchmark_case(image, int(steps), method, repeats))
+                    cases.append(case)
+                    print("%-36s | %8.1fms (cold %8.1fms) | peak %7.1fMB | %s"
+                          % (case_name(case), case["seconds"] * 1000, case["cold_seconds"] * 1000,
+                             case["peak_bytes"] / 1e6,
+                             " ".join("%s=%.1fms" % (stage_name, seconds * 1000)
+                                      for stage_name, seconds in case["stages"].items())))
+
+        results = {"version": RESULTS_VERSION, "environment": environment(), "cases": cases}
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Saved results to %s" % output)
+
+        if baseline is not None:
+            self.compare(baseline, output, time_tolerance=time_tolerance, memory_tolerance=memory_tolerance)
+
+    def compare(self, baseline, results, time_tolerance=0.15, memory_tolerance=0.05):
+        """Compares saved results against a saved baseline. Exits with
+        status 1 if any case regressed.
+
+        :param baseline: The path to the baseline results
+        :param results: The path to the new results
+        :param time_tolerance: The relative slowdown flagged as a regression
+        :param memory_tolerance: The relative peak memory growth flagged as a regression
+        """
+
+        with open(baseline) as f:
+            baseline = json.load(f)
+        with open(results) as f:
+            results = json.load(f)
+
+        regressions = compare_results(baseline, results, time_tolerance=time_tolerance,
+                                      memory_tolerance=memory_tolerance)
+        print_comparison(baseline, results, regressions)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    fire.Fire(PipelineBenchmark)
@@ -0,0 +1,45 @@
+"""
+    Compares the per-pixel get_line loop against the vectorized
+    polar sampling used by sinogram.slice_penumbra_blob.
+
+    With pypenumbra installed, run: python benchmarks/polar_sampling.py
+"""
+import math
+import timeit
+
+import numpy as np
+from skimage import img_as_float64
+
+from pypenumbra import imgutil
+from pypenumbra import polar
+from pypenumbra import simulate as psim
+
+ANGULAR_STEPS = 360
+RADII = (100, 246, 400)
+REPEATS = 3
+
+
+def loop_slices(center_x, center_y, radius, angular_steps, float_image):
+    rads_per_slice = (math.pi/180.0) * (360.0/angular_steps)
+    slices = np.zeros(shape=(angular_steps, radius), dtype="float64")
+    for i in range(0, angular_steps):
+        angle = i * rads_per_slice
+        outer_x = center_x + radius * math.cos(angle)
+        outer_y = center_y - radius * math.sin(angle)
+        slices[i] = imgutil.get_line(center_x, center_y, outer_x, outer_y, float_image)
+    return slices
+
+
+for radius in RADII:
+    image = img_as_float64(psim.generate_blank_penumbra_cr18x24(radius))
+    center_y, center_x = image.shape[0]//2, image.shape[1]//2
+    args = (center_x, center_y, radius, ANGULAR_STEPS, image)
+
+    loop_time = min(timeit.repeat(lambda: loop_slices(*args), number=1, repeat=REPEATS))
+    cold_time = min(timeit.repeat(lambda: polar.sample_polar(*args), setup=polar.grid_cache.clear,
+                                  number=1, repeat=REPEATS))
+    cached_time = min(timeit.repeat(lambda: polar.sample_polar(*args), number=1, repeat=REPEATS))
+    max_diff = np.max(np.abs(loop_slices(*args) - polar.sample_polar(*args)))
+
+    print("Radius: %d | Loop: %.4fs | Vectorized: %.4fs | Cached grid: %.4fs | Speedup: %.1fx | Max diff: %.2e"
+          % (radius, loop_time, cold_time, cached_time, loop_time/cached_time, max_diff))
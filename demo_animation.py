@@ -2,7 +2,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 
-import pypenumbra as ppen
 import pypenumbra.simulate as psim
 
 
@@ -35,11 +34,9 @@ class SimulationAnimation(animation.TimedAnimation):
         animation.TimedAnimation.__init__(self, fig, interval=50, blit=True)
 
     def _draw_frame(self, framedata):
-        i = framedata
+        parameters, (reconstruction_img, sinogram, penumbra_img) = framedata
+        i = parameters["point_distance"]
         kernel = psim.create_dual_point_kernel(self.kernel_size, i)
-        blank_penumbra = psim.generate_blank_penumbra_cr18x24(self.circle_radius)
-        penumbra_img = psim.generate_penumbra(blank_penumbra, kernel)
-        reconstruction_img, sinogram = ppen.reconstruct_from_array(penumbra_img)
 
         self.ax1.set_title("Kernel Image %dpx dist" % int(i))
         self.ax1.imshow(kernel, animated=True, cmap="gray")
@@ -51,7 +48,10 @@ class SimulationAnimation(animation.TimedAnimation):
         self.ax4.imshow(reconstruction_img, animated=True, cmap="gray")
 
     def new_frame_seq(self):
-        return iter(range(1, self.point_dist, 2))
+        # Frames are simulated and reconstructed ahead in worker processes
+        grid = psim.parameter_grid(circle_radius=[self.circle_radius], kernel_size=[self.kernel_size],
+                                   point_distance=range(1, self.point_dist, 2))
+        return psim.sweep(grid, return_penumbra=True)
 
 
 ani = SimulationAnimation(159, 157, 100)
@@ -1,13 +1,63 @@
-from .api import map_cr_values
-from .api import reconstruct
-from .api import reconstruct_from_image
-from .api import reconstruct_from_cr_data
-from .api import reconstruct_from_array
-from .simulate import create_dual_point_kernel
-from .simulate import create_kernel_from_image
-from .simulate import create_rectangle_kernel
-from .simulate import create_square_kernel
-from .simulate import generate_blank_penumbra_cr18x24
-from .simulate import generate_blank_penumbra_rectangle
-from .simulate import generate_blank_penumbra_square
-from .simulate import generate_penumbra
\ No newline at end of file
+"""
+    pypenumbra
+    ~~~~~~~~~~~~~~
+    Exports the public API of pypenumbra. Names are imported from their
+    modules on first use, so importing pypenumbra does not load OpenCV,
+    SciPy or scikit-image until they are needed.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import importlib
+
+__version__ = "0.1"
+
+# The module each exported name is defined in
+_EXPORTS = {
+    "map_cr_values": ".api",
+    "reconstruct": ".api",
+    "reconstruct_from_image": ".api",
+    "reconstruct_from_cr_data": ".api",
+    "reconstruct_from_array": ".api",
+    "reconstruct_batch": ".api",
+    "reconstruct_multiple": ".api",
+    "reconstruct_multiple_from_image": ".api",
+    "reconstruct_multiple_from_cr_data": ".api",
+    "reconstruct_progressive": ".api",
+    "init_worker": ".api",
+    "warm_worker": ".api",
+    "create_dual_point_kernel": ".simulate",
+    "create_kernel_from_image": ".simulate",
+    "create_rectangle_kernel": ".simulate",
+    "create_square_kernel": ".simulate",
+    "generate_blank_penumbra_cr18x24": ".simulate",
+    "generate_blank_penumbra_rectangle": ".simulate",
+    "generate_blank_penumbra_square": ".simulate",
+    "generate_penumbra": ".simulate",
+    "PenumbraSimulator": ".simulate",
+    "ReconstructionClient": ".client",
+    "ResultCache": ".resultcache",
+    "ResultStore": ".store",
+    "PlatePipeline": ".pipeline",
+}
+
+_SUBMODULES = ("api", "cache", "cli", "client", "crdata", "debug", "fbp", "imgutil", "output", "pipeline",
+               "polar", "profiling", "resultcache", "sart", "server", "simulate", "sinogram", "store", "watch")
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module("." + name, __name__)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    # Caching the name, so later lookups skip this function
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_SUBMODULES))
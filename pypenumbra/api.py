@@ -6,48 +6,25 @@
     :license: MIT
 """
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+from . import debug as debug_sink
+from . import fbp
+from . import imgutil
+from . import profiling
+from . import sart
 from . import sinogram
-from skimage import io
-from skimage import exposure
-from skimage.exposure import equalize_adapthist
-from skimage import img_as_ubyte, img_as_float64
-from skimage.transform import iradon
+from .crdata import map_cr_values, read_cr_roi
+from skimage import img_as_ubyte, img_as_float32, img_as_float64
 import numpy as np
 import cv2
 
-from matplotlib import pyplot as plt
+FLOAT_DTYPES = ("float64", "float32")
+RECONSTRUCTION_METHODS = ("fbp", "sart", "iradon")
 
 
-def map_cr_values(binary_image, kvp=70):
-    """Maps values from a binary CR image to a float image
-    based off of a calculation involving the kVp used to
-    generate the image.
-    
-    :param binary_image: A Numpy array containing the CR image values
-    :type binary_image: numpy.ndarray
-    :param kvp: The kVp used to generate the CR binary image, defaults to 70
-    :type kvp: int, optional
-    :return: A float image with values ranging from (-1, 1)
-    :rtype: numpy.ndarray
-    """
-
-    # Getting C value for mapping equation
-    # NOTE: This equation won't be an exact fit for most CR detectors,
-    # however, it should be good enough for the purposes of
-    # calibration within this library.
-    C = (-0.0739 * np.power(kvp, 2)) + (15.408 * kvp) + 301.17
-    # Applying CR mapping equation
-    map_values = np.subtract(binary_image, C)
-    map_values = np.divide(map_values, 1024)
-    map_values = np.power(10, map_values)
-    # Normalizing values to float image range (-1, 1)
-    map_values = np.divide(map_values, np.max(map_values))
-
-    return map_values
-
-
-def reconstruct_from_image(image_path, angular_steps=360, debug=False):
+def reconstruct_from_image(image_path, angular_steps=360, debug=False, method="fbp", float_dtype="float64",
+                           timings=None, cache=None, metadata=None, bounds_method="threshold"):
     """Reconstructs the focal spot and the sinogram
     from a penumbra image specified by an image path.
     
@@ -57,20 +34,51 @@ def reconstruct_from_image(image_path, angular_steps=360, debug=False):
     :type angular_steps: int, optional
     :param debug: A boolean value representing if debug images are output, defaults to False
     :type debug: bool, optional
+    :param method: The reconstruction method (see reconstruct), defaults to "fbp"
+    :type method: str, optional
+    :param float_dtype: The float type the image is processed in, either "float64"
+    or "float32". float32 halves the memory of every stage, defaults to "float64"
+    :type float_dtype: str, optional
+    :param timings: A profiling.Timings object the time of each stage is recorded in, defaults to None
+    :type timings: profiling.Timings, optional
+    :param cache: A resultcache.ResultCache the result is read from or stored in.
+    Debug runs are never cached, defaults to None
+    :type cache: resultcache.ResultCache, optional
+    :param metadata: A dictionary the penumbra's geometry, the sinogram's bounds and
+    the reconstruction parameters are recorded in (see reconstruct), defaults to None
+    :type metadata: dict, optional
+    :param bounds_method: How the top and bottom of the sinogram are found, either
+    "threshold" or "profile" (see sinogram.get_sinogram_size), defaults to "threshold"
+    :type bounds_method: str, optional
     :return: A tuple containing the reconstructed image and the sinogram image.
     :rtype: (numpy.ndarray, numpy.ndarray)
     """
 
-    # Attempting to load an image in grayscale
-    image = io.imread(image_path, as_gray=True)
-    # Ensuring float and ubyte images are available
-    float_image = img_as_float64(image)
-    ubyte_image = img_as_ubyte(image)
+    with profiling.stage("load", timings):
+        from skimage import io
+
+        # Attempting to load an image in grayscale
+        image = io.imread(image_path, as_gray=True)
+
+    # Images share cache entries with arrays holding the same pixels
+    params = {"angular_steps": angular_steps, "method": method, "float_dtype": float_dtype}
+    if bounds_method != "threshold":
+        params["bounds_method"] = bounds_method
+    key, result = _get_cached(cache, debug, metadata, image, **params)
+    if result is not None:
+        return result
 
-    return reconstruct(float_image, ubyte_image, angular_steps=angular_steps, debug=debug)
+    with profiling.stage("load", timings):
+        # Ensuring float and ubyte images are available
+        float_image = as_float(image, float_dtype)
+        ubyte_image = img_as_ubyte(image)
 
+    return _reconstruct_cached(cache, key, float_image, ubyte_image, angular_steps=angular_steps, debug=debug,
+                               method=method, timings=timings, metadata=metadata, bounds_method=bounds_method)
 
-def reconstruct_from_array(image_array, angular_steps=360, debug=False):
+
+def reconstruct_from_array(image_array, angular_steps=360, debug=False, method="fbp", float_dtype="float64",
+                           timings=None, geometry=None, cache=None, metadata=None, bounds_method="threshold"):
     """Reconstructs the focal spot and the sinogram
     from a passed penumbra image in the form of an array.
     
@@ -80,18 +88,53 @@ def reconstruct_from_array(image_array, angular_steps=360, debug=False):
     :type angular_steps: int, optional
     :param debug: A boolean value representing if debug images are output, defaults to False
     :type debug: bool, optional
+    :param method: The reconstruction method (see reconstruct), defaults to "fbp"
+    :type method: str, optional
+    :param float_dtype: The float type the image is processed in, either "float64"
+    or "float32". float32 halves the memory of every stage, defaults to "float64"
+    :type float_dtype: str, optional
+    :param timings: A profiling.Timings object the time of each stage is recorded in, defaults to None
+    :type timings: profiling.Timings, optional
+    :param geometry: The (center x, center y, radius) of the penumbra blob, skipping
+    its detection, defaults to None
+    :type geometry: tuple, optional
+    :param cache: A resultcache.ResultCache the result is read from or stored in.
+    Debug runs are never cached, defaults to None
+    :type cache: resultcache.ResultCache, optional
+    :param metadata: A dictionary the penumbra's geometry, the sinogram's bounds and
+    the reconstruction parameters are recorded in (see reconstruct), defaults to None
+    :type metadata: dict, optional
+    :param bounds_method: How the top and bottom of the sinogram are found, either
+    "threshold" or "profile" (see sinogram.get_sinogram_size), defaults to "threshold"
+    :type bounds_method: str, optional
     :return: A tuple containing the reconstructed image and the sinogram image.
     :rtype: (numpy.ndarray, numpy.ndarray)
     """
 
+    # A passed geometry or bounds method changes the result, so it is part
+    # of the key. The default bounds method is left out, keeping older keys.
+    params = {"angular_steps": angular_steps, "method": method, "float_dtype": float_dtype}
+    if geometry is not None:
+        params["geometry"] = [int(value) for value in geometry]
+    if bounds_method != "threshold":
+        params["bounds_method"] = bounds_method
+    key, result = _get_cached(cache, debug, metadata, image_array, **params)
+    if result is not None:
+        return result
+
     # Ensuring float and ubyte images are available
-    float_image = img_as_float64(image_array)
-    ubyte_image = img_as_ubyte(image_array)
+    with profiling.stage("load", timings):
+        float_image = as_float(image_array, float_dtype)
+        ubyte_image = img_as_ubyte(image_array)
 
-    return reconstruct(float_image, ubyte_image, angular_steps=angular_steps, debug=debug)
+    return _reconstruct_cached(cache, key, float_image, ubyte_image, angular_steps=angular_steps, debug=debug,
+                               method=method, timings=timings, geometry=geometry, metadata=metadata,
+                               bounds_method=bounds_method)
 
 
-def reconstruct_from_cr_data(data_path, width, height, dtype="uint16", kvp=70, angular_steps=360, debug=False):
+def reconstruct_from_cr_data(data_path, width, height, dtype="uint16", kvp=70, angular_steps=360, debug=False,
+                             method="fbp", roi=True, float_dtype="float64", timings=None, cache=None,
+                             metadata=None, bounds_method="threshold"):
     """Reconstructs the focal spot and the sinogram
     from raw binary image specified by the data path.
 
@@ -103,26 +146,62 @@ def reconstruct_from_cr_data(data_path, width, height, dtype="uint16", kvp=70, a
     :param angular_steps: The number of radial slices taken of the penumbra, defaults to 360
     :type angular_steps: int, optional
     :param debug: A boolean value representing if debug images are output
+    :param method: The reconstruction method (see reconstruct), defaults to "fbp"
+    :param roi: If only the region around the penumbra is decoded from a
+    memory map of the data (see crdata.read_cr_roi), defaults to True
+    :param float_dtype: The float type the image is processed in, either "float64"
+    or "float32", defaults to "float64"
+    :param timings: A profiling.Timings object the time of each stage is recorded in
+    :param cache: A resultcache.ResultCache the result is read from or stored in.
+    Debug runs are never cached
+    :param metadata: A dictionary the penumbra's geometry (in plate coordinates),
+    the sinogram's bounds and the reconstruction parameters are recorded in
+    :param bounds_method: How the top and bottom of the sinogram are found, either
+    "threshold" or "profile" (see sinogram.get_sinogram_size)
     :returns: A tuple containing the focal spot image
     and the sinogram image.
     """
 
-    image = np.fromfile(data_path, dtype=dtype)
-    image = image.reshape(width, height)
-    image = map_cr_values(image, kvp=kvp)
-    #image = equalize_adapthist(image)
-    # Ensuring float and ubyte images are available
-    float_image = img_as_float64(image)
-    ubyte_image = img_as_ubyte(image)
+    if float_dtype not in FLOAT_DTYPES:
+        raise ValueError("Unknown float type: %s" % float_dtype)
+
+    key = None
+    if cache is not None and not debug:
+        # The raw data is hashed through a memory map, so it is read once
+        # without decoding it
+        params = {"width": width, "height": height, "kvp": kvp, "angular_steps": angular_steps,
+                  "method": method, "roi": roi, "float_dtype": float_dtype}
+        if bounds_method != "threshold":
+            params["bounds_method"] = bounds_method
+        key, result = _get_cached(cache, debug, metadata, np.memmap(data_path, dtype=dtype, mode="r"), **params)
+        if result is not None:
+            return result
 
-    return reconstruct(float_image, ubyte_image, angular_steps=angular_steps, debug=debug)
+    offset = None
+    with profiling.stage("load", timings):
+        if roi:
+            image, offset = read_cr_roi(data_path, width, height, dtype=dtype, kvp=kvp, float_dtype=float_dtype)
+        else:
+            image = np.fromfile(data_path, dtype=dtype)
+            image = image.reshape(width, height)
+            image = map_cr_values(image, kvp=kvp, dtype=float_dtype)
+        #image = equalize_adapthist(image)
+        # Ensuring float and ubyte images are available
+        float_image = as_float(image, float_dtype)
+        ubyte_image = img_as_ubyte(image)
 
+    return _reconstruct_cached(cache, key, float_image, ubyte_image, angular_steps=angular_steps, debug=debug,
+                               method=method, timings=timings, metadata=metadata, offset=offset,
+                               bounds_method=bounds_method)
 
-def reconstruct(float_image, ubyte_image, angular_steps=360, debug=False):
+
+def reconstruct(float_image, ubyte_image, angular_steps=360, debug=False, method="fbp", timings=None,
+                geometry=None, metadata=None, bounds_method="threshold"):
     """Reconstructs the focal spot and the sinogram
-    from a penumbra image in the float64 and ubyte format.
+    from a penumbra image in the float and ubyte format.
     
-    :param float_image: The penumbra image in float64 format
+    :param float_image: The penumbra image in float64 or float32 format. Every
+    stage of the reconstruction keeps the precision of this image
     :type float_image: numpy.ndarray
     :param ubyte_image: The penumbra image in ubyte format
     :type ubyte_image: numpy.ndarray
@@ -130,15 +209,362 @@ def reconstruct(float_image, ubyte_image, angular_steps=360, debug=False):
     :type angular_steps: int, optional
     :param debug: A boolean value representing if debug images are saved, defaults to False
     :type debug: bool, optional
+    :param method: The reconstruction method. "fbp" uses a cached filtered
+    backprojection operator, "sart" refines the filtered backprojection
+    iteratively with SART until it converges and "iradon" uses
+    skimage.transform.iradon as a reference, defaults to "fbp"
+    :type method: str, optional
+    :param timings: A profiling.Timings object the time of each stage is recorded in, defaults to None
+    :type timings: profiling.Timings, optional
+    :param geometry: The (center x, center y, radius) of the penumbra blob, skipping
+    its detection, defaults to None
+    :type geometry: tuple, optional
+    :param metadata: A dictionary the penumbra's center_x, center_y and radius, the
+    padding around it, the top and bottom of the sinogram, the angular_steps, the
+    method and the float_dtype are recorded in, defaults to None
+    :type metadata: dict, optional
+    :param bounds_method: How the top and bottom of the sinogram are found, either
+    "threshold" or "profile" (see sinogram.get_sinogram_size), defaults to "threshold"
+    :type bounds_method: str, optional
     :return: A tuple containing the focal spot image and the sinogram
     :rtype: tuple
     """
 
+    if method not in RECONSTRUCTION_METHODS:
+        raise ValueError("Unknown reconstruction method: %s" % method)
+
     # Getting sinogram
-    sinogram_image = sinogram.construct_sinogram(float_image, ubyte_image, angular_steps=angular_steps, debug=debug)
+    sinogram_image = sinogram.construct_sinogram(float_image, ubyte_image, angular_steps=angular_steps, debug=debug,
+                                                 timings=timings, geometry=geometry, metadata=metadata,
+                                                 bounds_method=bounds_method)
+    if metadata is not None:
+        metadata.update(angular_steps=angular_steps, method=method, float_dtype=sinogram_image.dtype.name)
 
     # Reconstructing the focal spot with filtered backprojection
     theta = np.linspace(0., 360., sinogram_image.shape[1], endpoint=False)
-    focal_spot_image = iradon(sinogram_image, theta=theta, filter="ramp", circle=True)
+    float_dtype = sinogram_image.dtype
+    with profiling.stage("reconstruct", timings):
+        if method == "fbp":
+            operator = fbp.get_operator(sinogram_image.shape[0], theta, filter_name="ramp", dtype=float_dtype)
+            focal_spot_image = operator(sinogram_image)
+        elif method == "sart":
+            solver = sart.get_solver(sinogram_image.shape[0], theta, dtype=float_dtype)
+            focal_spot_image, iterations = solver(sinogram_image)
+        elif method == "iradon":
+            # Only imported here, as skimage.transform is slow to import
+            from skimage.transform import iradon
+
+            focal_spot_image = iradon(sinogram_image, theta=theta, filter_name="ramp", circle=True)
 
     return focal_spot_image, sinogram_image
+
+
+def reconstruct_multiple(float_image, ubyte_image, angular_steps=360, method="fbp", jobs=None,
+                         min_relative_area=0.1):
+    """Reconstructs the focal spot and the sinogram of every penumbra in
+    an image (Eg: several pinholes exposed on one plate). The penumbras
+    are found with one threshold and contour pass over the image (see
+    imgutil.detect_penumbras), then reconstructed in parallel on a pool
+    of threads. Every thread reads views of the same float and ubyte
+    images, so the image isn't copied per penumbra.
+
+    :param float_image: The penumbra image in float64 or float32 format
+    :type float_image: numpy.ndarray
+    :param ubyte_image: The penumbra image in ubyte format
+    :type ubyte_image: numpy.ndarray
+    :param angular_steps: The number of radial slices taken of each penumbra, defaults to 360
+    :type angular_steps: int, optional
+    :param method: The reconstruction method (see reconstruct), defaults to "fbp"
+    :type method: str, optional
+    :param jobs: The number of threads, defaults to the number of CPUs
+    :type jobs: int, optional
+    :param min_relative_area: The smallest area of a penumbra as a fraction of
+    the largest penumbra's area, defaults to 0.1
+    :type min_relative_area: float, optional
+    :return: A list with one entry per penumbra, largest first. Each entry is a
+    tuple containing the (center x, center y, radius) of the penumbra and a tuple
+    of its focal spot and sinogram images, or the exception raised while
+    reconstructing it.
+    :rtype: list
+    """
+
+    if method not in RECONSTRUCTION_METHODS:
+        raise ValueError("Unknown reconstruction method: %s" % method)
+
+    geometries = imgutil.detect_penumbras(ubyte_image, min_relative_area=min_relative_area)
+    if not geometries:
+        return []
+
+    def reconstruct_penumbra(geometry):
+        try:
+            return reconstruct(float_image, ubyte_image, angular_steps=angular_steps, method=method,
+                               geometry=geometry)
+        except Exception as e:
+            return e
+
+    # NumPy, SciPy and OpenCV release the GIL for the heavy stages, so
+    # threads run them in parallel while sharing the image
+    with ThreadPoolExecutor(max_workers=min(jobs or os.cpu_count() or 1, len(geometries))) as executor:
+        return list(zip(geometries, executor.map(reconstruct_penumbra, geometries)))
+
+
+def reconstruct_multiple_from_image(image_path, angular_steps=360, method="fbp", float_dtype="float64", jobs=None,
+                                    min_relative_area=0.1):
+    """Reconstructs the focal spot and the sinogram of every penumbra
+    in an image specified by an image path (see reconstruct_multiple).
+
+    :param image_path: The path to the penumbra image
+    :type image_path: string
+    :param angular_steps: The number of radial slices taken of each penumbra, defaults to 360
+    :type angular_steps: int, optional
+    :param method: The reconstruction method (see reconstruct), defaults to "fbp"
+    :type method: str, optional
+    :param float_dtype: The float type the image is processed in, either "float64"
+    or "float32", defaults to "float64"
+    :type float_dtype: str, optional
+    :param jobs: The number of threads, defaults to the number of CPUs
+    :type jobs: int, optional
+    :param min_relative_area: The smallest area of a penumbra as a fraction of
+    the largest penumbra's area, defaults to 0.1
+    :type min_relative_area: float, optional
+    :return: A list of (geometry, result) tuples, largest penumbra first (see reconstruct_multiple)
+    :rtype: list
+    """
+
+    from skimage import io
+
+    image = io.imread(image_path, as_gray=True)
+    float_image = as_float(image, float_dtype)
+    ubyte_image = img_as_ubyte(image)
+
+    return reconstruct_multiple(float_image, ubyte_image, angular_steps=angular_steps, method=method, jobs=jobs,
+                                min_relative_area=min_relative_area)
+
+
+def reconstruct_multiple_from_cr_data(data_path, width, height, dtype="uint16", kvp=70, angular_steps=360,
+                                      method="fbp", float_dtype="float64", jobs=None, min_relative_area=0.1):
+    """Reconstructs the focal spot and the sinogram of every penumbra
+    in a raw binary image specified by the data path (see
+    reconstruct_multiple). Unlike reconstruct_from_cr_data, which only
+    decodes the region around the largest penumbra (see
+    crdata.read_cr_roi), the whole plate is read and decoded once, as
+    the penumbras may be anywhere on it.
+
+    :param data_path: A path to the raw binary data
+    :param width: The width of the binary image
+    :param height: The height of the binary image
+    :param dtype: The data type of the binary image
+    :param kvp: The kVp used in the acquisition of the CR data
+    :param angular_steps: The number of radial slices taken of each penumbra
+    :param method: The reconstruction method (see reconstruct)
+    :param float_dtype: The float type the image is processed in, either "float64" or "float32"
+    :param jobs: The number of threads, defaults to the number of CPUs
+    :param min_relative_area: The smallest area of a penumbra as a fraction of
+    the largest penumbra's area
+    :returns: A list of (geometry, result) tuples, largest penumbra first (see reconstruct_multiple)
+    """
+
+    if float_dtype not in FLOAT_DTYPES:
+        raise ValueError("Unknown float type: %s" % float_dtype)
+
+    image = np.fromfile(data_path, dtype=dtype)
+    image = image.reshape(width, height)
+    float_image = map_cr_values(image, kvp=kvp, dtype=float_dtype)
+    ubyte_image = img_as_ubyte(float_image)
+
+    return reconstruct_multiple(float_image, ubyte_image, angular_steps=angular_steps, method=method, jobs=jobs,
+                                min_relative_area=min_relative_area)
+
+
+def reconstruct_progressive(float_image, ubyte_image, angular_steps=360, debug=False, timings=None,
+                            geometry=None, first_stride=16):
+    """Reconstructs the focal spot with filtered backprojection in steps,
+    yielding a coarse focal spot reconstructed from every first_stride-th
+    angle of the sinogram first. Each following step backprojects the
+    angles halfway between those already used into a running sum and
+    yields the refined focal spot (see fbp.ProgressiveBackprojection). The
+    last focal spot uses every angle and matches the focal spot of
+    reconstruct with method="fbp" to floating point rounding.
+
+    The sinogram is built from every angle before the first step, as
+    finding its top and bottom and taking its derivative need them all.
+
+    :param float_image: The penumbra image in float64 or float32 format
+    :type float_image: numpy.ndarray
+    :param ubyte_image: The penumbra image in ubyte format
+    :type ubyte_image: numpy.ndarray
+    :param angular_steps: The number of radial slices taken of the penumbra, defaults to 360
+    :type angular_steps: int, optional
+    :param debug: A boolean value representing if debug images are saved, defaults to False
+    :type debug: bool, optional
+    :param timings: A profiling.Timings object the time of each stage is recorded in, defaults to None
+    :type timings: profiling.Timings, optional
+    :param geometry: The (center x, center y, radius) of the penumbra blob, skipping
+    its detection, defaults to None
+    :type geometry: tuple, optional
+    :param first_stride: The spacing of the angles of the first focal spot, defaults to 16
+    :type first_stride: int, optional
+    :return: A generator of tuples containing the focal spot image, the
+    sinogram image and the number of angles the focal spot was reconstructed from
+    :rtype: generator
+    """
+
+    sinogram_image = sinogram.construct_sinogram(float_image, ubyte_image, angular_steps=angular_steps, debug=debug,
+                                                 timings=timings, geometry=geometry)
+
+    theta = np.linspace(0., 360., sinogram_image.shape[1], endpoint=False)
+    backprojection = fbp.ProgressiveBackprojection(sinogram_image, theta, filter_name="ramp",
+                                                   dtype=sinogram_image.dtype)
+    for indices in fbp.progressive_subsets(len(theta), first_stride):
+        with profiling.stage("reconstruct", timings):
+            focal_spot_image = backprojection.add(indices)
+        yield focal_spot_image, sinogram_image, backprojection.angle_count
+
+
+def _get_cached(cache, debug, metadata, pixels, **params):
+    # Returns the key of a reconstruction and its cached focal spot and
+    # sinogram, or None when it isn't cached
+    if cache is None or debug:
+        return None, None
+
+    if params.get("method") not in RECONSTRUCTION_METHODS:
+        raise ValueError("Unknown reconstruction method: %s" % params.get("method"))
+    key = cache.key(pixels, **params)
+    result = cache.get(key)
+    if result is None:
+        return key, None
+    if metadata is not None:
+        metadata.update(result[3])
+    return key, result[:2]
+
+
+def _reconstruct_cached(cache, key, float_image, ubyte_image, angular_steps=360, debug=False, method="fbp",
+                        timings=None, geometry=None, metadata=None, offset=None, bounds_method="threshold"):
+    # The metadata is always recorded for the cache, which stores it
+    if metadata is None and key is not None:
+        metadata = {}
+    focal_spot_image, sinogram_image = reconstruct(float_image, ubyte_image, angular_steps=angular_steps,
+                                                   debug=debug, method=method, timings=timings, geometry=geometry,
+                                                   metadata=metadata, bounds_method=bounds_method)
+    if offset is not None and metadata is not None:
+        offset_metadata(metadata, offset)
+
+    if key is not None:
+        cache.put(key, focal_spot_image, sinogram_image,
+                  (metadata["center_x"], metadata["center_y"], metadata["radius"]), metadata=metadata)
+    return focal_spot_image, sinogram_image
+
+
+def offset_metadata(metadata, offset):
+    """Moves the penumbra center recorded in metadata (see reconstruct)
+    from a region of a plate (Eg: read by crdata.read_cr_roi) to the
+    whole plate.
+
+    :param metadata: The metadata recorded by reconstructing the region
+    :type metadata: dict
+    :param offset: The (x, y) of the region's top left corner on the plate
+    :type offset: tuple
+    """
+
+    metadata["center_x"] += int(offset[0])
+    metadata["center_y"] += int(offset[1])
+
+
+def as_float(image, float_dtype="float64"):
+    """Converts an image to a float image of the given precision.
+
+    :param image: An image of any skimage supported type
+    :type image: numpy.ndarray
+    :param float_dtype: Either "float64" or "float32", defaults to "float64"
+    :type float_dtype: str, optional
+    :return: The image as a float image
+    :rtype: numpy.ndarray
+    """
+
+    if float_dtype == "float64":
+        return img_as_float64(image)
+    elif float_dtype == "float32":
+        return img_as_float32(image)
+    else:
+        raise ValueError("Unknown float type: %s" % float_dtype)
+
+
+def reconstruct_batch(images, angular_steps=360, jobs=None, chunksize=1, debug=False, method="fbp",
+                      float_dtype="float64", cache=None):
+    """Reconstructs the focal spot and the sinogram for many
+    penumbra images across a pool of worker processes.
+    
+    :param images: A list of image paths, a list of image arrays or an
+    N x H x W numpy array holding N penumbra images
+    :type images: list or numpy.ndarray
+    :param angular_steps: The number of radial slices taken of each penumbra, defaults to 360
+    :type angular_steps: int, optional
+    :param jobs: The number of worker processes, defaults to the number of CPUs.
+    A value of 1 reconstructs every image in the calling process.
+    :type jobs: int, optional
+    :param chunksize: How many images are sent to a worker at a time, defaults to 1
+    :type chunksize: int, optional
+    :param debug: A boolean value representing if debug images are output, defaults to False
+    :type debug: bool, optional
+    :param method: The reconstruction method (see reconstruct), defaults to "fbp"
+    :type method: str, optional
+    :param float_dtype: The float type the image is processed in, either "float64"
+    or "float32". float32 halves the memory of every stage, defaults to "float64"
+    :type float_dtype: str, optional
+    :param cache: A resultcache.ResultCache shared by the workers, defaults to None
+    :type cache: resultcache.ResultCache, optional
+    :return: A list in the same order as the input images. Each entry is
+    a tuple containing the focal spot image and the sinogram image, or the
+    exception raised while reconstructing that image.
+    :rtype: list
+    """
+
+    items = [(image, angular_steps, debug, method, float_dtype, cache) for image in images]
+
+    if jobs == 1:
+        return [_reconstruct_batch_item(item) for item in items]
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+        return list(executor.map(_reconstruct_batch_item, items, chunksize=chunksize))
+
+
+def init_worker():
+    """Sets up a worker process reconstructing one image at a time. Pass
+    it as the initializer of a process pool running reconstructions (Eg:
+    a ProcessPoolExecutor). OpenCV's own threads would only compete with
+    the other workers for cores, so they are turned off.
+    """
+
+    cv2.setNumThreads(1)
+
+
+def warm_worker():
+    """Runs a small reconstruction, loading every module and code path a
+    reconstruction needs. Submit it once per worker of a pool before
+    the first image, so the first images don't pay for the imports.
+    """
+
+    image = np.zeros((128, 128))
+    cv2.circle(image, (64, 64), 40, 1.0, thickness=-1)
+    image = cv2.GaussianBlur(image, (9, 9), 0)
+    try:
+        reconstruct_from_array(image)
+    except ValueError:
+        pass
+
+
+def _reconstruct_batch_item(item):
+    image, angular_steps, debug, method, float_dtype, cache = item
+    try:
+        if isinstance(image, (str, os.PathLike)):
+            return reconstruct_from_image(image, angular_steps=angular_steps, debug=debug, method=method,
+                                          float_dtype=float_dtype, cache=cache)
+        return reconstruct_from_array(image, angular_steps=angular_steps, debug=debug, method=method,
+                                      float_dtype=float_dtype, cache=cache)
+    except Exception as e:
+        return e
+    finally:
+        # Worker processes exit without running atexit handlers, so
+        # queued debug images are written before returning
+        if debug:
+            debug_sink.flush()
@@ -0,0 +1,121 @@
+"""
+    pypenumbra.cache
+    ~~~~~~~~~~~~~~
+    Defines a bounded, least recently used cache for precomputed
+    geometry that is shared between reconstructions.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+from collections import OrderedDict
+import threading
+
+
+class LRUCache():
+    """A least recently used cache that is bounded by the number
+    of bytes held by its values rather than the number of entries.
+
+    :param max_bytes: The largest number of bytes the cache may hold
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Gets a cached value and marks it as recently used.
+
+        :param key: A hashable key
+        :returns: The cached value or None if the key is not cached
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Adds a value to the cache, evicting the least recently
+        used values until the cache fits within its memory cap.
+        Values larger than the cap are not stored.
+
+        :param key: A hashable key
+        :param value: The value to cache
+        :param nbytes: The number of bytes held by the value
+        """
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def get_or_create(self, key, factory):
+        """Gets a cached value, creating and caching it on a miss.
+        Values created by the factory must have an nbytes attribute.
+
+        :param key: A hashable key
+        :param factory: A callable taking no arguments that creates the value
+        :returns: The cached or newly created value
+        """
+
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value, value.nbytes)
+
+        return value
+
+    def resize(self, max_bytes):
+        """Changes the memory cap of the cache, evicting values if needed.
+
+        :param max_bytes: The largest number of bytes the cache may hold
+        """
+
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Removes every value from the cache and resets the counters."""
+
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Gets the statistics of the cache.
+
+        :returns: A dictionary with the hits, misses, entries, current
+        bytes and maximum bytes of the cache
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, (value, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
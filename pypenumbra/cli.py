@@ -7,12 +7,15 @@
     :license: MIT
 """
 import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-import fire
-from skimage import io, img_as_ubyte
-from skimage.exposure import equalize_adapthist
+from .output import (check_output_options, get_output_paths, is_up_to_date, reconstruct_input,
+                     save_reconstruction, OutputWriter, OUTPUT_SUFFIXES)
 
-from .api import reconstruct_from_image, reconstruct_from_cr_data
+# The reconstruction pipeline and the scientific stack behind it are
+# imported by the commands that use them, so "--help" starts quickly
 
 
 class PyPenumbraCLI():
@@ -30,12 +33,22 @@ class PyPenumbraCLI():
         from a penumbra in a referenced binary image (Eg: raw data from
         a CR plate).
 
+        batch_reconstruct - Reconstructs focal spot/sinogram images for
+        every penumbra image in a directory or matched by a glob.
+
+        watch - Watches a directory and reconstructs focal spot/sinogram
+        images for penumbra images as they arrive.
+
+        serve - Serves focal spot/sinogram reconstructions over HTTP on
+        a local address, keeping the reconstruction pipeline warm.
+
     Please type "pypenumbra COMMAND --help" for more information
     about these commands.
     """
 
     def image_reconstruct(self, data_path, output_dir="",
-    focal_spot_image_name="focal_spot", sinogram_image_name="sinogram"):
+    focal_spot_image_name="focal_spot", sinogram_image_name="sinogram",
+    output_format="png", preview=False, compress=False, bundle_name="reconstruction"):
         """Reconstructs a focal spot/sinogram image from
         a penumbra in a referenced image.
 
@@ -43,21 +56,30 @@ class PyPenumbraCLI():
         :param output_dir: The path to a directory to save the output images
         :param focal_spot_image_name: The name of the focal spot image
         :param sinogram_image_name: The name of the sinogram image
+        :param output_format: "png" saves contrast stretched images, "npy" and
+        "tiff" save the float images and "npz" saves both images and the
+        penumbra geometry in one bundle
+        :param preview: Also saves contrast stretched PNG previews of raw outputs
+        :param compress: Compresses NPZ outputs. The float64 images of TIFF outputs
+        can't be compressed
+        :param bundle_name: The name of the NPZ bundle
         """
 
-        focal_spot, sinogram = reconstruct_from_image(data_path)
+        from .api import reconstruct_from_image
 
-        focal_spot = img_as_ubyte(equalize_adapthist(focal_spot))
-        focal_spot_path = os.path.join(output_dir, "%s.png" % focal_spot_image_name)
-        sinogram = img_as_ubyte(equalize_adapthist(sinogram))
-        sinogram_path = os.path.join(output_dir, "%s.png" % sinogram_image_name)
-
-        io.imsave(focal_spot_path, focal_spot)
-        io.imsave(sinogram_path, sinogram)
+        check_output_options(output_format, compress)
+        paths = get_output_paths(os.path.join(output_dir, focal_spot_image_name),
+                                 os.path.join(output_dir, sinogram_image_name),
+                                 os.path.join(output_dir, bundle_name), output_format, preview)
+        metadata = {}
+        focal_spot, sinogram = reconstruct_from_image(data_path, metadata=metadata)
+        save_reconstruction(focal_spot, sinogram, paths, output_format=output_format, metadata=metadata,
+                            compress=compress)
     
     def binary_reconstruct(self, data_path, width, height, dtype="uint16",
     output_dir="", focal_spot_image_name="focal_spot", 
-    sinogram_image_name="sinogram"):
+    sinogram_image_name="sinogram", output_format="png", preview=False,
+    compress=False, bundle_name="reconstruction"):
         """Reconstructs a focal spot/sinogram image from
         a penumbra in a referenced binary image.
 
@@ -68,20 +90,249 @@ class PyPenumbraCLI():
         :param output_dir: The path to a directory to save the output images
         :param focal_spot_image_name: The name of the focal spot image
         :param sinogram_image_name: The name of the sinogram image
+        :param output_format: "png" saves contrast stretched images, "npy" and
+        "tiff" save the float images and "npz" saves both images and the
+        penumbra geometry in one bundle
+        :param preview: Also saves contrast stretched PNG previews of raw outputs
+        :param compress: Compresses NPZ outputs. The float64 images of TIFF outputs
+        can't be compressed
+        :param bundle_name: The name of the NPZ bundle
+        """
+
+        from .api import reconstruct_from_cr_data
+
+        check_output_options(output_format, compress)
+        paths = get_output_paths(os.path.join(output_dir, focal_spot_image_name),
+                                 os.path.join(output_dir, sinogram_image_name),
+                                 os.path.join(output_dir, bundle_name), output_format, preview)
+        metadata = {}
+        focal_spot, sinogram = reconstruct_from_cr_data(data_path, width, height, dtype=dtype, metadata=metadata)
+        save_reconstruction(focal_spot, sinogram, paths, output_format=output_format, metadata=metadata,
+                            compress=compress)
+
+    def batch_reconstruct(self, data_path, output_dir="", jobs=None, width=None,
+    height=None, dtype="uint16", force=False, output_format="png", preview=False,
+    compress=False, store=None, threads=None):
+        """Reconstructs focal spot/sinogram images for every penumbra
+        image in a directory or matched by a glob. Output images mirror
+        the input file names and sub-directories in the output directory,
+        and inputs whose outputs are newer than them are skipped. Outputs
+        are written while the next images are reconstructed.
+
+        :param data_path: A directory or a glob (Eg: "plates/**/*.png") of penumbra images
+        :param output_dir: The path to a directory to save the output images
+        :param jobs: The number of worker processes, defaults to the number of CPUs
+        :param width: The width of the binary images, if the inputs are binary images
+        :param height: The height of the binary images, if the inputs are binary images
+        :param dtype: The data type of the binary images
+        :param force: Reconstructs every input, even if its outputs are up to date
+        :param output_format: "png" saves contrast stretched images, "npy" and
+        "tiff" save the float images and "npz" saves both images and the
+        penumbra geometry in one bundle per input
+        :param preview: Also saves contrast stretched PNG previews of raw outputs
+        :param compress: Compresses NPZ outputs. The float64 images of TIFF outputs
+        can't be compressed
+        :param store: The directory of a store.ResultStore to append results to
+        instead of saving files. Plates are stored under their input path
+        relative to data_path, without the extension, and plates already in
+        the store are skipped
+        :param threads: Reconstructs in this process with this many reconstruct
+        threads instead of worker processes, on a pipeline that loads the next
+        images and writes the last ones while reconstructing. Statistics of
+        each stage are printed at the end
+        """
+
+        check_output_options(output_format, compress)
+        binary = width is not None and height is not None
+        inputs = find_batch_inputs(data_path)
+        if store is not None:
+            from .store import ResultStore
+
+            store = ResultStore(store)
+            # Reading the index once, rather than once per input
+            stored = set(store.ids())
+        tasks = []
+        output_paths = {}
+        skipped = 0
+        for input_path, relative_path in inputs:
+            stem = os.path.splitext(relative_path)[0]
+            if store is not None:
+                paths = stem.replace(os.sep, "/")
+                up_to_date = paths in stored
+            else:
+                stem = os.path.join(output_dir, stem)
+                paths = get_output_paths(stem + "_focal_spot", stem + "_sinogram", stem, output_format, preview)
+                up_to_date = is_up_to_date(input_path, paths)
+            if not force and up_to_date:
+                skipped += 1
+                continue
+            options = (width, height, dtype) if binary else None
+            tasks.append((input_path, options))
+            output_paths[input_path] = paths
+
+        start = time.perf_counter()
+        failed = 0
+        if tasks and threads is not None:
+            from .pipeline import PlatePipeline
+
+            writer = OutputWriter(output_format=output_format, compress=compress, store=store)
+            pipeline = PlatePipeline(write=lambda input_path, focal_spot, sinogram, metadata: writer.save(
+                                         focal_spot, sinogram, output_paths[input_path], metadata=metadata),
+                                     binary_options=(width, height, dtype) if binary else None,
+                                     compute_workers=threads)
+            for input_path, result in pipeline.run([input_path for input_path, options in tasks]):
+                if isinstance(result, Exception):
+                    failed += 1
+                    action = "save" if result.stage == "write" else "reconstruct"
+                    print("Failed to %s %s: %s" % (action, input_path, result))
+            if store is not None:
+                store.close()
+            print_stage_stats(pipeline.stats())
+        elif tasks:
+            from .api import init_worker
+
+            writer = OutputWriter(output_format=output_format, compress=compress, store=store)
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+                for input_path, result in executor.map(reconstruct_input, *zip(*tasks)):
+                    if isinstance(result, Exception):
+                        failed += 1
+                        print("Failed to reconstruct %s: %s" % (input_path, result))
+                        continue
+                    focal_spot, sinogram, metadata = result
+                    writer.write(input_path, focal_spot, sinogram, output_paths[input_path], metadata=metadata)
+            writer.flush()
+            if store is not None:
+                store.close()
+            for input_path, error in writer.errors:
+                failed += 1
+                print("Failed to save %s: %s" % (input_path, error))
+        elapsed = time.perf_counter() - start
+
+        completed = len(tasks) - failed
+        print("Reconstructed %d of %d images (%d skipped, %d failed) in %.2fs | %.2f images/s"
+              % (completed, len(inputs), skipped, failed, elapsed,
+                 completed / elapsed if elapsed > 0 else 0.0))
+
+    def watch(self, input_dir, output_dir="", jobs=None, pattern="*", width=None,
+    height=None, dtype="uint16", poll_interval=1.0, settle_time=1.0, status_file=None,
+    output_format="png", preview=False, compress=False):
+        """Watches a directory and reconstructs focal spot/sinogram images
+        for penumbra images as they arrive, until interrupted. Images are
+        reconstructed on a pool of warm worker processes and written
+        atomically. The queue depth, latency and throughput are kept up
+        to date in a JSON status file.
+
+        :param input_dir: The directory to watch
+        :param output_dir: The path to a directory to save the output images
+        :param jobs: The number of worker processes, defaults to the number of CPUs
+        :param pattern: A glob pattern the file names must match (Eg: "*.std")
+        :param width: The width of the binary images, if the inputs are binary images
+        :param height: The height of the binary images, if the inputs are binary images
+        :param dtype: The data type of the binary images
+        :param poll_interval: The seconds between scans of the directory
+        :param settle_time: The seconds a file must stay unchanged before it is reconstructed
+        :param status_file: The path of the status file, defaults to
+        watch_status.json in the output directory
+        :param output_format: "png" saves contrast stretched images, "npy" and
+        "tiff" save the float images and "npz" saves both images and the
+        penumbra geometry in one bundle per input
+        :param preview: Also saves contrast stretched PNG previews of raw outputs
+        :param compress: Compresses NPZ outputs. The float64 images of TIFF outputs
+        can't be compressed
         """
 
-        focal_spot, sinogram = reconstruct_from_cr_data(data_path, width, height, dtype=dtype)
+        from .watch import FolderWatcher
+
+        check_output_options(output_format, compress)
+        binary_options = (width, height, dtype) if width is not None and height is not None else None
+        watcher = FolderWatcher(input_dir, output_dir or os.curdir, jobs=jobs, pattern=pattern,
+                                binary_options=binary_options, poll_interval=poll_interval,
+                                settle_time=settle_time, status_path=status_file, output_format=output_format,
+                                preview=preview, compress=compress)
+        print("Watching %s (status in %s)" % (input_dir, watcher.status_path))
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        status = watcher.status()
+        print("Reconstructed %d images (%d failed)" % (status["completed"], status["failed"]))
+
+    def serve(self, host="127.0.0.1", port=8765, jobs=1, max_batch=8, batch_window=0.005):
+        """Serves focal spot/sinogram reconstructions over HTTP until
+        interrupted. Penumbra images are posted to /reconstruct and the
+        focal spot and sinogram are returned as a .npz archive (see
+        pypenumbra.client.ReconstructionClient). Concurrent requests are
+        batched onto the workers.
+
+        :param host: The host to listen on
+        :param port: The port to listen on
+        :param jobs: The number of workers. With 1, images are reconstructed in the server process
+        :param max_batch: The most requests given to a worker at once
+        :param batch_window: The seconds a free worker waits for more requests to join a batch
+        """
+
+        from .server import ReconstructionServer
+
+        server = ReconstructionServer(host=host, port=port, jobs=jobs, max_batch=max_batch,
+                                      batch_window=batch_window)
+        server.start()
+        print("Serving reconstructions on http://%s:%d" % server.address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+        status = server.status()
+        print("Reconstructed %d images (%d failed) in %d batches"
+              % (status["completed"], status["failed"], status["batches"]))
+
 
-        focal_spot = img_as_ubyte(equalize_adapthist(focal_spot))
-        focal_spot_path = os.path.join(output_dir, "%s.png" % focal_spot_image_name)
-        sinogram = img_as_ubyte(equalize_adapthist(sinogram))
-        sinogram_path = os.path.join(output_dir, "%s.png" % sinogram_image_name)
+def print_stage_stats(stats):
+    """Prints the statistics of each stage of a pipeline.StagedPipeline.
+
+    :param stats: The statistics returned by StagedPipeline.stats
+    """
+
+    for name, stage in stats.items():
+        print("%-12s | %d items (%d failed) | busy %.2fs | starved %.2fs | blocked %.2fs | queue mean %s max %d"
+              % (name, stage["processed"], stage["failed"], stage["busy_seconds"], stage["starved_seconds"],
+                 stage["blocked_seconds"],
+                 "-" if stage["mean_queue_depth"] is None else "%.1f" % stage["mean_queue_depth"],
+                 stage["max_queue_depth"]))
 
-        io.imsave(focal_spot_path, focal_spot)
-        io.imsave(sinogram_path, sinogram)
+
+def find_batch_inputs(data_path):
+    """Finds the files in a directory or matched by a glob, leaving out
+    hidden files and reconstruction outputs (see output.OUTPUT_SUFFIXES),
+    so outputs saved next to the inputs are never reconstructed.
+
+    :param data_path: A directory or a glob
+    :returns: A sorted list of tuples containing each file's path and its
+    path relative to the directory or the fixed part of the glob
+    """
+
+    if os.path.isdir(data_path):
+        base_dir = data_path
+        paths = [os.path.join(data_path, name) for name in os.listdir(data_path)]
+    else:
+        # The base directory is everything before the first glob component
+        parts = os.path.normpath(data_path).split(os.sep)
+        magic = [i for i, part in enumerate(parts) if glob.has_magic(part)]
+        if magic:
+            base_dir = os.sep.join(parts[:magic[0]])
+        else:
+            base_dir = os.path.dirname(data_path)
+        paths = glob.glob(data_path, recursive=True)
+
+    return sorted((path, os.path.relpath(path, base_dir or os.curdir)) for path in paths
+                  if os.path.isfile(path) and not os.path.basename(path).startswith(".")
+                  and not path.endswith(OUTPUT_SUFFIXES))
 
 
 def main():
+    import fire
+
     fire.Fire(PyPenumbraCLI)
 
 
@@ -0,0 +1,106 @@
+"""
+    pypenumbra.client
+    ~~~~~~~~~~~~~~
+    Defines a client for the local reconstruction server started with
+    "pypenumbra serve". Only NumPy is needed to use it.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import io
+import json
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Request bodies are either a .npy array or an image file (Eg: PNG or
+# TIFF) and responses are a .npz archive of the focal spot and sinogram
+NPY_CONTENT_TYPE = "application/x-npy"
+NPZ_CONTENT_TYPE = "application/x-npz"
+IMAGE_CONTENT_TYPE = "application/octet-stream"
+
+
+class ReconstructionClient():
+    """Sends penumbra images to a local reconstruction server and
+    returns the reconstructed focal spot and sinogram.
+
+    :param host: The host the server listens on, defaults to "127.0.0.1"
+    :type host: str, optional
+    :param port: The port the server listens on, defaults to 8765
+    :type port: int, optional
+    :param timeout: The seconds to wait for a reconstruction, defaults to 60.0
+    :type timeout: float, optional
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60.0):
+        self.url = "http://%s:%d" % (host, port)
+        self.timeout = timeout
+
+    def reconstruct_array(self, image, angular_steps=360, method="fbp", float_dtype="float64"):
+        """Reconstructs the focal spot and sinogram of a penumbra image array.
+
+        :param image: A penumbra image
+        :type image: numpy.ndarray
+        :param angular_steps: The number of radial slices taken of the penumbra, defaults to 360
+        :type angular_steps: int, optional
+        :param method: The reconstruction method, defaults to "fbp"
+        :type method: str, optional
+        :param float_dtype: The float type the image is processed in, defaults to "float64"
+        :type float_dtype: str, optional
+        :return: A tuple containing the focal spot image and the sinogram image
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+
+        body = io.BytesIO()
+        np.save(body, np.asarray(image), allow_pickle=False)
+        return self._reconstruct(body.getvalue(), NPY_CONTENT_TYPE, angular_steps, method, float_dtype)
+
+    def reconstruct_file(self, image_path, angular_steps=360, method="fbp", float_dtype="float64"):
+        """Reconstructs the focal spot and sinogram of a penumbra image
+        file. The file is sent as is and decoded by the server.
+
+        :param image_path: The path to a penumbra image
+        :type image_path: str
+        :param angular_steps: The number of radial slices taken of the penumbra, defaults to 360
+        :type angular_steps: int, optional
+        :param method: The reconstruction method, defaults to "fbp"
+        :type method: str, optional
+        :param float_dtype: The float type the image is processed in, defaults to "float64"
+        :type float_dtype: str, optional
+        :return: A tuple containing the focal spot image and the sinogram image
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+
+        with open(image_path, "rb") as f:
+            body = f.read()
+        return self._reconstruct(body, IMAGE_CONTENT_TYPE, angular_steps, method, float_dtype)
+
+    def status(self):
+        """Gets the request and batch counts of the server.
+
+        :return: A dictionary of statistics
+        :rtype: dict
+        """
+
+        with urlopen(self.url + "/status", timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def _reconstruct(self, body, content_type, angular_steps, method, float_dtype):
+        query = urlencode({"angular_steps": angular_steps, "method": method, "float_dtype": float_dtype})
+        request = Request(self.url + "/reconstruct?" + query, data=body, headers={"Content-Type": content_type})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+        except HTTPError as e:
+            message = e.read().decode("utf-8", "replace")
+            # Bad inputs raise the same error as reconstructing locally
+            if e.code == 400:
+                raise ValueError(message)
+            raise RuntimeError("Reconstruction failed (%d): %s" % (e.code, message))
+
+        with np.load(io.BytesIO(data), allow_pickle=False) as result:
+            return result["focal_spot"], result["sinogram"]
@@ -0,0 +1,138 @@
+"""
+    pypenumbra.crdata
+    ~~~~~~~~~~~~~~
+    Defines the logic for reading raw binary CR data, including
+    memory-mapped reading of only the region around the penumbra.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import numpy as np
+from skimage import img_as_ubyte
+
+from . import imgutil
+
+# How many rows are read at a time when scanning a whole plate
+CHUNK_ROWS = 256
+
+
+def map_cr_values(binary_image, kvp=70, raw_max=None, dtype="float64"):
+    """Maps values from a binary CR image to a float image
+    based off of a calculation involving the kVp used to
+    generate the image.
+    
+    :param binary_image: A Numpy array containing the CR image values
+    :type binary_image: numpy.ndarray
+    :param kvp: The kVp used to generate the CR binary image, defaults to 70
+    :type kvp: int, optional
+    :param raw_max: The largest raw value of the whole CR image. Used to
+    normalize a region of an image the same way as the whole image,
+    defaults to the largest value in binary_image
+    :type raw_max: int, optional
+    :param dtype: The float type of the mapped image, defaults to "float64"
+    :type dtype: str, optional
+    :return: A float image with values ranging from (-1, 1)
+    :rtype: numpy.ndarray
+    """
+
+    # Getting C value for mapping equation
+    # NOTE: This equation won't be an exact fit for most CR detectors,
+    # however, it should be good enough for the purposes of
+    # calibration within this library.
+    C = (-0.0739 * np.power(kvp, 2)) + (15.408 * kvp) + 301.17
+    # Applying CR mapping equation
+    map_values = np.subtract(binary_image, C, dtype=dtype)
+    map_values = np.divide(map_values, 1024, out=map_values)
+    map_values = np.power(10, map_values, out=map_values)
+    # Normalizing values to float image range (-1, 1)
+    if raw_max is None:
+        map_max = np.max(map_values)
+    else:
+        # The mapping is increasing, so the largest raw value
+        # gives the largest mapped value
+        map_max = np.power(10, np.divide(np.subtract(raw_max, C), 1024))
+    map_values = np.divide(map_values, map_max, out=map_values, casting="same_kind")
+
+    return map_values
+
+
+def open_cr_data(data_path, width, height, dtype="uint16"):
+    """Memory maps raw binary CR data without reading it.
+
+    :param data_path: A path to the raw binary data
+    :param width: The width of the binary image
+    :param height: The height of the binary image
+    :param dtype: The data type of the binary image
+    :returns: A read-only numpy.memmap of the binary image
+    """
+
+    # Keeping the (width, height) reshape order of np.fromfile(...).reshape
+    return np.memmap(data_path, dtype=dtype, mode="r", shape=(width, height))
+
+
+def get_raw_max(raw_image):
+    """Gets the largest value of a raw image, reading it in chunks of
+    rows so a memory-mapped image is never loaded all at once.
+
+    :param raw_image: A raw image, usually a numpy.memmap
+    :returns: The largest value in the image
+    """
+
+    return max(np.max(raw_image[row:row + CHUNK_ROWS])
+               for row in range(0, raw_image.shape[0], CHUNK_ROWS))
+
+
+def read_cr_roi(data_path, width, height, dtype="uint16", kvp=70, decimation=8, normalization="full",
+                float_dtype="float64"):
+    """Reads the region of raw binary CR data around the penumbra.
+    The penumbra is found on a decimated view of the memory-mapped
+    plate and only the padded region around it is decoded.
+
+    :param data_path: A path to the raw binary data
+    :param width: The width of the binary image
+    :param height: The height of the binary image
+    :param dtype: The data type of the binary image
+    :param kvp: The kVp used in the acquisition of the CR data
+    :param decimation: The step between pixels of the view used to find the penumbra
+    :param normalization: Where the largest raw value used to normalize the plate
+    is taken from. "full" scans the whole plate in chunks and matches a full
+    read exactly. "sampled" only uses the decimated view and the region,
+    which avoids reading the whole plate but can differ if the brightest
+    pixel lies elsewhere.
+    :param float_dtype: The float type of the region image, defaults to "float64"
+    :returns: A tuple containing the float region image and the (x, y)
+    offset of the region in the plate
+    """
+
+    raw_image = open_cr_data(data_path, width, height, dtype=dtype)
+    view = np.array(raw_image[::decimation, ::decimation])
+
+    if normalization == "full":
+        raw_max = get_raw_max(raw_image)
+    elif normalization == "sampled":
+        raw_max = np.max(view)
+    else:
+        raise ValueError("Unknown normalization: %s" % normalization)
+
+    # Finding the penumbra on the decimated view
+    view_image = img_as_ubyte(np.clip(map_cr_values(view, kvp=kvp, raw_max=raw_max), 0, 1))
+    center_x, center_y, radius = imgutil.get_center(imgutil.threshold(view_image))
+    if radius < 1:
+        raise ValueError("Unable to find a penumbra in the CR data")
+
+    # Covering the blob with the relative padding used when slicing,
+    # plus a few decimated pixels for the error of the coarse detection
+    center_x = center_x * decimation
+    center_y = center_y * decimation
+    half_size = int(((radius + 2) * decimation) * 1.1) + 2 * decimation
+    rows, cols = raw_image.shape
+    top = max(center_y - half_size, 0)
+    bottom = min(center_y + half_size, rows)
+    left = max(center_x - half_size, 0)
+    right = min(center_x + half_size, cols)
+
+    region = np.array(raw_image[top:bottom, left:right])
+    if normalization == "sampled":
+        raw_max = max(raw_max, np.max(region))
+    region = map_cr_values(region, kvp=kvp, raw_max=raw_max, dtype=float_dtype)
+
+    return region, (left, top)
@@ -0,0 +1,162 @@
+"""
+    pypenumbra.debug
+    ~~~~~~~~~~~~~~
+    Defines the sink that debug images are written through, which
+    moves contrast stretching and disk writes off the reconstruction.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import os
+import atexit
+import queue
+import threading
+import warnings
+
+import numpy as np
+
+DEBUG_FORMATS = ("png", "npy")
+
+
+class DebugSink():
+    """Writes debug images into a directory. In the background, images
+    are queued and a writer thread renders and saves them, so saving
+    only costs a copy of the image on the calling thread.
+
+    :param output_dir: The directory debug images are saved in, defaults to "./debug_images"
+    :type output_dir: str, optional
+    :param format: "png" saves contrast stretched images and "npy" saves
+    the raw arrays, without rendering them, defaults to "png"
+    :type format: str, optional
+    :param background: If images are written by a background thread, defaults to True
+    :type background: bool, optional
+    :param max_pending: The most images waiting to be written before saving
+    blocks, defaults to 16
+    :type max_pending: int, optional
+    """
+
+    def __init__(self, output_dir="./debug_images", format="png", background=True, max_pending=16):
+        if format not in DEBUG_FORMATS:
+            raise ValueError("Unknown debug format: %s" % format)
+
+        self.output_dir = output_dir
+        self.format = format
+        self.background = background
+        self.errors = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def save(self, image_name, image, render=None, raw_render=False):
+        """Saves a debug image.
+
+        :param image_name: The name to store the image as. The extension
+        is replaced with .npy when saving raw arrays
+        :param image: An image
+        :param render: A function making the saved image from the image
+        (Eg: drawing on it), run on the writer thread. Skipped when saving
+        raw arrays, unless raw_render is set
+        :param raw_render: If render is also applied when saving raw arrays,
+        for renders making the data the image is named after (Eg: thresholding)
+        """
+
+        # Copying so the caller can keep changing its arrays
+        item = (image_name, np.array(image), render, raw_render)
+        if not self.background:
+            self._write(*item)
+            return
+
+        self._start()
+        self._queue.put(item)
+
+    def flush(self):
+        """Waits until every queued image has been written."""
+
+        if self._thread is not None:
+            self._queue.join()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pypenumbra-debug", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.errors.append(e)
+                warnings.warn("Unable to save debug image %s: %s" % (item[0], e))
+            finally:
+                self._queue.task_done()
+
+    def _write(self, image_name, image, render, raw_render):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.format == "npy":
+            if render is not None and raw_render:
+                image = render(image)
+            image_path = os.path.join(self.output_dir, os.path.splitext(image_name)[0] + ".npy")
+            np.save(image_path, image)
+            return
+
+        if render is not None:
+            image = render(image)
+
+        # Only imported once a PNG is written, as both are slow to import
+        from skimage import img_as_ubyte
+        from skimage.exposure import equalize_adapthist
+        from skimage.io import imsave
+
+        image_path = os.path.join(self.output_dir, image_name)
+        imsave(image_path, img_as_ubyte(equalize_adapthist(image)))
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """Gets the debug sink used by imgutil.save_debug_image, creating
+    the default sink on first use.
+
+    :returns: A DebugSink
+    """
+
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = DebugSink()
+        return _sink
+
+
+def configure(output_dir="./debug_images", format="png", background=True, max_pending=16):
+    """Replaces the debug sink used by imgutil.save_debug_image. Images
+    queued on the previous sink are written first.
+
+    :param output_dir: The directory debug images are saved in
+    :param format: "png" for contrast stretched images or "npy" for raw arrays
+    :param background: If images are written by a background thread
+    :param max_pending: The most images waiting to be written before saving blocks
+    :returns: The new DebugSink
+    """
+
+    global _sink
+    sink = DebugSink(output_dir=output_dir, format=format, background=background, max_pending=max_pending)
+    with _sink_lock:
+        previous, _sink = _sink, sink
+    if previous is not None:
+        previous.flush()
+
+    return sink
+
+
+def flush():
+    """Waits until every debug image queued on the current sink has been written."""
+
+    if _sink is not None:
+        _sink.flush()
+
+
+# The writer thread is a daemon, so queued images are written before exiting
+atexit.register(flush)
@@ -0,0 +1,386 @@
+"""
+    pypenumbra.fbp
+    ~~~~~~~~~~~~~~
+    Defines a reusable filtered backprojection operator that keeps its
+    filter and projection geometry between reconstructions.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import math
+
+import numpy as np
+from scipy import fft
+from scipy import sparse
+
+from .cache import LRUCache
+
+FILTER_NAMES = ("ramp", "shepp-logan", "cosine", "hamming", "hann", None)
+
+# Operators only depend on the sinogram geometry, so they are kept
+# between calls. The cap can be changed with operator_cache.resize().
+operator_cache = LRUCache(max_bytes=256 * 1024 * 1024)
+
+
+def fourier_filter(size, filter_name="ramp"):
+    """Constructs the frequency response of a filtered backprojection
+    filter. This follows skimage.transform.iradon, where the ramp filter
+    is computed from the Fourier transform of its spatial representation.
+
+    :param size: The size of the filter, must be even
+    :param filter_name: One of "ramp", "shepp-logan", "cosine", "hamming",
+    "hann" or None for no filtering
+    :returns: The filter as an array of length size
+    """
+
+    if filter_name not in FILTER_NAMES:
+        raise ValueError("Unknown filter: %s" % filter_name)
+
+    n = np.concatenate((np.arange(1, size / 2 + 1, 2, dtype=int),
+                        np.arange(size / 2 - 1, 0, -2, dtype=int)))
+    f = np.zeros(size)
+    f[0] = 0.25
+    f[1::2] = -1 / (np.pi * n) ** 2
+
+    response = 2 * np.real(np.fft.fft(f))
+    if filter_name == "shepp-logan":
+        # Starting from the first element avoids dividing by zero
+        omega = np.pi * np.fft.fftfreq(size)[1:]
+        response[1:] *= np.sin(omega) / omega
+    elif filter_name == "cosine":
+        freq = np.linspace(0, np.pi, size, endpoint=False)
+        response *= np.fft.fftshift(np.sin(freq))
+    elif filter_name == "hamming":
+        response *= np.fft.fftshift(np.hamming(size))
+    elif filter_name == "hann":
+        response *= np.fft.fftshift(np.hanning(size))
+    elif filter_name is None:
+        response[:] = 1
+
+    return response
+
+
+class FilteredBackprojection():
+    """A filtered backprojection operator for sinograms of a fixed height
+    and set of angles. The filter spectrum and the interpolation indices
+    of every angle can be computed once, as a sparse matrix, so applying
+    the operator to many sinograms only filters and sums. The matrix holds
+    two entries per pixel and angle and costs 10 to 20 reconstructions to
+    build, so until build_matrix is called every angle is interpolated in
+    turn instead, as skimage.transform.iradon does. Either way the output
+    matches skimage.transform.iradon with linear interpolation and circle=True.
+
+    :param projection_size: The height of the sinograms (rows per projection)
+    :type projection_size: int
+    :param theta: The projection angles in degrees, one per sinogram column
+    :type theta: numpy.ndarray
+    :param filter_name: The filter used in the frequency domain, defaults to "ramp"
+    :type filter_name: str, optional
+    :param dtype: The float type sinograms are filtered and backprojected in,
+    defaults to "float64"
+    :type dtype: str, optional
+    :param matrix: If the sparse matrix is built right away, defaults to True
+    :type matrix: bool, optional
+    """
+
+    def __init__(self, projection_size, theta, filter_name="ramp", dtype="float64", matrix=True):
+        theta = np.asarray(theta, dtype=np.float64)
+        self.projection_size = projection_size
+        self.output_size = projection_size
+        self.theta = theta
+        self.filter_name = filter_name
+        self.dtype = np.dtype(dtype)
+
+        # Padding the projections so the inscribed circle fits a square,
+        # then to a power of two (but no less than 64) for the FFT
+        self.diagonal = int(math.ceil(math.sqrt(2) * projection_size))
+        self.pad_before = self.diagonal // 2 - projection_size // 2
+        self.padded_size = max(64, int(2 ** math.ceil(math.log2(2 * self.diagonal))))
+        response = fourier_filter(self.padded_size, filter_name)
+        # Only the real part of the filtered projections is kept, which is
+        # the same as filtering with the even part of the filter. The even
+        # part is real and symmetric, so only half the spectrum is needed.
+        response = (response + np.roll(response[::-1], 1)) / 2
+        self.filter_spectrum = response[:self.padded_size // 2 + 1, np.newaxis].astype(self.dtype)
+
+        # Only pixels inside the inscribed circle are reconstructed
+        radius = self.output_size // 2
+        xpr, ypr = np.mgrid[:self.output_size, :self.output_size] - radius
+        self.circle_mask = (xpr ** 2 + ypr ** 2) <= radius ** 2
+        self.xpr = xpr[self.circle_mask]
+        self.ypr = ypr[self.circle_mask]
+        self.matrix = None
+        if matrix:
+            self.build_matrix()
+
+    def build_matrix(self):
+        """Builds the sparse backprojection matrix, if it isn't built yet.
+        Calling this while the operator is in use by other threads is safe,
+        they keep interpolating every angle until the matrix is set.
+        """
+
+        if self.matrix is not None:
+            return
+
+        # Detector position of every pixel for every angle, linearly
+        # interpolated between its two neighbouring detector bins.
+        # Positions outside the detector contribute nothing.
+        xpr, ypr, theta = self.xpr, self.ypr, self.theta
+        angles = np.deg2rad(theta)
+        t = np.outer(ypr, np.cos(angles)) - np.outer(xpr, np.sin(angles)) + self.diagonal // 2
+        low = np.floor(t)
+        low[low == self.diagonal - 1] -= 1
+        weights = t - low
+        inside = (t >= 0) & (t <= self.diagonal - 1)
+        column = (low + np.arange(len(theta)) * self.diagonal).astype(np.int32)
+
+        # Each row holds a pixel's entries in angle order, so the columns
+        # are already sorted and the CSR arrays can be built directly.
+        # Every position of the inscribed circle is usually inside the
+        # detector, and masking is only needed when one isn't.
+        data = np.empty(weights.shape + (2,), dtype=self.dtype)
+        data[..., 0] = 1 - weights
+        data[..., 1] = weights
+        indices = np.empty(column.shape + (2,), dtype=np.int32)
+        indices[..., 0] = column
+        indices[..., 1] = column + 1
+        if inside.all():
+            data = data.ravel()
+            indices = indices.ravel()
+        else:
+            data = data[inside].ravel()
+            indices = indices[inside].ravel()
+        indptr = np.zeros(len(xpr) + 1, dtype=np.int64)
+        np.cumsum(np.count_nonzero(inside, axis=1) * 2, out=indptr[1:])
+        self.matrix = sparse.csr_matrix((data, indices, indptr),
+                                        shape=(len(xpr), len(theta) * self.diagonal))
+
+    @property
+    def nbytes(self):
+        nbytes = self.filter_spectrum.nbytes + self.circle_mask.nbytes + self.xpr.nbytes + self.ypr.nbytes
+        if self.matrix is not None:
+            nbytes += self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+        return nbytes
+
+    def filter(self, sinogram):
+        """Pads a sinogram to the diagonal of the reconstruction and
+        applies the frequency domain filter to each projection.
+
+        :param sinogram: A sinogram with one projection per column
+        :returns: The filtered sinogram with the padded height
+        """
+
+        # scipy.fft keeps float32 input in single precision
+        padded = np.zeros((self.padded_size, sinogram.shape[1]), dtype=self.dtype)
+        padded[self.pad_before:self.pad_before + self.projection_size] = sinogram
+        spectrum = fft.rfft(padded, axis=0)
+        spectrum *= self.filter_spectrum
+        return fft.irfft(spectrum, n=self.padded_size, axis=0)[:self.diagonal]
+
+    def backproject(self, filtered):
+        """Backprojects filtered projections over the inscribed circle.
+
+        :param filtered: A filtered sinogram as returned by filter()
+        :returns: The reconstructed image
+        """
+
+        values = self.backproject_sum(filtered)
+
+        reconstructed = np.zeros((self.output_size, self.output_size), dtype=self.dtype)
+        reconstructed[self.circle_mask] = values * self.dtype.type(np.pi / (2 * len(self.theta)))
+        return reconstructed
+
+    def backproject_sum(self, filtered, indices=None):
+        """Sums the filtered projections of some angles at every pixel of
+        the inscribed circle, without scaling the sum by the angle count.
+
+        :param filtered: A filtered sinogram as returned by filter(), with
+        one column per angle of indices
+        :param indices: The indices of the angles of the filtered
+        projections, defaults to every angle
+        :returns: An array of sums, one per pixel of circle_mask
+        """
+
+        if indices is None and self.matrix is not None:
+            return self.matrix @ filtered.T.ravel()
+
+        # The same detector positions and weights as the matrix, one
+        # angle at a time. Summing in the matrix's order gives the same
+        # values as the matrix, to the last bit.
+        angles = np.deg2rad(self.theta if indices is None else self.theta[indices])
+        cos, sin = np.cos(angles), np.sin(angles)
+        values = np.zeros(len(self.xpr), dtype=self.dtype)
+        for i in range(len(angles)):
+            t = self.ypr * cos[i] - self.xpr * sin[i] + self.diagonal // 2
+            low = np.floor(t)
+            low[low == self.diagonal - 1] -= 1
+            weights = t - low
+            inside = (t >= 0) & (t <= self.diagonal - 1)
+            column = low.astype(np.intp)
+            np.clip(column, 0, self.diagonal - 2, out=column)
+            projection = filtered[:, i]
+            lower = (1 - weights).astype(self.dtype) * projection[column]
+            upper = weights.astype(self.dtype) * projection[column + 1]
+            if not inside.all():
+                lower[~inside] = 0
+                upper[~inside] = 0
+            values += lower
+            values += upper
+        return values
+
+    def __call__(self, sinogram):
+        """Reconstructs an image from a sinogram.
+
+        :param sinogram: A sinogram with one projection per column
+        :returns: The reconstructed image
+        """
+
+        if sinogram.shape != (self.projection_size, len(self.theta)):
+            raise ValueError("Sinogram shape %s does not match the operator shape %s"
+                             % (sinogram.shape, (self.projection_size, len(self.theta))))
+
+        return self.backproject(self.filter(sinogram))
+
+
+def operator_nbytes(projection_size, angle_count, dtype="float64"):
+    """Gets the most bytes a FilteredBackprojection operator with a
+    sparse matrix can hold, without building it.
+
+    :param projection_size: The height of the sinograms
+    :param angle_count: The number of projection angles
+    :param dtype: The float type sinograms are filtered and backprojected in
+    :returns: The number of bytes
+    """
+
+    radius = projection_size // 2
+    xpr, ypr = np.ogrid[-radius:projection_size - radius, -radius:projection_size - radius]
+    pixels = np.count_nonzero(xpr ** 2 + ypr ** 2 <= radius ** 2)
+    itemsize = np.dtype(dtype).itemsize
+    diagonal = int(math.ceil(math.sqrt(2) * projection_size))
+    padded_size = max(64, int(2 ** math.ceil(math.log2(2 * diagonal))))
+
+    # Two entries (a value and a column index) per pixel and angle, the
+    # row pointers, the pixel coordinates, the circle mask and the filter
+    return (2 * pixels * angle_count * (itemsize + 4) + (pixels + 1) * 8 + pixels * 16
+            + projection_size ** 2 + (padded_size // 2 + 1) * itemsize)
+
+
+def get_operator(projection_size, theta, filter_name="ramp", dtype="float64", cache=None, matrix=None):
+    """Gets the filtered backprojection operator for a sinogram geometry
+    from the operator cache, creating it on a cache miss. The operator's
+    sparse matrix is built the second time a geometry is asked for, once
+    building it pays off, and only if the operator fits in the cache with
+    it, as it would otherwise be rebuilt on every call.
+
+    :param projection_size: The height of the sinograms
+    :param theta: The projection angles in degrees
+    :param filter_name: The filter used in the frequency domain
+    :param dtype: The float type sinograms are filtered and backprojected in
+    :param cache: The LRUCache to use, defaults to operator_cache
+    :param matrix: True builds the sparse matrix on the first call (Eg: to
+    use the matrix directly), if it fits in the cache. False never builds
+    it on this call (Eg: to backproject subsets of the angles, which
+    don't use it), defaults to building it on the second call
+    :returns: A FilteredBackprojection operator
+    """
+
+    if cache is None:
+        cache = operator_cache
+
+    theta = np.asarray(theta, dtype=np.float64)
+    dtype = np.dtype(dtype).name
+    key = (int(projection_size), theta.tobytes(), filter_name, dtype)
+
+    fits = operator_nbytes(projection_size, len(theta), dtype) <= cache.max_bytes
+
+    operator = cache.get(key)
+    if operator is None:
+        operator = FilteredBackprojection(projection_size, theta, filter_name, dtype, matrix=bool(matrix) and fits)
+        cache.put(key, operator, operator.nbytes)
+    elif operator.matrix is None and fits and matrix is not False:
+        operator.build_matrix()
+        # Putting it again records the matrix's bytes
+        cache.put(key, operator, operator.nbytes)
+
+    return operator
+
+
+def progressive_subsets(angle_count, first_stride=16):
+    """Splits the indices of a sinogram's angles into subsets that each
+    double the angular sampling of the subsets before them: every
+    first_stride-th angle, then the angles halfway between those, and so
+    on until every angle is taken.
+
+    :param angle_count: The number of angles
+    :param first_stride: The spacing of the first subset's angles, defaults to 16
+    :returns: A list of index arrays, together holding every index once
+    """
+
+    if first_stride < 1:
+        raise ValueError("first_stride must be at least 1")
+
+    taken = np.zeros(angle_count, dtype=bool)
+    subsets = []
+    stride = int(first_stride)
+    while True:
+        indices = np.arange(0, angle_count, stride)
+        indices = indices[~taken[indices]]
+        taken[indices] = True
+        if len(indices):
+            subsets.append(indices)
+        if stride == 1:
+            return subsets
+        stride //= 2
+
+
+class ProgressiveBackprojection():
+    """Reconstructs an image from a sinogram in steps, backprojecting
+    subsets of its angles (Eg: those of progressive_subsets) into a
+    running sum. Every subset is backprojected one angle at a time by the
+    operator of every angle, which is shared through the operator cache
+    with get_operator, so repeated runs on a geometry build nothing, and
+    the steps together cost about as much as a reconstruction without the
+    sparse matrix. Once every angle is added, the image matches the image
+    of the full operator to floating point rounding.
+
+    :param sinogram: A sinogram with one projection per column
+    :type sinogram: numpy.ndarray
+    :param theta: The projection angles in degrees, one per sinogram column
+    :type theta: numpy.ndarray
+    :param filter_name: The filter used in the frequency domain, defaults to "ramp"
+    :type filter_name: str, optional
+    :param dtype: The float type the sinogram is filtered and backprojected in,
+    defaults to "float64"
+    :type dtype: str, optional
+    """
+
+    def __init__(self, sinogram, theta, filter_name="ramp", dtype="float64"):
+        self.theta = np.asarray(theta, dtype=np.float64)
+        if sinogram.shape[1] != len(self.theta):
+            raise ValueError("Sinogram has %d projections but %d angles were passed"
+                             % (sinogram.shape[1], len(self.theta)))
+
+        self.sinogram = sinogram
+        self.filter_name = filter_name
+        self.dtype = np.dtype(dtype)
+        self.angle_count = 0
+        self._values = None
+        # Subsets are backprojected without the sparse matrix, so getting
+        # the operator doesn't build it
+        self.operator = get_operator(sinogram.shape[0], self.theta, filter_name=filter_name, dtype=self.dtype,
+                                     matrix=False)
+
+    def add(self, indices):
+        """Backprojects the projections of some angles into the sum.
+
+        :param indices: The indices of angles not yet added
+        :returns: The image reconstructed from every angle added so far
+        """
+
+        operator = self.operator
+        values = operator.backproject_sum(operator.filter(self.sinogram[:, indices]), indices)
+        self._values = values if self._values is None else self._values + values
+        self.angle_count += len(indices)
+
+        reconstructed = np.zeros((operator.output_size, operator.output_size), dtype=self.dtype)
+        reconstructed[operator.circle_mask] = self._values * self.dtype.type(np.pi / (2 * self.angle_count))
+        return reconstructed
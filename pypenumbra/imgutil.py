@@ -5,27 +5,34 @@
     :copyright: 2019 Reece Walsh
     :license: MIT
 """
-import os
 import math
 
 import cv2
 import numpy as np
-from skimage import filters, img_as_ubyte
-from skimage.exposure import equalize_adapthist
-from skimage.io import imsave
+from skimage import filters
 
+from . import debug
 
-def save_debug_image(image_name, image):
-    """Saves an image into the debug_images directory
+
+# The smallest coarse area, relative to the largest, of the blobs that
+# detect_penumbra measures at full resolution
+COARSE_CANDIDATE_AREA = 0.5
+
+
+def save_debug_image(image_name, image, render=None, raw_render=False):
+    """Saves an image through the debug sink, into the debug_images
+    directory unless configured otherwise (see debug.configure)
 
     :param image_name: The name to store the image as, extension included
     :param image: An image
+    :param render: A function making the saved image from the image
+    (Eg: drawing on it), run on the sink's writer thread. Skipped when
+    the sink saves raw arrays, unless raw_render is set
+    :param raw_render: If render is also applied when the sink saves raw
+    arrays, for renders making the data the image is named after
     """
 
-    if not os.path.isdir("./debug_images"):
-        os.mkdir("./debug_images")
-    image_path = os.path.join("./debug_images", image_name)
-    imsave(image_path, img_as_ubyte(equalize_adapthist(image)))
+    debug.get_sink().save(image_name, image, render=render, raw_render=raw_render)
 
 
 def threshold(gray_image):
@@ -51,13 +58,22 @@ def get_center(threshold_image):
     :returns: The coordinates of the center and radius of the largest blob
     """
 
-    # Get rough min area of blob
-    # Penumbra must be at least 5% of the
-    # total image size to be detected
-    height = threshold_image.shape[0]
-    width = threshold_image.shape[1]
+    penumbra_contour, max_area = get_largest_contour(threshold_image)
+    if penumbra_contour is None:
+        return (0, 0, 0)
+
+    return contour_geometry(penumbra_contour)
+
 
-    # Getting contour with the largest area larger than the min blob area
+def get_largest_contour(threshold_image):
+    """Finds the blob with the largest area within an image.
+
+    :param threshold_image: An OpenCV image with thresholding applied
+    :returns: A tuple containing the contour of the largest blob, or None
+    if there are no blobs, and its area
+    """
+
+    # Getting contour with the largest area
     contours, hierarchy = cv2.findContours(threshold_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     penumbra_contour = None
     max_area = 0
@@ -67,23 +83,115 @@ def get_center(threshold_image):
             penumbra_contour = contour
             max_area = area
 
-    if penumbra_contour is None:
-        center_x = 0
-        center_y = 0
-        radius = 0
-    else:
-        # Getting the center x,y of the penumbra blob
-        M = cv2.moments(penumbra_contour)
-        center_x = int(M['m10']/M['m00'])
-        center_y = int(M['m01']/M['m00'])
-
-        # Getting radius of the penumbra blob
-        (circle_x, circle_y), radius = cv2.minEnclosingCircle(penumbra_contour)
-        radius = int(radius)
+    return penumbra_contour, max_area
+
+
+def get_centers(threshold_image, min_relative_area=0.1):
+    """Finds every blob within an image that is at least a fraction of
+    the area of the largest blob, returning the center x and y
+    coordinates and the radius of each. The largest blob is the one
+    get_center selects.
+
+    :param threshold_image: An OpenCV image with thresholding applied
+    :param min_relative_area: The smallest area of a blob as a fraction
+    of the largest blob's area, so noise isn't taken for a penumbra
+    :returns: A list of (center x, center y, radius) tuples, largest blob first
+    """
+
+    contours, hierarchy = cv2.findContours(threshold_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    areas = [cv2.contourArea(contour) for contour in contours]
+    if not areas or max(areas) <= 0:
+        return []
+
+    # A stable sort keeps the first of equally large blobs first, as get_center does
+    min_area = max(areas) * min_relative_area
+    order = sorted(range(len(contours)), key=lambda i: -areas[i])
+    return [contour_geometry(contours[i]) for i in order if areas[i] > 0 and areas[i] >= min_area]
+
+
+def contour_geometry(contour):
+    """Gets the center of mass and the radius of the enclosing circle of a contour.
+
+    :param contour: An OpenCV contour
+    :returns: The coordinates of the center and radius of the contour as integers
+    """
+
+    # Getting the center x,y of the penumbra blob
+    M = cv2.moments(contour)
+    center_x = int(M['m10']/M['m00'])
+    center_y = int(M['m01']/M['m00'])
+
+    # Getting radius of the penumbra blob
+    (circle_x, circle_y), radius = cv2.minEnclosingCircle(contour)
+    radius = int(radius)
 
     return (center_x, center_y, radius)
 
 
+def detect_penumbra(gray_image, downscale=None):
+    """Finds the center and radius of the largest blob in an image from
+    coarse to fine. The blob is first found on a downsampled copy of the
+    image, then thresholded and measured at full resolution only in a
+    window around the coarse circle. The result is the same as running
+    threshold and get_center on the full image, as long as the window
+    holds the blob's outline.
+
+    :param gray_image: An OpenCV grayscale image
+    :param downscale: How much the image is shrunk for the coarse pass,
+    defaults to shrinking the longest side to about 512 pixels
+    :returns: The coordinates of the center and radius of the largest blob
+    """
+
+    height, width = gray_image.shape
+    if downscale is None:
+        downscale = max(1, max(height, width) // 512)
+    if downscale == 1:
+        return get_center(threshold(gray_image))
+
+    # Taking every nth pixel is far cheaper than resampling the whole
+    # image, and the fixed threshold level doesn't need averaged values
+    coarse = np.ascontiguousarray(gray_image[::downscale, ::downscale])
+    # Blobs of about the same size can swap order when downsampled, so
+    # every blob close to the largest is measured at full resolution
+    candidates = get_centers(threshold(coarse), min_relative_area=COARSE_CANDIDATE_AREA)
+    if not candidates or candidates[0][2] < 1:
+        return get_center(threshold(gray_image))
+
+    best_area = 0
+    best = (0, 0, 0)
+    for center_x, center_y, radius in candidates:
+        # The window covers the coarse circle, the error of the coarse pass
+        # and the border the blur needs so the window edge can't change it
+        half_size = (radius + 2) * downscale + 8
+        center_x = center_x * downscale + downscale // 2
+        center_y = center_y * downscale + downscale // 2
+        top = max(center_y - half_size, 0)
+        bottom = min(center_y + half_size, height)
+        left = max(center_x - half_size, 0)
+        right = min(center_x + half_size, width)
+
+        contour, area = get_largest_contour(threshold(gray_image[top:bottom, left:right]))
+        if contour is not None and area > best_area:
+            center_x, center_y, radius = contour_geometry(contour)
+            best_area = area
+            best = (center_x + left, center_y + top, radius)
+
+    return best
+
+
+def detect_penumbras(gray_image, min_relative_area=0.1):
+    """Finds the center and radius of every penumbra blob in an image
+    with a single threshold and contour pass over the whole image.
+
+    :param gray_image: An OpenCV grayscale image
+    :param min_relative_area: The smallest area of a blob as a fraction
+    of the largest blob's area (see get_centers)
+    :returns: A list of (center x, center y, radius) tuples, largest blob first
+    """
+
+    return get_centers(threshold(gray_image), min_relative_area=min_relative_area)
+
+
 def pad_to_fit(radius, center_x, center_y, image):
     height, width = image.shape
     pad_amount = 0
@@ -109,6 +217,37 @@ def pad_to_fit(radius, center_x, center_y, image):
     return center_x + pad_amount, center_y + pad_amount, pad_image
 
 
+def crop_to_fit(radius, center_x, center_y, image):
+    """Crops the square region a circle of the given radius (plus one
+    pixel for interpolation) needs around its center. The crop is a view
+    of the image when the region lies inside it. Otherwise only the crop
+    is allocated, with zeros where the region crosses the image border.
+
+    :param radius: The radius of the circle
+    :param center_x: The x-coordinate of the center of the circle
+    :param center_y: The y-coordinate of the center of the circle
+    :param image: An image to crop
+    :returns: The x and y coordinates of the center in the crop, and the crop
+    """
+
+    height, width = image.shape
+    size = 2 * radius + 3
+    top = center_y - radius - 1
+    left = center_x - radius - 1
+
+    if top >= 0 and left >= 0 and top + size <= height and left + size <= width:
+        return radius + 1, radius + 1, image[top:top + size, left:left + size]
+
+    crop = np.zeros((size, size), dtype=image.dtype)
+    src_top, src_left = max(top, 0), max(left, 0)
+    src_bottom, src_right = min(top + size, height), min(left + size, width)
+    if src_top < src_bottom and src_left < src_right:
+        crop[src_top - top:src_bottom - top, src_left - left:src_right - left] = \
+            image[src_top:src_bottom, src_left:src_right]
+
+    return radius + 1, radius + 1, crop
+
+
 def get_line(x1, y1, x2, y2, image):
     """Gets a line of pixels from the center of an image outwards
     to a specified point. If a subpixel is specified during traversal to
@@ -167,8 +306,8 @@ def bilinear_interpolate(x, y, image):
 def apply_first_derivative(float_image):
     """Computes the first derivative of the image with the Prewitt filter.
 
-    :param float_image: A float64 format image
-    :returns: A float64 format image
+    :param float_image: A float64 or float32 format image
+    :returns: An image in the same float format
     """
 
     edges = filters.scharr(float_image)
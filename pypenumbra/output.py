@@ -0,0 +1,278 @@
+"""
+    pypenumbra.output
+    ~~~~~~~~~~~~~~
+    Defines how reconstructions are saved by the command line interface
+    and the watch service, and the background writer saving them.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import os
+import json
+import queue
+import threading
+
+OUTPUT_FORMATS = ("png", "npy", "tiff", "npz")
+
+# The endings of every file an output format may save, so outputs
+# saved next to inputs are never taken as inputs
+OUTPUT_SUFFIXES = tuple("_%s.%s" % (name, output_format) for name in ("focal_spot", "sinogram")
+                        for output_format in OUTPUT_FORMATS if output_format != "npz") + ("_preview.png", ".npz")
+
+# The libtiff codes of no compression and of (Adobe) deflate, which
+# libtiff prefers over the legacy deflate code
+_TIFF_COMPRESSION_NONE = 1
+_TIFF_COMPRESSION_DEFLATE = 8
+
+
+def check_output_options(output_format, compress=False, float_dtype="float64"):
+    """Checks that results of a float type can be saved in an output
+    format. OpenCV writes float64 TIFFs uncompressed whatever the
+    compression asked for, so compressed TIFFs need float32 results.
+
+    :param output_format: One of OUTPUT_FORMATS
+    :param compress: If TIFF and NPZ outputs are compressed, defaults to False
+    :param float_dtype: The float type of the results, defaults to "float64"
+    """
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format: %s" % output_format)
+    if output_format == "tiff" and compress and str(float_dtype) == "float64":
+        raise ValueError("float64 TIFFs can't be compressed, use the npz output format or float32 results")
+
+
+def get_output_paths(focal_spot_stem, sinogram_stem, bundle_stem, output_format="png", preview=False):
+    """Gets the paths the outputs of a reconstruction are saved at.
+
+    :param focal_spot_stem: The focal spot path, without an extension
+    :param sinogram_stem: The sinogram path, without an extension
+    :param bundle_stem: The NPZ bundle path, without an extension
+    :param output_format: One of OUTPUT_FORMATS
+    :param preview: If PNG previews are saved alongside raw outputs
+    :returns: A tuple of paths, starting with the NPZ bundle path or the
+    focal spot and sinogram paths, followed by the focal spot and
+    sinogram preview paths if previews are saved
+    """
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format: %s" % output_format)
+
+    if output_format == "npz":
+        paths = (bundle_stem + ".npz",)
+    else:
+        paths = (focal_spot_stem + "." + output_format, sinogram_stem + "." + output_format)
+    if preview and output_format != "png":
+        paths += (focal_spot_stem + "_preview.png", sinogram_stem + "_preview.png")
+
+    return paths
+
+
+def save_reconstruction(focal_spot, sinogram, paths, output_format="png", metadata=None, compress=False):
+    """Saves a focal spot and sinogram. PNGs are contrast stretched,
+    while NPY, TIFF and NPZ outputs keep the float images. NPZ bundles
+    also hold the (center x, center y, radius) of the penumbra as
+    "geometry" and the metadata as a JSON string. Each file is written
+    atomically (see write_atomic).
+
+    :param focal_spot: The focal spot image
+    :param sinogram: The sinogram image
+    :param paths: The paths returned by get_output_paths
+    :param output_format: One of OUTPUT_FORMATS, defaults to "png"
+    :param metadata: The metadata recorded by the reconstruction (see api.reconstruct)
+    :param compress: Compresses NPZ outputs and float32 TIFF outputs (with
+    deflate, see check_output_options), defaults to False
+    """
+
+    import numpy as np
+
+    check_output_options(output_format, compress, np.result_type(focal_spot, sinogram))
+
+    for path in paths:
+        os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+
+    if output_format == "npz":
+        metadata = metadata or {}
+        geometry = [metadata.get(name, -1) for name in ("center_x", "center_y", "radius")]
+        save = np.savez_compressed if compress else np.savez
+        write_atomic(paths[0], lambda path: save(path, focal_spot=focal_spot, sinogram=sinogram,
+                                                 geometry=np.asarray(geometry, dtype="int64"),
+                                                 metadata=np.array(json.dumps(metadata))))
+        previews = paths[1:]
+    elif output_format == "npy":
+        write_atomic(paths[0], lambda path: np.save(path, focal_spot))
+        write_atomic(paths[1], lambda path: np.save(path, sinogram))
+        previews = paths[2:]
+    elif output_format == "tiff":
+        write_atomic(paths[0], lambda path: _write_tiff(path, focal_spot, compress))
+        write_atomic(paths[1], lambda path: _write_tiff(path, sinogram, compress))
+        previews = paths[2:]
+    else:
+        previews = paths
+
+    if previews:
+        from skimage import io, img_as_ubyte
+        from skimage.exposure import equalize_adapthist
+
+        focal_spot = img_as_ubyte(equalize_adapthist(focal_spot))
+        sinogram = img_as_ubyte(equalize_adapthist(sinogram))
+        write_atomic(previews[0], lambda path: io.imsave(path, focal_spot))
+        write_atomic(previews[1], lambda path: io.imsave(path, sinogram))
+
+
+class OutputWriter():
+    """Saves reconstructions on a background thread, so writing one
+    plate's outputs overlaps with reconstructing the next. Errors are
+    kept instead of raised.
+
+    With a store, results are appended to it instead of saved as files,
+    and the paths passed to write are the plate IDs.
+
+    :param output_format: One of OUTPUT_FORMATS, defaults to "png"
+    :type output_format: str, optional
+    :param compress: Compresses NPZ outputs and float32 TIFF outputs, defaults to False
+    :type compress: bool, optional
+    :param max_pending: The most reconstructions waiting to be written
+    before write blocks, defaults to 4
+    :type max_pending: int, optional
+    :param store: A store.ResultStore results are appended to, defaults to None
+    :type store: store.ResultStore, optional
+    """
+
+    def __init__(self, output_format="png", compress=False, max_pending=4, store=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unknown output format: %s" % output_format)
+
+        self.output_format = output_format
+        self.compress = compress
+        self.store = store
+        self.errors = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+
+    def write(self, label, focal_spot, sinogram, paths, metadata=None, callback=None):
+        """Queues a reconstruction to be saved.
+
+        :param label: A name the reconstruction's errors are recorded under
+        (Eg: its input path)
+        :param focal_spot: The focal spot image
+        :param sinogram: The sinogram image
+        :param paths: The paths returned by get_output_paths, or the plate ID
+        when appending to a store
+        :param metadata: The metadata recorded by the reconstruction
+        :param callback: A function called with the label and the error, or
+        None, once the reconstruction is saved. Called on the writer thread
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="pypenumbra-writer", daemon=True)
+            self._thread.start()
+        self._queue.put((label, focal_spot, sinogram, paths, metadata, callback))
+
+    def flush(self):
+        """Waits until every queued reconstruction has been saved."""
+
+        if self._thread is not None:
+            self._queue.join()
+
+    def save(self, focal_spot, sinogram, paths, metadata=None):
+        """Saves a reconstruction on the calling thread, raising any error.
+
+        :param focal_spot: The focal spot image
+        :param sinogram: The sinogram image
+        :param paths: The paths returned by get_output_paths, or the plate ID
+        when appending to a store
+        :param metadata: The metadata recorded by the reconstruction
+        """
+
+        if self.store is not None:
+            self.store.append(paths, focal_spot, sinogram, metadata=metadata)
+        else:
+            save_reconstruction(focal_spot, sinogram, paths, output_format=self.output_format,
+                                metadata=metadata, compress=self.compress)
+
+    def _run(self):
+        while True:
+            label, focal_spot, sinogram, paths, metadata, callback = self._queue.get()
+            error = None
+            try:
+                self.save(focal_spot, sinogram, paths, metadata=metadata)
+            except Exception as e:
+                error = e
+                self.errors.append((label, e))
+            finally:
+                self._queue.task_done()
+            if callback is not None:
+                callback(label, error)
+
+
+def write_atomic(path, write):
+    """Writes a file through a temporary file in the same directory
+    that is then renamed over the path, so the file is never seen
+    partially written. The temporary file keeps the path's extension.
+
+    :param path: The path to write
+    :param write: A function writing the file to the path it is passed
+    """
+
+    directory, name = os.path.split(path)
+    stem, extension = os.path.splitext(name)
+    temp_path = os.path.join(directory, ".%s.%d.tmp%s" % (stem, os.getpid(), extension))
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def is_up_to_date(input_path, output_paths):
+    """Checks if every output file exists and is newer than the input file.
+
+    :param input_path: The path to the input file
+    :param output_paths: The paths to the output files
+    :returns: True if no output needs to be regenerated
+    """
+
+    input_mtime = os.path.getmtime(input_path)
+    for output_path in output_paths:
+        if not os.path.isfile(output_path) or os.path.getmtime(output_path) < input_mtime:
+            return False
+
+    return True
+
+
+def reconstruct_input(input_path, binary_options=None):
+    """Reconstructs an input file without saving it, so a batch or
+    watch worker can hand the result to an OutputWriter in the parent
+    process while reconstructing the next file.
+
+    :param input_path: The path to a penumbra image or raw binary image
+    :param binary_options: The (width, height, dtype) of a raw binary image,
+    or None for an image, defaults to None
+    :returns: A tuple containing the input path and either the focal spot,
+    sinogram and metadata, or the exception raised while reconstructing
+    """
+
+    from .api import reconstruct_from_image, reconstruct_from_cr_data
+
+    metadata = {"source": input_path}
+    try:
+        if binary_options is None:
+            focal_spot, sinogram = reconstruct_from_image(input_path, metadata=metadata)
+        else:
+            width, height, dtype = binary_options
+            focal_spot, sinogram = reconstruct_from_cr_data(input_path, width, height, dtype=dtype,
+                                                            metadata=metadata)
+    except Exception as e:
+        return input_path, e
+
+    return input_path, (focal_spot, sinogram, metadata)
+
+
+def _write_tiff(path, image, compress):
+    import cv2
+
+    # Deflate is fast to write and lossless for float images. The libtiff
+    # codes are passed as is, as OpenCV only names them in recent releases
+    compression = _TIFF_COMPRESSION_DEFLATE if compress else _TIFF_COMPRESSION_NONE
+    if not cv2.imwrite(path, image, [cv2.IMWRITE_TIFF_COMPRESSION, compression]):
+        raise OSError("Unable to write %s" % path)
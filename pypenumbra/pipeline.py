@@ -0,0 +1,305 @@
+"""
+    pypenumbra.pipeline
+    ~~~~~~~~~~~~~~
+    Defines a staged pipeline executor that overlaps loading, reconstructing
+    and writing plates on threads joined by bounded queues.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import os
+import queue
+import threading
+import time
+
+# Passed down the queues once every item has been put
+_DONE = object()
+
+
+class Stage():
+    """A step of a StagedPipeline.
+
+    :param name: The name the stage's statistics are reported under
+    :type name: str
+    :param function: A function taking the previous stage's output (or
+    the input item, for the first stage) and returning this stage's output
+    :type function: callable
+    :param workers: The number of threads running the stage, defaults to 1
+    :type workers: int, optional
+    """
+
+    def __init__(self, name, function, workers=1):
+        if workers < 1:
+            raise ValueError("A stage needs at least 1 worker")
+
+        self.name = name
+        self.function = function
+        self.workers = workers
+
+
+class StagedPipeline():
+    """Runs items through a sequence of stages, each on its own threads,
+    with a bounded queue in front of every stage. While one item is in
+    a stage, the next item can be in the stage before it, so with
+    stages that release the GIL (Eg: image decoding, OpenCV and NumPy)
+    the stages run at the same time. A full queue blocks the stage
+    feeding it, so at most max_queue items wait between two stages.
+
+    An exception raised by a stage becomes the item's result, with the
+    stage's name set as its "stage" attribute, and the later stages are
+    skipped for it. With one worker per stage, results come out in the
+    order items went in.
+
+    :param stages: The stages, in order
+    :type stages: list
+    :param max_queue: The most items waiting in front of a stage, defaults to 2
+    :type max_queue: int, optional
+    """
+
+    def __init__(self, stages, max_queue=2):
+        if not stages:
+            raise ValueError("A pipeline needs at least 1 stage")
+        if max_queue < 1:
+            raise ValueError("max_queue must be at least 1")
+
+        self.stages = list(stages)
+        self.max_queue = max_queue
+        self._stats = [_StageStats(stage) for stage in self.stages]
+        self._running = False
+
+    def run(self, items):
+        """Runs items through the pipeline. Closing the generator early
+        stops feeding items and waits for the items already fed.
+
+        :param items: An iterable of input items
+        :returns: A generator of (item, result) tuples, where the result is
+        the last stage's output or the exception raised by a stage
+        """
+
+        if self._running:
+            raise RuntimeError("The pipeline is already running")
+        self._running = True
+
+        queues = [queue.Queue(maxsize=self.max_queue) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], stop), name="pypenumbra-feed",
+                                    daemon=True)]
+        for i, stage in enumerate(self.stages):
+            finished = [0]
+            lock = threading.Lock()
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(target=self._work,
+                                                args=(i, queues[i], queues[i + 1], finished, lock),
+                                                name="pypenumbra-%s-%d" % (stage.name, worker), daemon=True))
+
+        for thread in threads:
+            thread.start()
+        done = False
+        try:
+            while True:
+                entry = queues[-1].get()
+                if entry is _DONE:
+                    done = True
+                    break
+                yield entry
+        finally:
+            if not done:
+                # Draining the results of the items already fed, so no
+                # stage stays blocked on a full queue
+                stop.set()
+                while queues[-1].get() is not _DONE:
+                    pass
+            for thread in threads:
+                thread.join()
+            self._running = False
+
+    def stats(self):
+        """Gets the statistics of every stage. For each stage, "processed"
+        and "failed" count items, "busy_seconds" is the time spent running
+        the stage, "starved_seconds" the time its workers waited for input,
+        "blocked_seconds" the time they waited on a full output queue, and
+        the queue depths are those of the queue in front of the stage, as
+        seen each time a worker takes an item.
+
+        :returns: A dictionary of statistics dictionaries, by stage name
+        """
+
+        return {stats.name: stats.as_dict() for stats in self._stats}
+
+    def _feed(self, items, output, stop):
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                output.put((item, item))
+        finally:
+            output.put(_DONE)
+
+    def _work(self, index, input, output, finished, lock):
+        stage = self.stages[index]
+        stats = self._stats[index]
+        while True:
+            depth = input.qsize()
+            start = time.perf_counter()
+            entry = input.get()
+            got = time.perf_counter()
+            if entry is _DONE:
+                # Passing the end on to the stage's other workers, and to
+                # the next stage once every worker is done
+                input.put(_DONE)
+                with lock:
+                    finished[0] += 1
+                    last = finished[0] == stage.workers
+                if last:
+                    output.put(_DONE)
+                return
+
+            item, value = entry
+            failed = False
+            if not isinstance(value, Exception):
+                try:
+                    value = stage.function(value)
+                except Exception as e:
+                    e.stage = stage.name
+                    value = e
+                    failed = True
+            done = time.perf_counter()
+            output.put((item, value))
+            stats.record(depth, got - start, done - got, time.perf_counter() - done, failed)
+
+
+class _StageStats():
+
+    def __init__(self, stage):
+        self.name = stage.name
+        self.workers = stage.workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._lock = threading.Lock()
+
+    def record(self, depth, starved, busy, blocked, failed):
+        with self._lock:
+            self.processed += 1
+            self.failed += failed
+            self.starved_seconds += starved
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self._depth_total += depth
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "failed": self.failed,
+                "busy_seconds": self.busy_seconds,
+                "starved_seconds": self.starved_seconds,
+                "blocked_seconds": self.blocked_seconds,
+                "mean_queue_depth": self._depth_total / self.processed if self.processed else None,
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+
+class PlatePipeline(StagedPipeline):
+    """Reconstructs penumbra image files on a StagedPipeline with a
+    "load" stage decoding the next plates, a "reconstruct" stage and,
+    when a write function is given, a "write" stage saving the last
+    plates, all in the calling process.
+
+    Results are (focal spot, sinogram, metadata) tuples, with the
+    metadata recorded by api.reconstruct and the input path as "source".
+
+    :param write: A function called with the input path, focal spot,
+    sinogram and metadata of each plate, defaults to None
+    :type write: callable, optional
+    :param angular_steps: The number of radial slices taken of each penumbra, defaults to 360
+    :type angular_steps: int, optional
+    :param method: The reconstruction method (see api.reconstruct), defaults to "fbp"
+    :type method: str, optional
+    :param float_dtype: The float type images are processed in, defaults to "float64"
+    :type float_dtype: str, optional
+    :param binary_options: The (width, height, dtype) of raw binary inputs, or
+    None for image inputs, defaults to None
+    :type binary_options: tuple, optional
+    :param kvp: The kVp of binary inputs (see crdata.map_cr_values), defaults to 70
+    :type kvp: int, optional
+    :param compute_workers: The number of reconstruct threads, defaults to 1
+    :type compute_workers: int, optional
+    :param max_queue: The most plates waiting in front of a stage, defaults to 2
+    :type max_queue: int, optional
+    """
+
+    def __init__(self, write=None, angular_steps=360, method="fbp", float_dtype="float64", binary_options=None,
+                 kvp=70, compute_workers=1, max_queue=2):
+        from .api import FLOAT_DTYPES
+
+        if float_dtype not in FLOAT_DTYPES:
+            raise ValueError("Unknown float type: %s" % float_dtype)
+
+        self.write = write
+        self.angular_steps = angular_steps
+        self.method = method
+        self.float_dtype = float_dtype
+        self.binary_options = binary_options
+        self.kvp = kvp
+
+        stages = [Stage("load", self._load), Stage("reconstruct", self._reconstruct, workers=compute_workers)]
+        if write is not None:
+            stages.append(Stage("write", self._write))
+        super().__init__(stages, max_queue=max_queue)
+
+    def _load(self, input_path):
+        from skimage import img_as_ubyte
+        from .api import as_float
+
+        offset = None
+        if self.binary_options is None:
+            from skimage import io
+
+            image = io.imread(input_path, as_gray=True)
+        else:
+            from .crdata import read_cr_roi
+
+            width, height, dtype = self.binary_options
+            image, offset = read_cr_roi(input_path, width, height, dtype=dtype, kvp=self.kvp,
+                                        float_dtype=self.float_dtype)
+        return input_path, as_float(image, self.float_dtype), img_as_ubyte(image), offset
+
+    def _reconstruct(self, loaded):
+        from .api import offset_metadata, reconstruct
+
+        input_path, float_image, ubyte_image, offset = loaded
+        metadata = {"source": os.fspath(input_path)}
+        focal_spot, sinogram = reconstruct(float_image, ubyte_image, angular_steps=self.angular_steps,
+                                           method=self.method, metadata=metadata)
+        if offset is not None:
+            offset_metadata(metadata, offset)
+        return input_path, (focal_spot, sinogram, metadata)
+
+    def _write(self, reconstructed):
+        input_path, result = reconstructed
+        self.write(input_path, *result)
+        return reconstructed
+
+    def run(self, input_paths):
+        """Reconstructs plates. Every result should be consumed.
+
+        :param input_paths: An iterable of penumbra image paths
+        :returns: A generator of (input path, result) tuples, where the
+        result is the focal spot, sinogram and metadata, or the exception
+        raised while loading, reconstructing or writing the plate
+        """
+
+        results = super().run(input_paths)
+        try:
+            for input_path, result in results:
+                if not isinstance(result, Exception):
+                    result = result[1]
+                yield input_path, result
+        finally:
+            results.close()
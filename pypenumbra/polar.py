@@ -0,0 +1,171 @@
+"""
+    pypenumbra.polar
+    ~~~~~~~~~~~~~~
+    Defines the vectorized polar resampling used to slice
+    a penumbra blob into a sinogram.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import math
+
+import numpy as np
+
+from .cache import LRUCache
+
+INTERPOLATION_MODES = ("bilinear", "nearest")
+
+# Sampling grids only depend on the blob geometry, so they are kept
+# between calls. The cap can be changed with grid_cache.resize().
+grid_cache = LRUCache(max_bytes=64 * 1024 * 1024)
+
+
+class PolarGrid():
+    """The precomputed sampling pattern for slicing a blob of a given
+    radius into a given number of slices. Offsets are stored relative to
+    the blob center so one grid serves every blob with the same geometry.
+
+    :param radius: The radius of the penumbra blob (can include padding)
+    :type radius: int
+    :param angular_steps: How many slices to slice the blob into
+    :type angular_steps: int
+    :param interpolation: The interpolation mode, either "bilinear" or "nearest"
+    :type interpolation: str
+    :param dtype: The float type of the interpolation weights, defaults to "float64"
+    :type dtype: str
+    """
+
+    def __init__(self, radius, angular_steps, interpolation="bilinear", dtype="float64"):
+        if interpolation not in INTERPOLATION_MODES:
+            raise ValueError("Unknown interpolation mode: %s" % interpolation)
+
+        self.radius = radius
+        self.angular_steps = angular_steps
+        self.interpolation = interpolation
+        self.dtype = np.dtype(dtype)
+
+        rows, cols = polar_grid(0, 0, radius, angular_steps)
+        if interpolation == "nearest":
+            self.row_offsets = np.rint(rows).astype(np.int32)
+            self.col_offsets = np.rint(cols).astype(np.int32)
+            self.weights = None
+        else:
+            row_low = np.floor(rows)
+            col_low = np.floor(cols)
+            row_weight = rows - row_low
+            col_weight = cols - col_low
+            self.row_offsets = row_low.astype(np.int32)
+            self.col_offsets = col_low.astype(np.int32)
+            # Interpolating along the rows then the columns, in the same
+            # order as imgutil.bilinear_interpolate, keeps values within
+            # the image range
+            self.weights = np.stack((1 - row_weight, row_weight, 1 - col_weight, col_weight)).astype(self.dtype)
+
+    @property
+    def nbytes(self):
+        nbytes = self.row_offsets.nbytes + self.col_offsets.nbytes
+        if self.weights is not None:
+            nbytes += self.weights.nbytes
+        return nbytes
+
+    def sample(self, center_x, center_y, float_image):
+        """Samples every slice of a blob centered at the given coordinates.
+
+        :param center_x: The x-coordinate of the center of the penumbra blob
+        :param center_y: The y-coordinate of the center of the penumbra blob
+        :param float_image: A float image used to source the slices from
+        :returns: An array of shape (angular_steps, radius) with one slice per row
+        """
+
+        width, flat_image = _flat_rows(float_image)
+        index = (self.row_offsets + center_y) * width + (self.col_offsets + center_x)
+
+        if self.weights is None:
+            return flat_image[index]
+
+        upper_left = flat_image[index]
+        upper_right = flat_image[index + width]
+        lower_left = flat_image[index + 1]
+        lower_right = flat_image[index + width + 1]
+
+        upper_average = self.weights[0] * upper_left + self.weights[1] * upper_right
+        lower_average = self.weights[0] * lower_left + self.weights[1] * lower_right
+
+        return self.weights[2] * upper_average + self.weights[3] * lower_average
+
+
+def _flat_rows(image):
+    """Gets a flat view of an image's memory where pixel (row, col) is at
+    row * width + col. Row-sliced views of a larger image, such as a crop,
+    are viewed in place rather than copied.
+    """
+
+    rows, cols = image.shape
+    itemsize = image.itemsize
+    if image.strides[1] != itemsize or image.strides[0] % itemsize != 0 or image.strides[0] < 0:
+        image = np.ascontiguousarray(image)
+    width = image.strides[0] // itemsize
+    flat_image = np.lib.stride_tricks.as_strided(
+        image, shape=((rows - 1) * width + cols,), strides=(itemsize,), writeable=False)
+
+    return width, flat_image
+
+
+def get_polar_grid(radius, angular_steps, interpolation="bilinear", dtype="float64"):
+    """Gets the sampling grid for a blob geometry from the grid cache,
+    building it on a cache miss.
+
+    :param radius: The radius of the penumbra blob (can include padding)
+    :param angular_steps: How many slices to slice the blob into
+    :param interpolation: The interpolation mode, either "bilinear" or "nearest"
+    :param dtype: The float type of the interpolation weights
+    :returns: A PolarGrid
+    """
+
+    key = (int(radius), int(angular_steps), interpolation, np.dtype(dtype).name)
+
+    return grid_cache.get_or_create(key, lambda: PolarGrid(*key))
+
+
+def polar_grid(center_x, center_y, radius, angular_steps):
+    """Builds the (angle x radius) grid of sampling coordinates used to
+    slice a penumbra blob. Each row of the grid follows the same path
+    that imgutil.get_line takes from the center outwards for that angle.
+
+    :param center_x: The x-coordinate of the center of the penumbra blob
+    :param center_y: The y-coordinate of the center of the penumbra blob
+    :param radius: The radius of the penumbra blob (can include padding)
+    :param angular_steps: How many slices to slice the blob into
+    :returns: A tuple of row and column coordinate arrays, each of
+    shape (angular_steps, radius)
+    """
+
+    rads_per_slice = (math.pi/180.0) * (360.0/angular_steps)
+    angles = np.arange(angular_steps) * rads_per_slice
+    steps = np.arange(radius)
+
+    # get_line walks the image rows by the x increment and the image
+    # columns by the y increment, so the grid does the same.
+    rows = center_y + np.outer(np.cos(angles), steps)
+    cols = center_x + np.outer(-np.sin(angles), steps)
+
+    return rows, cols
+
+
+def sample_polar(center_x, center_y, radius, angular_steps, float_image, interpolation="bilinear"):
+    """Samples every radial slice of a penumbra blob at once, reusing
+    a cached sampling grid when the blob geometry has been seen before.
+
+    :param center_x: The x-coordinate of the center of the penumbra blob
+    :param center_y: The y-coordinate of the center of the penumbra blob
+    :param radius: The radius of the penumbra blob (can include padding)
+    :param angular_steps: How many slices to slice the blob into
+    :param float_image: A float image used to source the slices from. Slices
+    are sampled in the image's float type
+    :param interpolation: The interpolation mode, either "bilinear" or "nearest"
+    :returns: An array of shape (angular_steps, radius) with one slice per row
+    """
+
+    dtype = float_image.dtype if float_image.dtype == np.float32 else np.float64
+    grid = get_polar_grid(radius, angular_steps, interpolation, dtype)
+
+    return grid.sample(int(center_x), int(center_y), float_image)
@@ -0,0 +1,163 @@
+"""
+    pypenumbra.profiling
+    ~~~~~~~~~~~~~~
+    Defines the per-stage timing of the reconstruction pipeline, recorded
+    into a Timings object passed to a reconstruction and/or reported to
+    registered hooks.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import threading
+import time
+import tracemalloc
+
+# The stages of a reconstruction, in the order they are run
+STAGES = ("load", "detect", "crop", "slice", "bounds", "derivative", "reconstruct")
+
+_hooks = []
+
+# The stages being measured while tracemalloc is tracing. The traced
+# peak is shared by the whole process, so the bytes of stages that
+# overlap (Eg: reconstructions on several threads) aren't measured
+_measuring = set()
+_measuring_lock = threading.Lock()
+
+
+class Timings():
+    """The wall time and allocated bytes of each stage of one
+    reconstruction. Allocated bytes are only recorded while tracemalloc
+    is tracing and no other stage runs at the same time on another
+    thread, and are None otherwise. Allocations made by other threads
+    outside of any stage are counted in the bytes of the running stage.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage_name, seconds, nbytes=None):
+        """Records a stage.
+
+        :param stage_name: The name of the stage
+        :param seconds: The wall time of the stage in seconds
+        :param nbytes: The peak bytes allocated during the stage
+        """
+
+        self.stages.append((stage_name, seconds, nbytes))
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for stage_name, seconds, nbytes in self.stages)
+
+    def as_dict(self):
+        """Gets the recorded stages, summing stages run more than once.
+
+        :returns: A dictionary mapping each stage name to a dictionary
+        with its "seconds" and "bytes"
+        """
+
+        stages = {}
+        for stage_name, seconds, nbytes in self.stages:
+            stage = stages.setdefault(stage_name, {"seconds": 0.0, "bytes": None})
+            stage["seconds"] += seconds
+            if nbytes is not None:
+                stage["bytes"] = max(stage["bytes"] or 0, nbytes)
+
+        return stages
+
+    def __repr__(self):
+        return "Timings(%s)" % ", ".join("%s=%.2fms" % (stage_name, seconds * 1000)
+                                         for stage_name, seconds, nbytes in self.stages)
+
+
+def add_hook(hook):
+    """Registers a function called after every stage of every
+    reconstruction with the stage name, its wall time in seconds and
+    its allocated bytes (or None when tracemalloc is not tracing, or when
+    the stage overlapped another stage on another thread).
+
+    :param hook: A function taking (stage_name, seconds, nbytes)
+    """
+
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Unregisters a function added with add_hook.
+
+    :param hook: A registered hook
+    """
+
+    _hooks.remove(hook)
+
+
+class _Stage():
+
+    __slots__ = ("stage_name", "timings", "start", "start_bytes", "overlapped")
+
+    def __init__(self, stage_name, timings):
+        self.stage_name = stage_name
+        self.timings = timings
+        self.overlapped = False
+
+    def __enter__(self):
+        self.start_bytes = None
+        if tracemalloc.is_tracing():
+            with _measuring_lock:
+                if _measuring:
+                    # Neither this stage nor the running ones can tell
+                    # their allocations apart anymore
+                    self.overlapped = True
+                    for other in _measuring:
+                        other.overlapped = True
+                elif hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+                _measuring.add(self)
+            self.start_bytes = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        nbytes = None
+        if self.start_bytes is not None:
+            with _measuring_lock:
+                _measuring.discard(self)
+                overlapped = self.overlapped
+            if not overlapped and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                # Without reset_peak the peak can be from an earlier stage
+                nbytes = max((peak if hasattr(tracemalloc, "reset_peak") else current) - self.start_bytes, 0)
+
+        if self.timings is not None:
+            self.timings.add(self.stage_name, seconds, nbytes)
+        for hook in list(_hooks):
+            hook(self.stage_name, seconds, nbytes)
+
+
+class _NoStage():
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(stage_name, timings=None):
+    """Times a stage of a reconstruction in a with block. When there is
+    no Timings object and no hook registered, nothing is measured.
+
+    :param stage_name: The name of the stage
+    :param timings: A Timings object to record the stage in, defaults to None
+    :returns: A context manager
+    """
+
+    if timings is None and not _hooks:
+        return _NO_STAGE
+
+    return _Stage(stage_name, timings)
@@ -0,0 +1,193 @@
+"""
+    pypenumbra.resultcache
+    ~~~~~~~~~~~~~~
+    Defines an on-disk cache of reconstruction results, addressed by a
+    hash of the input pixels and the reconstruction parameters.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from . import __version__
+
+# Bumped whenever the stored results or their key change
+CACHE_FORMAT = 2
+
+
+class ResultCache():
+    """Caches the focal spot, sinogram, penumbra geometry and metadata
+    of reconstructions as .npz files in a directory. Entries are named by
+    the SHA-256 of the input pixels, the reconstruction parameters and
+    the pypenumbra version, so changed inputs or parameters never read
+    a stale result. When the directory grows past max_bytes, the least
+    recently used entries are removed. Several processes may share a
+    directory.
+
+    :param cache_dir: The directory results are stored in
+    :type cache_dir: str
+    :param max_bytes: The largest number of bytes the directory may hold, defaults to 1GB
+    :type max_bytes: int, optional
+    """
+
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._current_bytes = None
+        self._lock = threading.Lock()
+
+    def key(self, pixels, **params):
+        """Gets the key of a reconstruction.
+
+        :param pixels: The input pixels (Eg: the decoded image or the raw data)
+        :param params: Every parameter the reconstruction depends on
+        :returns: A hex digest
+        """
+
+        pixels = np.ascontiguousarray(pixels)
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"format": CACHE_FORMAT, "version": __version__, "dtype": pixels.dtype.str,
+                                  "shape": pixels.shape, "params": params}, sort_keys=True).encode("utf-8"))
+        digest.update(memoryview(pixels).cast("B"))
+        return digest.hexdigest()
+
+    def path(self, key):
+        """Gets the path an entry is stored at.
+
+        :param key: A key returned by key()
+        :returns: A path in the cache directory
+        """
+
+        # Spreading entries over sub-directories keeps directories small
+        return os.path.join(self.cache_dir, key[:2], key + ".npz")
+
+    def get(self, key):
+        """Gets a cached result and marks it as recently used.
+
+        :param key: A key returned by key()
+        :returns: A tuple containing the focal spot, the sinogram, the
+        (center x, center y, radius) of the penumbra and the metadata
+        dictionary, or None if the key is not cached
+        """
+
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                result = (entry["focal_spot"], entry["sinogram"], tuple(int(value) for value in entry["geometry"]),
+                          json.loads(str(entry["metadata"])))
+            os.utime(path)
+        except FileNotFoundError:
+            result = None
+        except (OSError, ValueError, KeyError):
+            # A damaged entry is treated as a miss and replaced on put
+            result = None
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put(self, key, focal_spot, sinogram, geometry, metadata=None):
+        """Stores a result, removing the least recently used entries if
+        the cache grows past max_bytes. The entry is written through a
+        temporary file, so readers never see it partially written.
+
+        :param key: A key returned by key()
+        :param focal_spot: The focal spot image
+        :param sinogram: The sinogram image
+        :param geometry: The (center x, center y, radius) of the penumbra
+        :param metadata: A JSON serializable dictionary stored with the result
+        """
+
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        try:
+            with open(temp_path, "wb") as f:
+                np.savez_compressed(f, focal_spot=focal_spot, sinogram=sinogram,
+                                    geometry=np.asarray(geometry, dtype="int64"),
+                                    metadata=np.array(json.dumps(metadata or {})))
+            nbytes = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self._lock:
+            if self._current_bytes is None:
+                self._current_bytes = self._scan_bytes()
+            else:
+                self._current_bytes += nbytes
+            if self._current_bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        """Removes every entry."""
+
+        with self._lock:
+            for path, size, mtime in self._entries():
+                _remove(path)
+            self._current_bytes = 0
+
+    def info(self):
+        """Gets the hit, miss and size statistics of the cache.
+
+        :returns: A dictionary of statistics
+        """
+
+        with self._lock:
+            entries = self._entries()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(entries),
+                "current_bytes": sum(size for path, size, mtime in entries),
+                "max_bytes": self.max_bytes,
+            }
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for directory in os.scandir(self.cache_dir):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(".npz"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # Removed by another process
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _scan_bytes(self):
+        return sum(size for path, size, mtime in self._entries())
+
+    def _evict(self):
+        # Other processes may have added entries, so the directory is
+        # scanned again before removing the oldest used entries
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        current_bytes = sum(size for path, size, mtime in entries)
+        for path, size, mtime in entries:
+            if current_bytes <= self.max_bytes:
+                break
+            _remove(path)
+            current_bytes -= size
+        self._current_bytes = current_bytes
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
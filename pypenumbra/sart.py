@@ -0,0 +1,158 @@
+"""
+    pypenumbra.sart
+    ~~~~~~~~~~~~~~
+    Defines an iterative reconstruction with the simultaneous algebraic
+    reconstruction technique (SART), warm started from filtered
+    backprojection.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import numpy as np
+
+from . import fbp
+from .cache import LRUCache
+
+# Projection geometry only depends on the sinogram geometry, so it is
+# kept between calls. The cap can be changed with solver_cache.resize().
+solver_cache = LRUCache(max_bytes=256 * 1024 * 1024)
+
+GOLDEN_RATIO = (1 + 5 ** 0.5) / 2
+
+
+class SART():
+    """A SART solver for sinograms of a fixed height and set of angles.
+    The projection of each angle is taken from the sparse backprojection
+    matrix of the matching FilteredBackprojection operator, and is split
+    per angle once so later reconstructions only iterate.
+
+    :param projection_size: The height of the sinograms (rows per projection)
+    :type projection_size: int
+    :param theta: The projection angles in degrees, one per sinogram column
+    :type theta: numpy.ndarray
+    :param relaxation: The relaxation factor of each update, defaults to 0.15
+    :type relaxation: float, optional
+    :param dtype: The float type the reconstruction is iterated in, defaults to "float64"
+    :type dtype: str, optional
+    """
+
+    def __init__(self, projection_size, theta, relaxation=0.15, dtype="float64"):
+        self.operator = fbp.get_operator(projection_size, theta, dtype=dtype, matrix=True)
+        # Operators too large for the operator cache are cached without
+        # their sparse matrix, which SART needs, so the solver keeps its own
+        self.own_operator = self.operator.matrix is None
+        if self.own_operator:
+            self.operator = fbp.FilteredBackprojection(projection_size, theta, dtype=dtype)
+        self.relaxation = relaxation
+        self.dtype = self.operator.dtype
+
+        # The forward projection is the transpose of the backprojection.
+        # Rows are (angle, detector) pairs and columns are circle pixels.
+        diagonal = self.operator.diagonal
+        projection = self.operator.matrix.T.tocsr()
+        self.angle_projections = []
+        self.ray_sums = []
+        self.pixel_sums = []
+        for angle in range(len(self.operator.theta)):
+            block = projection[angle * diagonal:(angle + 1) * diagonal]
+            ray_sum = np.asarray(block.sum(axis=1)).ravel()
+            pixel_sum = np.asarray(block.sum(axis=0)).ravel()
+            ray_sum[ray_sum == 0] = np.inf
+            pixel_sum[pixel_sum == 0] = np.inf
+            self.angle_projections.append(block)
+            self.ray_sums.append(ray_sum)
+            self.pixel_sums.append(pixel_sum)
+
+        # Visiting angles in golden ratio order keeps consecutive
+        # updates far apart, which speeds up convergence
+        self.order = np.argsort(np.mod(np.arange(len(theta)) * GOLDEN_RATIO, 1.0))
+
+    @property
+    def nbytes(self):
+        nbytes = self.operator.nbytes if self.own_operator else 0
+        for block, ray_sum, pixel_sum in zip(self.angle_projections, self.ray_sums, self.pixel_sums):
+            nbytes += block.data.nbytes + block.indices.nbytes + block.indptr.nbytes
+            nbytes += ray_sum.nbytes + pixel_sum.nbytes
+        return nbytes
+
+    def residual(self, pixels, measured):
+        """Computes the relative residual of a reconstruction.
+
+        :param pixels: The reconstructed values of the circle pixels
+        :param measured: The flattened, padded sinogram
+        :returns: The norm of the projection error relative to the sinogram
+        """
+
+        norm = np.linalg.norm(measured)
+        if norm == 0:
+            return 0.0
+
+        return np.linalg.norm(measured - self.operator.matrix.T @ pixels) / norm
+
+    def __call__(self, sinogram, initial=None, max_iterations=20, tol=1e-3, min_improvement=0.05):
+        """Reconstructs an image from a sinogram. Iteration stops once
+        the relative residual falls below tol, once an iteration reduces
+        it by less than min_improvement of its previous value, or after
+        max_iterations. The iterate with the lowest residual is returned,
+        so an iteration raising the residual (Eg: on noisy plates) never
+        makes the result worse than the initial image.
+
+        :param sinogram: A sinogram with one projection per column
+        :param initial: The image to start from, defaults to the filtered
+        backprojection of the sinogram
+        :param max_iterations: The largest number of iterations, defaults to 20
+        :param tol: The relative residual to stop at, defaults to 1e-3
+        :param min_improvement: The smallest relative reduction of the residual
+        an iteration must make to continue, defaults to 0.05
+        :returns: A tuple containing the reconstructed image and the number
+        of iterations that produced it
+        """
+
+        operator = self.operator
+        if initial is None:
+            initial = operator(sinogram)
+
+        # Padding the projections the same way as the backprojection
+        diagonal = operator.diagonal
+        padded = np.zeros((diagonal, sinogram.shape[1]), dtype=self.dtype)
+        padded[operator.pad_before:operator.pad_before + operator.projection_size] = sinogram
+        measured = padded.T.ravel()
+
+        pixels = initial[operator.circle_mask].astype(self.dtype)
+        residual = self.residual(pixels, measured)
+        best_pixels, best_residual, best_iterations = pixels.copy(), residual, 0
+        relaxation = self.dtype.type(self.relaxation)
+        iterations = 0
+        while iterations < max_iterations and residual > tol:
+            for angle in self.order:
+                block = self.angle_projections[angle]
+                error = measured[angle * diagonal:(angle + 1) * diagonal] - block @ pixels
+                pixels += relaxation * (block.T @ (error / self.ray_sums[angle])) / self.pixel_sums[angle]
+            iterations += 1
+
+            previous, residual = residual, self.residual(pixels, measured)
+            if residual < best_residual:
+                best_pixels, best_residual, best_iterations = pixels.copy(), residual, iterations
+            if previous - residual < min_improvement * previous:
+                break
+
+        reconstructed = np.zeros_like(initial, dtype=self.dtype)
+        reconstructed[operator.circle_mask] = best_pixels
+        return reconstructed, best_iterations
+
+
+def get_solver(projection_size, theta, relaxation=0.15, dtype="float64"):
+    """Gets the SART solver for a sinogram geometry from the solver
+    cache, building it on a cache miss.
+
+    :param projection_size: The height of the sinograms
+    :param theta: The projection angles in degrees
+    :param relaxation: The relaxation factor of each update
+    :param dtype: The float type the reconstruction is iterated in
+    :returns: A SART solver
+    """
+
+    theta = np.asarray(theta, dtype=np.float64)
+    dtype = np.dtype(dtype).name
+    key = (int(projection_size), theta.tobytes(), relaxation, dtype)
+
+    return solver_cache.get_or_create(key, lambda: SART(projection_size, theta, relaxation, dtype))
@@ -0,0 +1,276 @@
+"""
+    pypenumbra.server
+    ~~~~~~~~~~~~~~
+    Defines a local HTTP server that keeps the reconstruction pipeline
+    and its caches warm, batching concurrent requests onto a pool of
+    workers.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .api import reconstruct_from_array, FLOAT_DTYPES, RECONSTRUCTION_METHODS, init_worker, warm_worker
+from .client import DEFAULT_HOST, DEFAULT_PORT, NPY_CONTENT_TYPE, NPZ_CONTENT_TYPE
+
+
+class ReconstructionServer():
+    """Serves reconstructions over HTTP on a local address.
+
+    POST /reconstruct takes a penumbra image as a .npy array (with the
+    "application/x-npy" content type) or as an image file, with the
+    angular_steps, method and float_dtype as query parameters, and
+    returns a .npz archive holding the "focal_spot" and "sinogram".
+    GET /status returns the request and batch counts as JSON.
+
+    Requests are batched: while every worker is busy, incoming requests
+    wait in a queue, and a worker that frees up takes up to max_batch
+    of them as one task. With one job, images are reconstructed in the
+    server process, so its geometry and operator caches stay warm.
+    With more jobs, each worker process keeps its own caches.
+
+    :param host: The host to listen on, defaults to "127.0.0.1"
+    :type host: str, optional
+    :param port: The port to listen on, or 0 for any free port, defaults to 8765
+    :type port: int, optional
+    :param jobs: The number of workers, defaults to 1
+    :type jobs: int, optional
+    :param max_batch: The most requests given to a worker at once, defaults to 8
+    :type max_batch: int, optional
+    :param batch_window: The seconds a free worker waits for more requests
+    to join a batch, defaults to 0.005
+    :type batch_window: float, optional
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, jobs=1, max_batch=8, batch_window=0.005):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+
+        self.jobs = jobs or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.started = None
+
+        self.httpd = ThreadingHTTPServer((host, port), _RequestHandler)
+        self.httpd.reconstruction_server = self
+        self._requests = queue.Queue()
+        self._free_workers = threading.Semaphore(self.jobs)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._batcher = None
+
+    @property
+    def address(self):
+        """The (host, port) the server listens on."""
+
+        return self.httpd.server_address[:2]
+
+    def start(self):
+        """Starts and warms up the workers and the batching thread.
+        Called by serve_forever, or directly when serving from another
+        thread.
+        """
+
+        if self._executor is not None:
+            return
+
+        if self.jobs == 1:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker)
+        for future in [self._executor.submit(warm_worker) for _ in range(self.jobs)]:
+            future.result()
+
+        self.started = time.time()
+        self._batcher = threading.Thread(target=self._run_batches, name="pypenumbra-batcher", daemon=True)
+        self._batcher.start()
+
+    def serve_forever(self):
+        """Starts the server and handles requests until shutdown() is called."""
+
+        self.start()
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        """Stops handling requests, finishes queued reconstructions and
+        stops the workers.
+        """
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._batcher is not None:
+            self._requests.put(None)
+            self._batcher.join()
+            self._executor.shutdown()
+            self._batcher = self._executor = None
+
+    def submit(self, body, is_array, angular_steps=360, method="fbp", float_dtype="float64"):
+        """Queues a reconstruction.
+
+        :param body: The bytes of a .npy array or of an image file
+        :param is_array: If the body is a .npy array
+        :param angular_steps: The number of radial slices taken of the penumbra
+        :param method: The reconstruction method
+        :param float_dtype: The float type the image is processed in
+        :returns: A Future resolving to the focal spot and sinogram, or to
+        the exception raised while reconstructing
+        """
+
+        future = Future()
+        self._requests.put(((body, is_array, angular_steps, method, float_dtype), future))
+        return future
+
+    def status(self):
+        """Gets the request and batch counts of the server.
+
+        :returns: A dictionary of statistics
+        """
+
+        with self._lock:
+            return {
+                "workers": self.jobs,
+                "queue_depth": self._requests.qsize(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "mean_batch_size": (self.completed + self.failed) / self.batches if self.batches else None,
+                "started": self.started,
+            }
+
+    def _run_batches(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+
+            # Requests arriving while every worker is busy join the batch
+            self._free_workers.acquire()
+            batch = [request]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._requests.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    # Putting the sentinel back, so the loop ends after this batch
+                    self._requests.put(None)
+                    break
+                batch.append(request)
+
+            items = [item for item, future in batch]
+            futures = [future for item, future in batch]
+            task = self._executor.submit(_reconstruct_items, items)
+            task.add_done_callback(partial(self._finish_batch, futures))
+
+    def _finish_batch(self, futures, task):
+        self._free_workers.release()
+        try:
+            results = task.result()
+        except Exception as e:
+            # The worker itself failed (Eg: a worker process was killed)
+            results = [e] * len(futures)
+
+        with self._lock:
+            self.batches += 1
+            for result in results:
+                if isinstance(result, Exception):
+                    self.failed += 1
+                else:
+                    self.completed += 1
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/reconstruct":
+            self._send(404, "text/plain", b"Not found")
+            return
+
+        # Reading the body first, as the client sends all of it before
+        # reading a response
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            params = _parse_params(parse_qs(url.query))
+        except ValueError as e:
+            self._send(400, "text/plain", str(e).encode("utf-8"))
+            return
+
+        is_array = self.headers.get("Content-Type") == NPY_CONTENT_TYPE
+        result = self.server.reconstruction_server.submit(body, is_array, *params).result()
+        if isinstance(result, Exception):
+            code = 400 if isinstance(result, ValueError) else 500
+            self._send(code, "text/plain", ("%s: %s" % (type(result).__name__, result)).encode("utf-8"))
+            return
+
+        focal_spot, sinogram = result
+        data = io.BytesIO()
+        np.savez(data, focal_spot=focal_spot, sinogram=sinogram)
+        self._send(200, NPZ_CONTENT_TYPE, data.getvalue())
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/status":
+            self._send(404, "text/plain", b"Not found")
+            return
+
+        status = self.server.reconstruction_server.status()
+        self._send(200, "application/json", json.dumps(status).encode("utf-8"))
+
+    def _send(self, code, content_type, data):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Requests are counted in the status instead of logged
+        pass
+
+
+def _parse_params(query):
+    angular_steps = int(query.get("angular_steps", ["360"])[0])
+    method = query.get("method", ["fbp"])[0]
+    float_dtype = query.get("float_dtype", ["float64"])[0]
+    if angular_steps < 1:
+        raise ValueError("angular_steps must be at least 1")
+    if method not in RECONSTRUCTION_METHODS:
+        raise ValueError("Unknown reconstruction method: %s" % method)
+    if float_dtype not in FLOAT_DTYPES:
+        raise ValueError("Unknown float type: %s" % float_dtype)
+
+    return angular_steps, method, float_dtype
+
+
+def _reconstruct_items(items):
+    results = []
+    for body, is_array, angular_steps, method, float_dtype in items:
+        try:
+            if is_array:
+                image = np.load(io.BytesIO(body), allow_pickle=False)
+            else:
+                from skimage import io as skio
+
+                image = skio.imread(io.BytesIO(body), as_gray=True)
+            results.append(reconstruct_from_array(image, angular_steps=angular_steps, method=method,
+                                                  float_dtype=float_dtype))
+        except Exception as e:
+            results.append(e)
+
+    return results
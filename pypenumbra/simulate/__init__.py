@@ -5,4 +5,7 @@ from .kernel_gen import create_square_kernel
 from .penumbra_gen import generate_blank_penumbra_cr18x24
 from .penumbra_gen import generate_blank_penumbra_rectangle
 from .penumbra_gen import generate_blank_penumbra_square
-from .penumbra_gen import generate_penumbra
\ No newline at end of file
+from .penumbra_gen import generate_penumbra
+from .penumbra_gen import PenumbraSimulator
+from .sweep_gen import parameter_grid
+from .sweep_gen import sweep
\ No newline at end of file
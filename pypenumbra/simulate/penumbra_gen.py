@@ -64,23 +64,150 @@ def generate_blank_penumbra_cr18x24(circle_radius):
     return generate_blank_penumbra_rectangle(2370, 1770, circle_radius)
 
 
-def generate_penumbra(blank_penumbra, kernel):
+CONVOLUTION_METHODS = ("auto", "direct", "fft")
+
+# Kernels with at most this many non-zero values (Eg: point sources)
+# are convolved directly as a sum of shifted copies of the blank
+SPARSE_KERNEL_VALUES = 16
+# Dense kernels at least this large are convolved through the cached
+# blank penumbra spectrum rather than with cv2.filter2D
+FFT_KERNEL_SIZE = 151
+
+
+class PenumbraSimulator():
+    """Convolves one blank penumbra image with many filter kernels. The
+    Fourier transform of the blank penumbra is computed once and reused
+    by every FFT convolution. Convolutions match cv2.filter2D, which
+    correlates with the kernel centered and reflects the image borders
+    (cv2.BORDER_REFLECT_101).
+
+    :param blank_penumbra: A blank penumbra image (white circle on a
+    black background)
+    :type blank_penumbra: numpy.ndarray
+    """
+
+    def __init__(self, blank_penumbra):
+        self.blank_penumbra = np.asarray(blank_penumbra, dtype=np.float64)
+        self.padding = 0
+        self.spectrum = None
+        self.spectrum_size = None
+
+    def convolve(self, kernel, method="auto"):
+        """Convolves the blank penumbra with a filter kernel.
+
+        :param kernel: A filter kernel that the blank penumbra is convolved by
+        :type kernel: numpy.ndarray
+        :param method: "direct" convolves in the image domain, "fft" multiplies
+        spectra and "auto" picks by the size and sparsity of the kernel,
+        defaults to "auto"
+        :type method: str, optional
+        :return: The convolved float image
+        :rtype: numpy.ndarray
+        """
+
+        if method not in CONVOLUTION_METHODS:
+            raise ValueError("Unknown convolution method: %s" % method)
+
+        kernel = np.asarray(kernel, dtype=np.float64)
+        if method == "auto":
+            if np.count_nonzero(kernel) <= SPARSE_KERNEL_VALUES or max(kernel.shape) < FFT_KERNEL_SIZE:
+                method = "direct"
+            else:
+                method = "fft"
+
+        if method == "fft":
+            return self._convolve_fft(kernel)
+        if np.count_nonzero(kernel) <= SPARSE_KERNEL_VALUES:
+            return self._convolve_sparse(kernel)
+        return cv2.filter2D(self.blank_penumbra, -1, kernel)
+
+    def generate(self, kernel, method="auto", stretch=True):
+        """Generates a penumbra image from a filter kernel.
+
+        :param kernel: A filter kernel that the blank penumbra is convolved by
+        :type kernel: numpy.ndarray
+        :param method: The convolution method (see convolve), defaults to "auto"
+        :type method: str, optional
+        :param stretch: If the convolved image is contrast stretched and
+        converted to ubyte, defaults to True
+        :type stretch: bool, optional
+        :return: A numpy image containing the penumbra
+        :rtype: numpy.ndarray
+        """
+
+        filter_img = self.convolve(kernel, method=method)
+        if not stretch:
+            return filter_img
+
+        return img_as_ubyte(equalize_adapthist(filter_img))
+
+    def _convolve_sparse(self, kernel):
+        height, width = self.blank_penumbra.shape
+        anchor_y, anchor_x = kernel.shape[0] // 2, kernel.shape[1] // 2
+        padded = cv2.copyMakeBorder(self.blank_penumbra, anchor_y, kernel.shape[0] - 1 - anchor_y,
+                                    anchor_x, kernel.shape[1] - 1 - anchor_x, cv2.BORDER_REFLECT_101)
+
+        filter_img = np.zeros_like(self.blank_penumbra)
+        for row, col in zip(*np.nonzero(kernel)):
+            filter_img += kernel[row, col] * padded[row:row + height, col:col + width]
+
+        return filter_img
+
+    def _convolve_fft(self, kernel):
+        height, width = self.blank_penumbra.shape
+        anchor_y, anchor_x = kernel.shape[0] // 2, kernel.shape[1] // 2
+        padding = max(anchor_y, anchor_x, kernel.shape[0] - 1 - anchor_y, kernel.shape[1] - 1 - anchor_x)
+        if self.spectrum is None or padding > self.padding:
+            self._transform_blank(padding)
+
+        # Correlating through the spectra. The blank is padded on every
+        # side by at least the kernel's reach, so the region read back
+        # never wraps around.
+        spectrum_height, spectrum_width = self.spectrum_size
+        padded_kernel = np.zeros(self.spectrum_size)
+        padded_kernel[:kernel.shape[0], :kernel.shape[1]] = kernel
+        kernel_spectrum = cv2.dft(padded_kernel, nonzeroRows=kernel.shape[0])
+        correlation = cv2.idft(cv2.mulSpectrums(self.spectrum, kernel_spectrum, 0, conjB=True),
+                               flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+
+        top = self.padding - anchor_y
+        left = self.padding - anchor_x
+        return correlation[top:top + height, left:left + width]
+
+    def _transform_blank(self, padding):
+        # Rounding the padding up so slightly larger kernels reuse the spectrum
+        padding = int(np.ceil(padding / 32.0) * 32)
+        padded = cv2.copyMakeBorder(self.blank_penumbra, padding, padding, padding, padding,
+                                    cv2.BORDER_REFLECT_101)
+        self.spectrum_size = (cv2.getOptimalDFTSize(padded.shape[0]), cv2.getOptimalDFTSize(padded.shape[1]))
+        sized = np.zeros(self.spectrum_size)
+        sized[:padded.shape[0], :padded.shape[1]] = padded
+        self.spectrum = cv2.dft(sized, nonzeroRows=padded.shape[0])
+        self.padding = padding
+
+
+def generate_penumbra(blank_penumbra, kernel, method="auto", stretch=True):
     """Convolves a supplied, blank penumbra image with a supplied
-    filter kernel and returns the resulting penumbra image.
+    filter kernel and returns the resulting penumbra image. To apply
+    many kernels to one blank penumbra, use a PenumbraSimulator so
+    its transform is only computed once.
     
     :param blank_penumbra: A blank penumbra image (white circle on a
     black background)
     :type blank_penumbra: numpy.ndarray
     :param kernel: A filter kernel that the blank penumbra is convolved by
     :type kernel: numpy.ndarray
+    :param method: "direct", "fft" or "auto" (see PenumbraSimulator.convolve),
+    defaults to "auto"
+    :type method: str, optional
+    :param stretch: If the convolved image is contrast stretched and
+    converted to ubyte, defaults to True
+    :type stretch: bool, optional
     :return: A numpy image containing the penumbra
     :rtype: numpy.ndarray
     """
 
-    filter_img = cv2.filter2D(blank_penumbra, -1, kernel)
-    img_stretched = img_as_ubyte(equalize_adapthist(filter_img))
-
-    return img_stretched
+    return PenumbraSimulator(blank_penumbra).generate(kernel, method=method, stretch=stretch)
 
 
 if __name__ == "__main__":
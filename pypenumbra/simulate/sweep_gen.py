@@ -0,0 +1,178 @@
+"""
+    pypenumbra.simulate.sweep_gen
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    Defines parameter sweeps that simulate and reconstruct
+    penumbra images over a grid of parameters.
+    :copyright: 2020 Reece Walsh
+    :license: MIT
+"""
+import itertools
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from skimage import img_as_ubyte
+
+from .. import api
+from .. import imgutil
+from . import kernel_gen as kg
+from . import penumbra_gen as pg
+
+# The parameters of a sweep point and their defaults
+DEFAULT_PARAMETERS = {
+    "circle_radius": 246,
+    "kernel_size": 69,
+    "point_distance": 35,
+}
+
+# How many blank penumbras each process keeps between sweep points
+SIMULATOR_CACHE_SIZE = 2
+
+_simulators = OrderedDict()
+
+
+def parameter_grid(**parameters):
+    """Builds every combination of the passed parameter values.
+
+    :param parameters: Lists of values for "circle_radius", "kernel_size"
+    and "point_distance". Missing parameters use their defaults
+    :returns: A list of dictionaries, one per combination
+    """
+
+    unknown = set(parameters) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise ValueError("Unknown sweep parameters: %s" % ", ".join(sorted(unknown)))
+
+    names = sorted(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*(parameters[name] for name in names))]
+
+
+def get_simulator(width, height, circle_radius):
+    """Gets the simulator of a blank penumbra from the process' cache,
+    so consecutive sweep points with the same blank share it.
+
+    :param width: The width of the blank penumbra
+    :param height: The height of the blank penumbra
+    :param circle_radius: The radius of the blank penumbra circle
+    :returns: A PenumbraSimulator
+    """
+
+    key = (width, height, circle_radius)
+    simulator = _simulators.get(key)
+    if simulator is None:
+        simulator = pg.PenumbraSimulator(pg.generate_blank_penumbra_rectangle(width, height, circle_radius))
+        _simulators[key] = simulator
+        while len(_simulators) > SIMULATOR_CACHE_SIZE:
+            _simulators.popitem(last=False)
+    else:
+        _simulators.move_to_end(key)
+
+    return simulator
+
+
+def simulate_point(parameters, width, height):
+    """Simulates the penumbra image of a sweep point.
+
+    :param parameters: A dictionary of sweep parameters
+    :param width: The width of the simulated image
+    :param height: The height of the simulated image
+    :returns: A uint8 penumbra image
+    """
+
+    point = dict(DEFAULT_PARAMETERS, **parameters)
+    simulator = get_simulator(width, height, point["circle_radius"])
+    kernel = kg.create_dual_point_kernel(point["kernel_size"], point["point_distance"])
+
+    return simulator.generate(kernel)
+
+
+def sweep(grid, width=2370, height=1770, angular_steps=360, method="fbp", jobs=None, max_pending=None,
+          share_geometry=False, float_dtype="float64", return_penumbra=False):
+    """Simulates and reconstructs a penumbra for every point of a
+    parameter grid across a pool of worker processes, yielding the
+    results in grid order as they complete. Only a bounded number of
+    points are in flight at a time, so sweeps of any length run in
+    bounded memory.
+
+    Each process reuses the blank penumbra (and its FFT) between points
+    with the same circle radius, along with its cached sampling grids and
+    reconstruction operators. With share_geometry, the penumbra blob is
+    detected once per circle radius, on the first point with that radius,
+    and every other point is sliced with that center and radius. The
+    detected radius grows with the spread of the kernel, so shared
+    geometry gives the same sampling for every point rather than the
+    results of reconstructing each point on its own.
+
+    :param grid: A list of parameter dictionaries (see parameter_grid)
+    :type grid: list
+    :param width: The width of the simulated images, defaults to 2370
+    :type width: int, optional
+    :param height: The height of the simulated images, defaults to 1770
+    :type height: int, optional
+    :param angular_steps: The number of radial slices taken of each penumbra, defaults to 360
+    :type angular_steps: int, optional
+    :param method: The reconstruction method (see api.reconstruct), defaults to "fbp"
+    :type method: str, optional
+    :param jobs: The number of worker processes, defaults to the number of CPUs.
+    A value of 1 runs every point in the calling process.
+    :type jobs: int, optional
+    :param max_pending: The most points in flight at a time, defaults to twice
+    the number of workers
+    :type max_pending: int, optional
+    :param share_geometry: If the detected blob geometry is shared between
+    points with the same circle radius, defaults to False
+    :type share_geometry: bool, optional
+    :param float_dtype: The float type the images are processed in, defaults to "float64"
+    :type float_dtype: str, optional
+    :param return_penumbra: If the simulated penumbra image is returned
+    after the focal spot and sinogram images, defaults to False
+    :type return_penumbra: bool, optional
+    :return: A generator of (parameters, result) tuples. The result is a
+    tuple containing the focal spot image and the sinogram image, or the
+    exception raised for that point.
+    :rtype: generator
+    """
+
+    if max_pending is None:
+        max_pending = 2 * (jobs or os.cpu_count() or 1)
+    geometries = {}
+
+    def tasks():
+        for parameters in grid:
+            geometry = None
+            if share_geometry:
+                circle_radius = dict(DEFAULT_PARAMETERS, **parameters)["circle_radius"]
+                if circle_radius not in geometries:
+                    penumbra_img = simulate_point(parameters, width, height)
+                    geometries[circle_radius] = imgutil.detect_penumbra(img_as_ubyte(penumbra_img))
+                geometry = geometries[circle_radius]
+            yield (parameters, width, height, angular_steps, method, geometry, float_dtype, return_penumbra)
+
+    if jobs == 1:
+        for task in tasks():
+            yield task[0], _sweep_item(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=api.init_worker) as executor:
+        pending = deque()
+        for task in tasks():
+            pending.append((task[0], executor.submit(_sweep_item, task)))
+            if len(pending) >= max_pending:
+                parameters, future = pending.popleft()
+                yield parameters, future.result()
+        while pending:
+            parameters, future = pending.popleft()
+            yield parameters, future.result()
+
+
+def _sweep_item(task):
+    parameters, width, height, angular_steps, method, geometry, float_dtype, return_penumbra = task
+    try:
+        penumbra_img = simulate_point(parameters, width, height)
+        focal_spot, sinogram = api.reconstruct_from_array(penumbra_img, angular_steps=angular_steps, method=method,
+                                                          float_dtype=float_dtype, geometry=geometry)
+        if return_penumbra:
+            return focal_spot, sinogram, penumbra_img
+        return focal_spot, sinogram
+    except Exception as e:
+        return e
@@ -7,172 +7,181 @@
     :license: MIT
 """
 import math
+from functools import partial
 
 import numpy as np
-from skimage.exposure import equalize_adapthist
 from skimage import img_as_ubyte
-from skimage.transform import rotate
 import math
 import cv2
 
 from . import imgutil
+from . import polar
+from . import profiling
 
 
-def construct_sinogram(float_image, uint8_image, angular_steps=360, debug=False):
+def construct_sinogram(float_image, uint8_image, angular_steps=360, debug=False, bounds_method="threshold",
+                       timings=None, geometry=None, metadata=None):
     """Constructs a sinogram from the detected penumbra blob
     in the passed images. The uint8 image is used for blob detection
     and the float image is used for value calculations.
 
-    :param float_image: A float64 image used for value calculations
+    :param float_image: A float64 or float32 image used for value calculations
     :param uint8_image: A uint8 image used for blob detection
     :param angular_steps: The number of slices to slice the blob into
-    :returns: A float64 sinogram image
+    :param bounds_method: How the top and bottom of the sinogram are found,
+    either "threshold" or "profile" (see get_sinogram_size)
+    :param timings: A profiling.Timings object the stages are recorded in
+    :param geometry: The center x, center y and radius of the penumbra blob.
+    When passed, the blob isn't detected (Eg: for images known to share it)
+    :param metadata: A dictionary the blob's center_x, center_y and radius, the
+    padding around it and the top and bottom of the sinogram are recorded in
+    :returns: A sinogram image with the float type of float_image
     """
 
     # Detecting penumbra blob and getting properties
-    threshold = imgutil.threshold(uint8_image)
-    center_x, center_y, radius = imgutil.get_center(threshold)
+    with profiling.stage("detect", timings):
+        if geometry is None:
+            center_x, center_y, radius = imgutil.detect_penumbra(uint8_image)
+        else:
+            center_x, center_y, radius = (int(value) for value in geometry)
 
     if debug:
-        disk_lines = cv2.cvtColor(uint8_image, cv2.COLOR_GRAY2RGB)
-        cv2.line(disk_lines, (center_x, center_y), (center_x+radius, center_y), (0, 255, 0), thickness=3)
-        cv2.circle(disk_lines, (center_x, center_y), 5, (0, 255, 0), thickness=5)
-
+        # Thresholding and drawing are left to the debug sink's writer
         imgutil.save_debug_image("1 - original_image.png", uint8_image)
-        imgutil.save_debug_image("2 - threshold_raw_image.png", threshold)
-        imgutil.save_debug_image("3 - disk_stats.png", disk_lines)
+        imgutil.save_debug_image("2 - threshold_raw_image.png", uint8_image, render=imgutil.threshold,
+                                 raw_render=True)
+        imgutil.save_debug_image("3 - disk_stats.png", uint8_image,
+                                 render=partial(draw_disk_stats, center_x=center_x, center_y=center_y, radius=radius))
         print("---")
         print("Original Image Disk Identification Results:")
         print("Center X: %d | Center Y: %d | Radius: %d" % (center_x, center_y, radius))
 
     if radius < 1:
         raise ValueError("Radius is of improper length")
+    if metadata is not None:
+        metadata.update(center_x=int(center_x), center_y=int(center_y), radius=int(radius))
 
     PADDING = int(round(radius * 0.1))  # Relative padding
     # Dictates how large the area around the penumbra is when cropping
     # Also dictates the ultimate x/y size of the focal spot output
     radius = radius + PADDING # Padding radius
 
-    # Padding image if circle + padding doesn't fit
-    pad_center_x, pad_center_y, uint8_image = imgutil.pad_to_fit(radius, center_x, center_y, uint8_image)
-    pad_center_x, pad_enter_y, float_image = imgutil.pad_to_fit(radius, center_x, center_y, float_image)
-    center_x = pad_center_x
-    center_y = pad_center_y
+    # Cropping the float image to the circle + padding. Only the parts
+    # of the circle outside the image are padded (with zeros), and the
+    # crop is a view when the circle fits in the image. Slices start one
+    # pixel up and left of the detected center, as they always have
+    # (pad_to_fit pads by one more pixel than it shifts the center).
+    with profiling.stage("crop", timings):
+        center_x, center_y, float_image = imgutil.crop_to_fit(radius, center_x - 1, center_y - 1, float_image)
 
     # Slicing penumbra blob into sinogram
-    sinogram = slice_penumbra_blob(center_x, center_y, radius, angular_steps, float_image, uint8_image, debug=debug)
-    top, bottom, center = get_sinogram_size(sinogram, PADDING, debug=debug)
+    with profiling.stage("slice", timings):
+        sinogram = slice_penumbra_blob(center_x, center_y, radius, angular_steps, float_image, uint8_image,
+                                       debug=debug)
+    with profiling.stage("bounds", timings):
+        top, bottom, center = get_sinogram_size(sinogram, PADDING, debug=debug, method=bounds_method)
+    if metadata is not None:
+        metadata.update(padding=PADDING, top=int(top), bottom=int(bottom))
 
     if debug:
-        rs_height, rs_width = sinogram.shape
-        rs_lines = cv2.cvtColor(img_as_ubyte(sinogram), cv2.COLOR_GRAY2RGB)
-        cv2.line(rs_lines, (0, top), (rs_width, top), (0, 255, 0), thickness=2)
-        cv2.line(rs_lines, (0, center), (rs_width, center), (0, 255, 0), thickness=2)
-        cv2.line(rs_lines, (0, bottom), (rs_width, bottom), (0, 255, 0), thickness=2)
-
-        imgutil.save_debug_image("5 - radial_slices.png", img_as_ubyte(sinogram))
-        imgutil.save_debug_image("7 - sinogram_lines.png", rs_lines)
+        imgutil.save_debug_image("5 - radial_slices.png", sinogram, render=img_as_ubyte)
+        imgutil.save_debug_image("7 - sinogram_lines.png", sinogram,
+                                 render=partial(draw_sinogram_lines, top=top, center=center, bottom=bottom))
         print("---")
         print("Sinogram Identification Stats:")
         print("Top of Sinogram: %d | Center of Sinogram: %d | Bottom of Sinogram: %d" % (top, center, bottom))
 
-    # Applying first derivative on the vertical direction
-    derivative_sinogram = imgutil.apply_first_derivative(sinogram)
+    # Applying first derivative on the vertical direction, only over the
+    # band around the sinogram's center axis. One extra row is kept on
+    # each side so the derivative's 3x3 kernel sees the same neighbours
+    # as it would over the whole sinogram.
+    height, width = sinogram.shape
+    band_top = max(top - 1, 0)
+    band_bottom = min(bottom + 1, height)
+    with profiling.stage("derivative", timings):
+        derivative_band = imgutil.apply_first_derivative(sinogram[band_top:band_bottom, 0:width])
     if debug:
-        imgutil.save_debug_image("8 - derivative_sinogram.png", derivative_sinogram)
+        imgutil.save_debug_image("8 - derivative_sinogram.png", derivative_band)
 
-    # Cropping image around sinogram's center axis
-    height, width = derivative_sinogram.shape
-    crop_sinogram = derivative_sinogram[top:bottom, 0:width]
+    # Cropping the band to the sinogram's top and bottom
+    crop_sinogram = derivative_band[top - band_top:bottom - band_top, 0:width]
 
     return crop_sinogram
 
 
-def slice_penumbra_blob(center_x, center_y, radius, angular_steps, float_image, uint8_image, debug=False):
+def slice_penumbra_blob(center_x, center_y, radius, angular_steps, float_image, uint8_image, debug=False,
+                        interpolation="bilinear"):
     """Slices a penumbra blob into a specified number of slices
 
     :param center_x: The x-coordinate of the center of the penumbra blob
     :param center_y: The y-coordinate of the center of the penumbra blob
     :param radius: The radius of the penumbra blob (can include padding)
     :param angular_steps: How many slices to slice the blob into
-    :param float_image: A float64 image used to source the slices from
+    :param float_image: A float64 or float32 image used to source the slices from
+    :param interpolation: How slices are sampled, either "bilinear" or "nearest"
     :returns: Slices compiled into an image
     """
 
-    # Setting up values for sinogram extraction
-    ARC_ANGLE = 360.0
-    RADS_PER_SLICE = (math.pi/180.0) * (ARC_ANGLE/angular_steps)
-    sinogram = np.zeros(shape=(angular_steps, radius), dtype="float64")
-    outer_x = 0
-    outer_y = 0
+    # Sampling every slice of the blob in one pass, reusing the
+    # sampling grid if this geometry has been sliced before
+    sinogram = polar.sample_polar(center_x, center_y, radius, angular_steps, float_image,
+                                  interpolation=interpolation)
 
     if debug:
-        drawn_sino = img_as_ubyte(equalize_adapthist(float_image))
-        drawn_sino = cv2.cvtColor(drawn_sino, cv2.COLOR_GRAY2RGB)
-
-    # Assembling sinogram slices from the image
-    for i in range(0, angular_steps):
-        # Rotating around the penumbra blob in a circle by RADS_PER_SLICE
-        angle = i * RADS_PER_SLICE
-        outer_x = center_x + radius * math.cos(angle)
-        outer_y = center_y - radius * math.sin(angle)
-
-        if debug:
-            drawn_sino = cv2.line(drawn_sino,(center_x, center_y),(int(round(outer_x)), int(round(outer_y))),(0,255,0),1)
+        # Contrast stretching the image and drawing every slice is
+        # left to the debug sink's writer
+        imgutil.save_debug_image("4 - slice_lines.png", float_image,
+                                 render=partial(draw_slice_lines, center_x=center_x, center_y=center_y,
+                                                radius=radius, angular_steps=angular_steps))
 
-        col = imgutil.get_line(center_x, center_y, outer_x, outer_y, float_image)
-        sinogram[i] = col
-
-    if debug:
-        imgutil.save_debug_image("4 - slice_lines.png", drawn_sino)
-    
     sinogram = np.rot90(sinogram, axes=(1,0))
     return sinogram
 
 
-def get_sinogram_size(sinogram_input, padding, debug=False):
+def get_sinogram_size(sinogram_input, padding, debug=False, method="threshold"):
     """Gets the top, bottom, and center Y-coordinate
 
     :param sinogram_input: A sinogram image
     :param padding: How much padding (in pixels) to put around top/bottom Y-coordinates
+    :param method: How the edge of the penumbra is found. "threshold" thresholds
+    the full sinogram, "profile" thresholds the darkest and brightest value of
+    each row of the sinogram, which is cheaper and finds the same edges to
+    within a row or two
     :returns: The top, bottom, and center of the sinogram as integers
     """
 
-    sinogram = img_as_ubyte(sinogram_input)
-    # Attempting to isolate the circle within the pre-sinogram image
     bsize = 20
-    blur = cv2.bilateralFilter(sinogram, bsize, bsize*2, bsize/2)
-    thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 17, 2)
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, np.ones((3,3),np.uint8))
+    if method == "threshold":
+        sinogram = img_as_ubyte(sinogram_input)
+        # Attempting to isolate the circle within the pre-sinogram image
+        blur = cv2.bilateralFilter(sinogram, bsize, bsize*2, bsize/2)
+        thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 17, 2)
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, np.ones((3,3),np.uint8))
+    elif method == "profile":
+        # The threshold method finds the first slice to reach the edge and
+        # the last one to leave it, which are the edges of the darkest and
+        # brightest values of each row. Those two radial profiles are
+        # thresholded as single columns with the same filters, unquantized.
+        profiles = (np.min(sinogram_input, axis=1), np.max(sinogram_input, axis=1))
+        blur = np.hstack([cv2.bilateralFilter(profile[:, np.newaxis].astype(np.float32) * 255, bsize, bsize*2, bsize/2)
+                          for profile in profiles])
+        local_mean = cv2.GaussianBlur(blur, (1, 17), 0, borderType=cv2.BORDER_REPLICATE)
+        thresh = np.where(blur > local_mean - 2, 255, 0).astype(np.uint8)
+    else:
+        raise ValueError("Unknown sinogram size method: %s" % method)
 
     if debug:
         imgutil.save_debug_image("6 - threshold_sinogram.png", thresh)
 
-    # Iterating over columns to find the center/radius
-    # of the pre-sinogram. We assume that the black portion
+    # Finding the first and last rows holding a black value in any
+    # column of the pre-sinogram. We assume that the black portion
     # of the pre-sinogram is on the bottom.
-    thresh_rotate = rotate(thresh, 90, resize=True)
-    height, width = thresh_rotate.shape
-    sinogram_top = math.inf
-    sinogram_bottom = 0
-    # Iterating over each col (or row now, since we rotated)
-    for col_idx in range(0, height):
-        col = thresh_rotate[col_idx]
-        sinogram_temp_top = math.inf
-        sinogram_temp_bottom = 0
-        # Iterate through each value
-        for value_idx in range(0, len(col)):
-            value = col[value_idx]
-            if value == 0:
-                if value_idx < sinogram_temp_top:
-                    sinogram_temp_top = value_idx
-                if value_idx > sinogram_bottom:
-                    sinogram_temp_bottom = value_idx
-        # Update if the edge is a new low or high
-        if sinogram_temp_top < sinogram_top:
-            sinogram_top = sinogram_temp_top
-        if sinogram_temp_bottom > sinogram_bottom:
-            sinogram_bottom = sinogram_temp_bottom
+    black_rows = np.flatnonzero(np.any(thresh == 0, axis=1))
+    if len(black_rows) == 0:
+        raise ValueError("Unable to find the edge of the penumbra in the sinogram")
+    sinogram_top = black_rows[0]
+    sinogram_bottom = black_rows[-1]
+    height = thresh.shape[0]
 
     top = int(round(sinogram_top - padding))
     bottom = int(round(sinogram_bottom + padding))
@@ -184,8 +193,8 @@ def get_sinogram_size(sinogram_input, padding, debug=False):
     top_diff = bottom_diff = 0
     if top < 0:
         top_diff = abs(top)
-    if bottom > width:
-        bottom_diff = bottom - width
+    if bottom > height:
+        bottom_diff = bottom - height
     diff = max(top_diff, bottom_diff)
     # Adjusting top/bottom by the diff
     if diff > 0:
@@ -193,3 +202,66 @@ def get_sinogram_size(sinogram_input, padding, debug=False):
         bottom = bottom - diff
 
     return top, bottom, center
+
+
+def draw_disk_stats(uint8_image, center_x, center_y, radius):
+    """Draws the detected center and radius of the penumbra blob.
+
+    :param uint8_image: A uint8 image containing the penumbra blob
+    :param center_x: The x-coordinate of the center of the penumbra blob
+    :param center_y: The y-coordinate of the center of the penumbra blob
+    :param radius: The radius of the penumbra blob
+    :returns: An RGB image
+    """
+
+    disk_lines = cv2.cvtColor(uint8_image, cv2.COLOR_GRAY2RGB)
+    cv2.line(disk_lines, (center_x, center_y), (center_x+radius, center_y), (0, 255, 0), thickness=3)
+    cv2.circle(disk_lines, (center_x, center_y), 5, (0, 255, 0), thickness=5)
+
+    return disk_lines
+
+
+def draw_slice_lines(float_image, center_x, center_y, radius, angular_steps):
+    """Draws every slice taken of the penumbra blob over the
+    contrast stretched image.
+
+    :param float_image: A float image containing the penumbra blob
+    :param center_x: The x-coordinate of the center of the penumbra blob
+    :param center_y: The y-coordinate of the center of the penumbra blob
+    :param radius: The radius of the penumbra blob (can include padding)
+    :param angular_steps: How many slices the blob was sliced into
+    :returns: An RGB image
+    """
+
+    from skimage.exposure import equalize_adapthist
+
+    RADS_PER_SLICE = (math.pi/180.0) * (360.0/angular_steps)
+    drawn_sino = img_as_ubyte(equalize_adapthist(float_image))
+    drawn_sino = cv2.cvtColor(drawn_sino, cv2.COLOR_GRAY2RGB)
+    for i in range(0, angular_steps):
+        # Rotating around the penumbra blob in a circle by RADS_PER_SLICE
+        angle = i * RADS_PER_SLICE
+        outer_x = center_x + radius * math.cos(angle)
+        outer_y = center_y - radius * math.sin(angle)
+        drawn_sino = cv2.line(drawn_sino,(center_x, center_y),(int(round(outer_x)), int(round(outer_y))),(0,255,0),1)
+
+    return drawn_sino
+
+
+def draw_sinogram_lines(sinogram, top, center, bottom):
+    """Draws the top, center and bottom of the sinogram.
+
+    :param sinogram: A sinogram image
+    :param top: The top of the sinogram
+    :param center: The center of the sinogram
+    :param bottom: The bottom of the sinogram
+    :returns: An RGB image
+    """
+
+    rs_height, rs_width = sinogram.shape
+    rs_lines = cv2.cvtColor(img_as_ubyte(sinogram), cv2.COLOR_GRAY2RGB)
+    cv2.line(rs_lines, (0, top), (rs_width, top), (0, 255, 0), thickness=2)
+    cv2.line(rs_lines, (0, center), (rs_width, center), (0, 255, 0), thickness=2)
+    cv2.line(rs_lines, (0, bottom), (rs_width, bottom), (0, 255, 0), thickness=2)
+
+    return rs_lines
@@ -0,0 +1,283 @@
+"""
+    pypenumbra.store
+    ~~~~~~~~~~~~~~
+    Defines an append-only store of reconstruction results, kept as
+    chunked, memory-mappable arrays on local disk.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import os
+import json
+import threading
+import time
+import uuid
+
+import numpy as np
+
+# Arrays start on multiples of this many bytes in the chunk files, so
+# every array can be viewed in place whatever its dtype
+ALIGNMENT = 64
+
+STORE_FORMAT = 1
+
+
+class ResultStore():
+    """Stores the focal spots, sinograms and metadata of many plates in
+    a directory, addressed by plate ID.
+
+    Each writer appends to its own shard, a sub-directory holding chunk
+    files of raw array data and a JSON-lines index, so processes can
+    append to one store in parallel without locking. A chunk is closed
+    once it grows past chunk_bytes. Index lines are written after the
+    arrays they point to, so readers never see a partial plate. Reads
+    return read-only memory maps of the chunks, so only the pages used
+    are read from disk.
+
+    Calling append from several processes (Eg: batch workers) gives
+    each process its own shard. A plate ID written more than once reads
+    back its latest result.
+
+    :param store_dir: The directory results are stored in
+    :type store_dir: str
+    :param chunk_bytes: The size chunk files are closed at, defaults to 256MB
+    :type chunk_bytes: int, optional
+    """
+
+    def __init__(self, store_dir, chunk_bytes=256 << 20):
+        self.store_dir = store_dir
+        self.chunk_bytes = chunk_bytes
+        self._records = {}
+        self._index_offsets = {}
+        self._maps = {}
+        self._writer = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+
+    def writer(self):
+        """Creates a writer appending to a new shard of the store.
+
+        :returns: A StoreWriter
+        """
+
+        return StoreWriter(self.store_dir, chunk_bytes=self.chunk_bytes)
+
+    def append(self, plate_id, focal_spot, sinogram, metadata=None):
+        """Appends a plate's result through the shard of the calling process.
+
+        :param plate_id: The ID the plate is read back by (Eg: its file name)
+        :param focal_spot: The focal spot image
+        :param sinogram: The sinogram image
+        :param metadata: A JSON serializable dictionary stored with the result
+        (Eg: the metadata recorded by api.reconstruct)
+        """
+
+        with self._lock:
+            # A forked worker starts its own shard instead of sharing
+            # the parent's open files
+            if self._writer is None or self._writer_pid != os.getpid():
+                self._writer = self.writer()
+                self._writer_pid = os.getpid()
+            self._writer.append(plate_id, focal_spot, sinogram, metadata=metadata)
+
+    def close(self):
+        """Closes the shard of the calling process and the open memory maps."""
+
+        with self._lock:
+            if self._writer is not None and self._writer_pid == os.getpid():
+                self._writer.close()
+            self._writer = None
+            self._maps = {}
+
+    def refresh(self):
+        """Reads plates appended to the index since the last refresh.
+        Called by every read.
+        """
+
+        with self._lock:
+            self._refresh()
+
+    def ids(self):
+        """Gets the IDs of the stored plates.
+
+        :returns: A sorted list of plate IDs
+        """
+
+        self.refresh()
+        return sorted(self._records)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._records)
+
+    def __contains__(self, plate_id):
+        self.refresh()
+        return plate_id in self._records
+
+    def metadata(self, plate_id):
+        """Gets a plate's metadata without reading its arrays.
+
+        :param plate_id: The ID of a stored plate
+        :returns: The metadata dictionary
+        """
+
+        self.refresh()
+        return dict(self._get_record(plate_id)["metadata"])
+
+    def get(self, plate_id):
+        """Gets a plate's result.
+
+        :param plate_id: The ID of a stored plate
+        :returns: A tuple containing the focal spot and the sinogram, as
+        read-only memory mapped arrays, and the metadata dictionary
+        """
+
+        self.refresh()
+        record = self._get_record(plate_id)
+        return (self._read_array(record, "focal_spot"), self._read_array(record, "sinogram"),
+                dict(record["metadata"]))
+
+    def records(self):
+        """Streams the ID and metadata of every plate, in ID order,
+        without reading any arrays (Eg: for trend analysis).
+
+        :returns: A generator of (plate ID, metadata) tuples
+        """
+
+        for plate_id in self.ids():
+            yield plate_id, dict(self._records[plate_id]["metadata"])
+
+    def iterate(self, plate_ids=None):
+        """Streams plate results. Each plate's arrays are memory mapped
+        as it is reached, so the store is never loaded into memory.
+
+        :param plate_ids: The IDs of the plates to read, defaults to every plate in ID order
+        :returns: A generator of (plate ID, focal spot, sinogram, metadata) tuples
+        """
+
+        if plate_ids is None:
+            plate_ids = self.ids()
+        for plate_id in plate_ids:
+            focal_spot, sinogram, metadata = self.get(plate_id)
+            yield plate_id, focal_spot, sinogram, metadata
+
+    def _get_record(self, plate_id):
+        try:
+            return self._records[plate_id]
+        except KeyError:
+            raise KeyError("Plate not in store: %s" % plate_id) from None
+
+    def _refresh(self):
+        if not os.path.isdir(self.store_dir):
+            return
+
+        loaded = []
+        for shard in os.scandir(self.store_dir):
+            index_path = os.path.join(shard.path, "index.jsonl")
+            if not shard.is_dir() or not os.path.isfile(index_path):
+                continue
+
+            offset = self._index_offsets.get(index_path, 0)
+            with open(index_path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            # A line still being written is read on the next refresh
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                record = json.loads(line.decode("utf-8"))
+                record["chunk_path"] = os.path.join(shard.path, record["chunk"])
+                loaded.append(record)
+            self._index_offsets[index_path] = offset + end
+
+        for record in sorted(loaded, key=lambda record: record["written"]):
+            current = self._records.get(record["id"])
+            if current is None or current["written"] <= record["written"]:
+                self._records[record["id"]] = record
+
+    def _read_array(self, record, name):
+        offset = record[name]["offset"]
+        dtype = np.dtype(record[name]["dtype"])
+        shape = tuple(record[name]["shape"])
+        nbytes = dtype.itemsize * int(np.prod(shape))
+
+        with self._lock:
+            chunk = self._maps.get(record["chunk_path"])
+            # Chunks still being appended to are mapped again once they
+            # have grown past the mapped size
+            if chunk is None or len(chunk) < offset + nbytes:
+                chunk = np.memmap(record["chunk_path"], dtype="uint8", mode="r")
+                self._maps[record["chunk_path"]] = chunk
+
+        return chunk[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+class StoreWriter():
+    """Appends results to a new shard of a ResultStore. Created through
+    ResultStore.writer. A writer is used by one thread at a time.
+
+    :param store_dir: The directory of the store
+    :type store_dir: str
+    :param chunk_bytes: The size chunk files are closed at, defaults to 256MB
+    :type chunk_bytes: int, optional
+    """
+
+    def __init__(self, store_dir, chunk_bytes=256 << 20):
+        self.chunk_bytes = chunk_bytes
+        self.shard_dir = os.path.join(store_dir, "shard-%d-%s" % (os.getpid(), uuid.uuid4().hex[:12]))
+        os.makedirs(self.shard_dir)
+        self._chunk_number = -1
+        self._chunk = None
+        self._index = open(os.path.join(self.shard_dir, "index.jsonl"), "ab")
+
+    def append(self, plate_id, focal_spot, sinogram, metadata=None):
+        """Appends a plate's result.
+
+        :param plate_id: The ID the plate is read back by
+        :param focal_spot: The focal spot image
+        :param sinogram: The sinogram image
+        :param metadata: A JSON serializable dictionary stored with the result
+        """
+
+        if self._chunk is None or self._chunk.tell() >= self.chunk_bytes:
+            self._next_chunk()
+
+        record = {
+            "id": str(plate_id),
+            "chunk": os.path.basename(self._chunk.name),
+            "focal_spot": self._write_array(focal_spot),
+            "sinogram": self._write_array(sinogram),
+            "metadata": metadata or {},
+            "written": time.time(),
+            "format": STORE_FORMAT,
+        }
+        self._chunk.flush()
+
+        self._index.write((json.dumps(record) + "\n").encode("utf-8"))
+        self._index.flush()
+
+    def close(self):
+        """Closes the shard's files."""
+
+        if self._chunk is not None:
+            self._chunk.close()
+            self._chunk = None
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _next_chunk(self):
+        if self._chunk is not None:
+            self._chunk.close()
+        self._chunk_number += 1
+        self._chunk = open(os.path.join(self.shard_dir, "chunk-%05d.bin" % self._chunk_number), "ab")
+
+    def _write_array(self, array):
+        array = np.ascontiguousarray(array)
+        padding = -self._chunk.tell() % ALIGNMENT
+        self._chunk.write(b"\0" * padding)
+        offset = self._chunk.tell()
+        self._chunk.write(memoryview(array).cast("B"))
+        return {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
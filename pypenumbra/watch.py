@@ -0,0 +1,283 @@
+"""
+    pypenumbra.watch
+    ~~~~~~~~~~~~~~
+    Defines a long-running service that watches a directory for new
+    penumbra images and reconstructs them on a pool of warm workers.
+    :copyright: 2019 Reece Walsh
+    :license: MIT
+"""
+import os
+import fnmatch
+import json
+import queue
+import threading
+import time
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from .api import init_worker, warm_worker
+from .output import (get_output_paths, is_up_to_date, reconstruct_input, write_atomic, OutputWriter,
+                     OUTPUT_SUFFIXES)
+
+# How many reconstruction times the latency statistics are taken over
+LATENCY_WINDOW = 100
+# How many seconds the throughput is measured over
+THROUGHPUT_WINDOW = 60.0
+
+
+class FolderWatcher():
+    """Watches a directory for new penumbra images and reconstructs
+    them on a pool of worker processes that are started, and warmed up
+    with a small reconstruction, before watching begins. A file is
+    queued once its size and modification time stop changing, so files
+    still being copied in are not read. The focal spot and sinogram of
+    each file are written next to each other in the output directory
+    through a temporary file and a rename, so readers never see partial
+    images. Inputs with up to date outputs are skipped, so a restarted
+    watcher picks up where it left off. Outputs are written by a
+    background thread while the workers reconstruct the next files.
+
+    :param input_dir: The directory to watch
+    :type input_dir: str
+    :param output_dir: The directory to save the output images in
+    :type output_dir: str
+    :param jobs: The number of worker processes, defaults to the number of CPUs
+    :type jobs: int, optional
+    :param pattern: A glob pattern the file names must match, defaults to "*"
+    :type pattern: str, optional
+    :param binary_options: The (width, height, dtype) of raw binary inputs, or
+    None for image inputs, defaults to None
+    :type binary_options: tuple, optional
+    :param poll_interval: The seconds between scans of the directory, defaults to 1.0
+    :type poll_interval: float, optional
+    :param settle_time: The seconds a file must stay unchanged before it is
+    queued, defaults to 1.0
+    :type settle_time: float, optional
+    :param status_path: The path to write the JSON status file at, defaults
+    to "watch_status.json" in the output directory
+    :type status_path: str, optional
+    :param output_format: One of output.OUTPUT_FORMATS, defaults to "png"
+    :type output_format: str, optional
+    :param preview: If PNG previews are saved alongside raw outputs, defaults to False
+    :type preview: bool, optional
+    :param compress: Compresses TIFF and NPZ outputs, defaults to False
+    :type compress: bool, optional
+    """
+
+    def __init__(self, input_dir, output_dir, jobs=None, pattern="*", binary_options=None, poll_interval=1.0,
+                 settle_time=1.0, status_path=None, output_format="png", preview=False, compress=False):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.jobs = jobs or os.cpu_count() or 1
+        self.pattern = pattern
+        self.binary_options = binary_options
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        if status_path is None:
+            status_path = os.path.join(output_dir, "watch_status.json")
+        self.status_path = status_path
+        self.output_format = output_format
+        self.preview = preview
+        self.writer = OutputWriter(output_format=output_format, compress=compress)
+
+        self.queue = deque()
+        self.in_progress = {}
+        self.completed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.finish_times = deque()
+        self.started = None
+        self._candidates = {}
+        # The last seen signature of each settled file, by path
+        self._known = {}
+        self._stop = threading.Event()
+        self._writing = 0
+        self._written = queue.Queue()
+
+    def output_paths(self, input_path):
+        """Gets the output paths of an input file.
+
+        :param input_path: The path to an input file
+        :returns: A tuple of paths (see output.get_output_paths)
+        """
+
+        stem = os.path.join(self.output_dir, os.path.splitext(os.path.basename(input_path))[0])
+        return get_output_paths(stem + "_focal_spot", stem + "_sinogram", stem, self.output_format, self.preview)
+
+    def scan(self, now=None):
+        """Scans the input directory once, queueing files that have
+        settled since the last scan.
+
+        :param now: The current time, defaults to time.time()
+        :returns: The number of newly queued files
+        """
+
+        if now is None:
+            now = time.time()
+
+        queued = 0
+        present = set()
+        status_path = os.path.abspath(self.status_path)
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if (name.startswith(".") or name.endswith(OUTPUT_SUFFIXES) or not fnmatch.fnmatch(name, self.pattern)
+                        or not entry.is_file() or os.path.abspath(entry.path) == status_path):
+                    continue
+
+                present.add(entry.path)
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime)
+                if self._known.get(entry.path) == signature:
+                    continue
+
+                candidate = self._candidates.get(entry.path)
+                if candidate is None or candidate[0] != signature:
+                    self._candidates[entry.path] = (signature, now)
+                    continue
+                if now - candidate[1] < self.settle_time:
+                    continue
+
+                del self._candidates[entry.path]
+                self._known[entry.path] = signature
+                if is_up_to_date(entry.path, self.output_paths(entry.path)):
+                    continue
+                self.queue.append((entry.path, now))
+                queued += 1
+
+        # Forgetting files that were removed, so a long running watcher
+        # only remembers the files in the directory
+        for path in [path for path in self._known if path not in present]:
+            del self._known[path]
+        for path in [path for path in self._candidates if path not in present]:
+            del self._candidates[path]
+
+        return queued
+
+    def status(self, now=None):
+        """Gets the queue depth, latency and throughput of the watcher.
+
+        :param now: The current time, defaults to time.time()
+        :returns: A dictionary of statistics
+        """
+
+        if now is None:
+            now = time.time()
+        while self.finish_times and now - self.finish_times[0] > THROUGHPUT_WINDOW:
+            self.finish_times.popleft()
+
+        latencies = sorted(self.latencies)
+        latency = None
+        if latencies:
+            latency = {
+                "last": self.latencies[-1],
+                "mean": sum(latencies) / len(latencies),
+                "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+                "max": latencies[-1],
+            }
+
+        return {
+            "input_dir": self.input_dir,
+            "output_dir": self.output_dir,
+            "workers": self.jobs,
+            "queue_depth": len(self.queue),
+            "in_progress": len(self.in_progress),
+            "writing": self._writing,
+            "completed": self.completed,
+            "failed": self.failed,
+            "latency_seconds": latency,
+            "throughput_per_minute": len(self.finish_times) * 60.0 / THROUGHPUT_WINDOW,
+            "started": self.started,
+            "updated": now,
+        }
+
+    def write_status(self, now=None):
+        """Writes the status to the status file, replacing it atomically."""
+
+        write_atomic(self.status_path, lambda path: _write_json(path, self.status(now)))
+
+    def stop(self):
+        """Stops a running watcher after its current poll."""
+
+        self._stop.set()
+
+    def run(self, max_polls=None):
+        """Starts and warms up the worker pool, then watches the input
+        directory until stop() is called or max_polls polls have run.
+        Work in progress is finished before returning.
+
+        :param max_polls: The largest number of polls to run, defaults to no limit
+        """
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started = time.time()
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker) as executor:
+            # Starting every worker up front, so the first plates
+            # don't pay for process start up and imports
+            for future in [executor.submit(warm_worker) for _ in range(self.jobs)]:
+                future.result()
+
+            polls = 0
+            while not self._stop.is_set() and (max_polls is None or polls < max_polls):
+                self.poll(executor)
+                polls += 1
+                self._stop.wait(self.poll_interval)
+
+            while self.in_progress or self._writing:
+                self.poll(executor, scan=False)
+                time.sleep(min(self.poll_interval, 0.1))
+
+    def poll(self, executor, scan=True):
+        """Collects finished reconstructions, scans the input directory,
+        submits queued files and writes the status file.
+
+        :param executor: The executor reconstructions are submitted to
+        :param scan: If the input directory is scanned, defaults to True
+        """
+
+        now = time.time()
+        for future in [future for future in self.in_progress if future.done()]:
+            input_path, queued_time = self.in_progress.pop(future)
+            input_path, result = future.result()
+            if isinstance(result, Exception):
+                self.failed += 1
+                print("Failed to reconstruct %s: %s" % (input_path, result))
+                continue
+            focal_spot, sinogram, metadata = result
+            self._writing += 1
+            self.writer.write(input_path, focal_spot, sinogram, self.output_paths(input_path), metadata=metadata,
+                              callback=partial(self._on_written, queued_time))
+
+        # Files count as completed once their outputs are saved
+        while not self._written.empty():
+            input_path, queued_time, error, finished = self._written.get()
+            self._writing -= 1
+            if error is None:
+                self.completed += 1
+                self.latencies.append(finished - queued_time)
+                self.finish_times.append(finished)
+            else:
+                self.failed += 1
+                print("Failed to save %s: %s" % (input_path, error))
+
+        if scan:
+            self.scan(now)
+
+        # Keeping one extra file per worker submitted so workers never
+        # wait on a poll, while the rest stay in the visible queue
+        while self.queue and len(self.in_progress) < 2 * self.jobs:
+            input_path, queued_time = self.queue.popleft()
+            future = executor.submit(reconstruct_input, input_path, self.binary_options)
+            self.in_progress[future] = (input_path, queued_time)
+
+        self.write_status()
+
+    def _on_written(self, queued_time, input_path, error):
+        # Called on the writer thread, so results are handed to the next poll
+        self._written.put((input_path, queued_time, error, time.time()))
+
+
+def _write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
@@ -1,30 +1,22 @@
 import numpy as np
 
 from skimage import img_as_float, img_as_ubyte
-from skimage.io import imread, imsave, imshow
-from skimage.transform import radon, rescale
+from skimage.io import imread, imsave
 from skimage.exposure import equalize_adapthist
 
-from skimage.transform import iradon
-
-from skimage.transform import iradon_sart, rotate
+from pypenumbra import fbp, sart
 
 theta = np.linspace(0., 360., 360, endpoint=False)
 sinogram = img_as_float(imread("./results/sinogram.png"))
 
-reconstruction_fbp = iradon(sinogram, theta=theta, circle=True)
-
-art_fbp_sinogram = radon(reconstruction_fbp, theta=theta, circle=True)
+operator = fbp.get_operator(sinogram.shape[0], theta)
+reconstruction_fbp = operator(sinogram)
 imsave("./results/reconstruction_fbp.png", img_as_ubyte(equalize_adapthist(reconstruction_fbp)))
 
-reconstruction_sart = iradon_sart(sinogram, theta=theta)
-
-reconstruction_sart2 = iradon_sart(sinogram, theta=theta,
-                                   image=reconstruction_sart)
-
-ITERATIONS = 5
-for i in range(0, ITERATIONS):
-    reconstruction_sart2 = iradon_sart(sinogram, theta=theta,
-                                   image=reconstruction_sart2)
+# SART warm starts from the filtered backprojection and iterates
+# until the residual stops improving
+solver = sart.get_solver(sinogram.shape[0], theta)
+reconstruction_sart, iterations = solver(sinogram, initial=reconstruction_fbp)
+print("SART converged after %d iterations" % iterations)
 
-imsave("./results/reconstruction_art.png", img_as_ubyte(equalize_adapthist(reconstruction_sart2)))
+imsave("./results/reconstruction_art.png", img_as_ubyte(equalize_adapthist(reconstruction_sart)))
@@ -23,14 +23,13 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
     ],
     include_package_data=True,
-    python_requires="!=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*, !=3.4.*",
+    python_requires=">=3.7",
     install_requires=[
         "numpy>=1.17.3",
+        "scipy>=1.4",
         "opencv-python>=4.1.1.26",
         "scikit-image>=0.16.2",
         "fire>=0.2.1",
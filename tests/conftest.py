@@ -16,3 +16,8 @@ def focal_spot_circle():
 def sinogram_circle():
     image = io.imread("./tests/data/sinogram_circle.png", as_gray=True)
     return image
+
+@pytest.fixture
+def penumbra_square():
+    image = io.imread("./tests/data/penumbra_test_square.png", as_gray=True)
+    return image
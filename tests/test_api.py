@@ -1,3 +1,4 @@
+import numpy as np
 import pypenumbra.api as api
 from skimage import img_as_float64, img_as_ubyte
 import utils
@@ -18,4 +19,46 @@ def test_reconstruction_from_image(penumbra_circle, focal_spot_circle, sinogram_
     fs_check = utils.duplicate_grayimage_check(img_as_ubyte(focal_spot), focal_spot_circle)
     sino_check = utils.duplicate_grayimage_check(img_as_ubyte(sinogram), sinogram_circle)
     
-    assert fs_check and sino_check
\ No newline at end of file
+    assert fs_check and sino_check
+
+def test_reconstruct_batch(penumbra_square):
+    paths = ["./tests/data/penumbra_test_square.png", "./tests/data/missing.png"]
+    results = api.reconstruct_batch(paths, jobs=1)
+    focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+
+    assert len(results) == 2
+    assert (results[0][0] == focal_spot).all() and (results[0][1] == sinogram).all()
+    assert isinstance(results[1], Exception)
+
+def test_reconstruct_float32(penumbra_square):
+    focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+    focal_spot_32, sinogram_32 = api.reconstruct_from_array(penumbra_square, float_dtype="float32")
+
+    assert focal_spot_32.dtype == sinogram_32.dtype == np.float32
+    assert sinogram_32.shape == sinogram.shape
+    assert np.allclose(focal_spot_32, focal_spot, atol=1e-5 * np.abs(focal_spot).max())
+
+def test_reconstruct_iradon(penumbra_square):
+    focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+    iradon_focal_spot, iradon_sinogram = api.reconstruct_from_array(penumbra_square, method="iradon")
+
+    assert (iradon_sinogram == sinogram).all()
+    assert np.allclose(iradon_focal_spot, focal_spot, rtol=0, atol=1e-9 * np.abs(focal_spot).max())
+
+def test_reconstruct_progressive(penumbra_square):
+    focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+    steps = list(api.reconstruct_progressive(img_as_float64(penumbra_square), img_as_ubyte(penumbra_square)))
+
+    assert [angle_count for _, _, angle_count in steps] == [23, 45, 90, 180, 360]
+    assert (steps[-1][1] == sinogram).all()
+    assert np.allclose(steps[-1][0], focal_spot, rtol=0, atol=1e-12 * np.abs(focal_spot).max())
+
+def test_reconstruct_multiple(penumbra_square):
+    focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+    # Two copies of the penumbra side by side, each far enough from the other to crop it alone
+    plate = np.concatenate((penumbra_square, penumbra_square), axis=1)
+    results = api.reconstruct_multiple(img_as_float64(plate), img_as_ubyte(plate), jobs=2)
+
+    assert sorted(geometry[0] for geometry, _ in results) == [510, 1534]
+    for geometry, (plate_focal_spot, plate_sinogram) in results:
+        assert (plate_focal_spot == focal_spot).all() and (plate_sinogram == sinogram).all()
@@ -0,0 +1,64 @@
+import os
+import shutil
+
+import numpy as np
+
+from pypenumbra.cli import PyPenumbraCLI, find_batch_inputs
+from pypenumbra.store import ResultStore
+
+
+def test_batch_reconstruct_skips_outputs(tmp_path, capsys):
+    shutil.copy("./tests/data/penumbra_test_square.png", str(tmp_path / "plate.png"))
+    cli = PyPenumbraCLI()
+
+    # Outputs saved next to the inputs are not taken as inputs
+    cli.batch_reconstruct(str(tmp_path), output_dir=str(tmp_path), jobs=1)
+    assert "Reconstructed 1 of 1 images (0 skipped, 0 failed)" in capsys.readouterr().out
+    assert sorted(os.listdir(str(tmp_path))) == ["plate.png", "plate_focal_spot.png", "plate_sinogram.png"]
+
+    cli.batch_reconstruct(str(tmp_path / "*.png"), output_dir=str(tmp_path), jobs=1)
+    assert "Reconstructed 0 of 1 images (1 skipped, 0 failed)" in capsys.readouterr().out
+    assert [relative_path for path, relative_path in find_batch_inputs(str(tmp_path))] == ["plate.png"]
+
+
+def test_batch_reconstruct_store(tmp_path, capsys):
+    input_dir = tmp_path / "plates"
+    (input_dir / "day2").mkdir(parents=True)
+    shutil.copy("./tests/data/penumbra_test_square.png", str(input_dir / "plate.png"))
+    shutil.copy("./tests/data/penumbra_test_square.png", str(input_dir / "day2" / "plate.png"))
+    cli = PyPenumbraCLI()
+
+    cli.batch_reconstruct(str(input_dir / "**" / "*.png"), store=str(tmp_path / "store"), jobs=1)
+    assert "Reconstructed 2 of 2 images (0 skipped, 0 failed)" in capsys.readouterr().out
+    # Plates already in the store are skipped, and nothing else is written
+    cli.batch_reconstruct(str(input_dir / "**" / "*.png"), store=str(tmp_path / "store"), jobs=1)
+    assert "Reconstructed 0 of 2 images (2 skipped, 0 failed)" in capsys.readouterr().out
+    assert sorted(os.listdir(str(tmp_path))) == ["plates", "store"]
+
+    store = ResultStore(str(tmp_path / "store"))
+    assert store.ids() == ["day2/plate", "plate"]
+    focal_spot, sinogram, metadata = store.get("day2/plate")
+    assert focal_spot.dtype == np.float64 and metadata["source"].endswith("plate.png") and metadata["radius"] > 0
+
+
+def test_batch_reconstruct_threads(tmp_path, capsys):
+    input_dir = tmp_path / "plates"
+    (input_dir / "day2").mkdir(parents=True)
+    shutil.copy("./tests/data/penumbra_test_square.png", str(input_dir / "plate.png"))
+    shutil.copy("./tests/data/penumbra_test_square.png", str(input_dir / "day2" / "plate.png"))
+    (input_dir / "broken.png").write_bytes(b"Not an image")
+    # A file in the place of an output directory makes saving fail
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "day2").write_bytes(b"")
+    cli = PyPenumbraCLI()
+
+    cli.batch_reconstruct(str(input_dir / "**" / "*.png"), output_dir=str(tmp_path / "out"), output_format="npy",
+                          threads=1)
+    out = capsys.readouterr().out
+    assert "Reconstructed 1 of 3 images (0 skipped, 2 failed)" in out
+    assert "Failed to reconstruct %s" % (input_dir / "broken.png") in out
+    assert "Failed to save %s" % (input_dir / "day2" / "plate.png") in out
+    for name in ("load", "reconstruct", "write"):
+        assert name in out
+    focal_spot = np.load(str(tmp_path / "out" / "plate_focal_spot.npy"))
+    assert focal_spot.dtype == np.float64
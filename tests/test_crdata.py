@@ -0,0 +1,33 @@
+import numpy as np
+
+import pypenumbra.api as api
+import pypenumbra.crdata as crdata
+
+
+def write_cr_data(path, penumbra_square):
+    # Inverting the CR mapping of a 70 kVp plate
+    C = (-0.0739 * 70 ** 2) + (15.408 * 70) + 301.17
+    values = 0.02 + 0.98 * (penumbra_square / 255.0)
+    raw = np.rint(1024 * np.log10(values) + C + 1500).astype("uint16")
+    raw.tofile(str(path))
+    return raw
+
+def test_map_cr_values_raw_max():
+    raw = np.arange(1000, 3000, dtype="uint16").reshape(40, 50)
+    full = crdata.map_cr_values(raw)
+    region = crdata.map_cr_values(raw[10:20, 5:15], raw_max=raw.max())
+
+    assert np.array_equal(region, full[10:20, 5:15])
+
+def test_reconstruct_from_cr_data_roi(tmp_path, penumbra_square):
+    path = tmp_path / "plate.std"
+    raw = write_cr_data(path, penumbra_square)
+    height, width = raw.shape
+
+    region, (left, top) = crdata.read_cr_roi(str(path), height, width)
+    focal_spot, sinogram = api.reconstruct_from_cr_data(str(path), height, width)
+    full_focal_spot, full_sinogram = api.reconstruct_from_cr_data(str(path), height, width, roi=False)
+
+    assert region.shape[0] < height and region.shape[1] < width
+    assert np.array_equal(sinogram, full_sinogram)
+    assert np.array_equal(focal_spot, full_focal_spot)
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+
+import pypenumbra.debug as debug
+
+
+def test_sink_npy(tmp_path):
+    sink = debug.DebugSink(output_dir=str(tmp_path), format="npy")
+    image = np.random.default_rng(0).random((20, 30))
+    expected = image.copy()
+    sink.save("1 - image.png", image)
+    # Raw arrays are saved without rendering them
+    sink.save("2 - rendered.png", image, render=lambda rendered: rendered * 2)
+    # Unless the render makes the data the image is named after
+    sink.save("3 - doubled.png", image, render=lambda rendered: rendered * 2, raw_render=True)
+    image[:] = 0
+    sink.flush()
+
+    assert sink.errors == []
+    assert np.array_equal(np.load(os.path.join(str(tmp_path), "1 - image.npy")), expected)
+    assert np.array_equal(np.load(os.path.join(str(tmp_path), "2 - rendered.npy")), expected)
+    assert np.array_equal(np.load(os.path.join(str(tmp_path), "3 - doubled.npy")), expected * 2)
+
+def test_sink_png(tmp_path):
+    sink = debug.DebugSink(output_dir=str(tmp_path), background=False)
+    sink.save("image.png", np.random.default_rng(0).random((20, 30)))
+
+    assert os.path.isfile(os.path.join(str(tmp_path), "image.png"))
@@ -0,0 +1,73 @@
+import numpy as np
+from skimage.transform import iradon
+
+import pypenumbra.fbp as fbp
+
+
+def test_operator_matches_iradon():
+    sinogram = np.random.default_rng(0).random((37, 360))
+    theta = np.linspace(0., 360., 360, endpoint=False)
+    operator = fbp.FilteredBackprojection(37, theta)
+
+    assert np.allclose(operator(sinogram), iradon(sinogram, theta=theta, circle=True), atol=1e-12)
+
+def test_operator_cache():
+    fbp.operator_cache.clear()
+    theta = np.linspace(0., 360., 90, endpoint=False)
+    # The matrix is only built once a geometry is used again
+    first = fbp.get_operator(41, theta)
+    assert first.matrix is None
+    second = fbp.get_operator(41, theta)
+
+    assert first is second and first.matrix is not None
+    assert fbp.operator_cache.info()["hits"] == 1
+    assert fbp.get_operator(41, theta, filter_name="hann") is not first
+
+def test_operator_without_matrix():
+    sinogram = np.random.default_rng(0).random((37, 360))
+    theta = np.linspace(0., 360., 360, endpoint=False)
+    operator = fbp.FilteredBackprojection(37, theta, matrix=False)
+
+    assert operator.matrix is None
+    assert np.array_equal(operator(sinogram), fbp.FilteredBackprojection(37, theta)(sinogram))
+    assert operator.nbytes < fbp.operator_nbytes(37, 360) / 10
+
+def test_large_operator_is_cached():
+    # The matrix of a 205 row sinogram (Eg: a radius 600 penumbra) is
+    # larger than the operator cache, so it is left out and the operator
+    # is still cached
+    fbp.operator_cache.clear()
+    sinogram = np.random.default_rng(0).random((205, 360))
+    theta = np.linspace(0., 360., 360, endpoint=False)
+    assert fbp.operator_nbytes(205, 360) > fbp.operator_cache.max_bytes
+    operator = fbp.get_operator(205, theta)
+
+    assert operator.matrix is None and fbp.get_operator(205, theta) is operator
+    assert operator.matrix is None and fbp.operator_cache.info()["entries"] == 1
+    assert np.allclose(operator(sinogram), iradon(sinogram, theta=theta, circle=True), atol=1e-12)
+
+
+def test_progressive_backprojection():
+    sinogram = np.random.default_rng(0).random((40, 90))
+    theta = np.linspace(0., 360., 90, endpoint=False)
+
+    subsets = fbp.progressive_subsets(90, first_stride=16)
+    assert np.array_equal(np.sort(np.concatenate(subsets)), np.arange(90))
+
+    fbp.operator_cache.clear()
+    backprojection = fbp.ProgressiveBackprojection(sinogram, theta)
+    angle_counts = []
+    for indices in subsets:
+        image = backprojection.add(indices)
+        angle_counts.append(backprojection.angle_count)
+    assert angle_counts == [6, 12, 23, 45, 90]
+    assert np.allclose(image, fbp.get_operator(40, theta)(sinogram), rtol=0, atol=1e-12)
+    # Every subset is backprojected by the full operator, so a second run
+    # on the geometry only hits the cache
+    info = fbp.operator_cache.info()
+    assert info["entries"] == 1 and info["misses"] == 1
+    second = fbp.ProgressiveBackprojection(sinogram, theta)
+    for indices in subsets:
+        second_image = second.add(indices)
+    assert np.array_equal(second_image, image)
+    assert fbp.operator_cache.info()["misses"] == 1
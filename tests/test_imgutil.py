@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+from skimage import img_as_ubyte
+
+import pypenumbra.imgutil as imgutil
+
+
+def test_crop_to_fit_view():
+    image = np.random.default_rng(0).random((200, 300))
+    center_x, center_y, crop = imgutil.crop_to_fit(40, 150, 100, image)
+
+    assert crop.shape == (83, 83)
+    assert np.shares_memory(crop, image)
+    assert crop[center_y, center_x] == image[100, 150]
+
+def test_crop_to_fit_border():
+    image = np.random.default_rng(0).random((200, 300))
+    center_x, center_y, crop = imgutil.crop_to_fit(40, 20, 180, image)
+    pad_center_x, pad_center_y, pad_image = imgutil.pad_to_fit(40, 20, 180, image)
+    pad_center_x, pad_center_y = pad_center_x + 1, pad_center_y + 1
+
+    assert not np.shares_memory(crop, image)
+    assert np.array_equal(crop[1:-1, 1:-1],
+                          pad_image[pad_center_y - 40:pad_center_y + 41, pad_center_x - 40:pad_center_x + 41])
+
+def test_detect_penumbra(penumbra_square):
+    image = img_as_ubyte(penumbra_square)
+    expected = imgutil.get_center(imgutil.threshold(image))
+
+    assert imgutil.detect_penumbra(image) == expected
+    assert imgutil.detect_penumbra(image, downscale=4) == expected
+
+def test_detect_penumbras():
+    image = np.zeros((400, 600), dtype=np.uint8)
+    cv2.circle(image, (150, 200), 100, 255, thickness=-1)
+    cv2.circle(image, (450, 200), 60, 255, thickness=-1)
+    # Specks too small to be a penumbra
+    image[10:13, 10:13] = 255
+
+    centers = imgutil.detect_penumbras(image)
+    assert [(x, y) for x, y, radius in centers] == [(150, 200), (450, 200)]
+    assert centers[0] == imgutil.detect_penumbra(image)
+
+def test_detect_penumbra_similar_blobs():
+    # Blobs of nearly the same size can swap order in the coarse pass
+    rng = np.random.default_rng(3)
+    image = np.zeros((1200, 1600), dtype=np.uint8)
+    for x, size in zip((250, 650, 1050, 1400), rng.permutation(4)):
+        blob = np.zeros_like(image)
+        cv2.circle(blob, (int(x + rng.integers(0, 9)), int(600 + rng.integers(0, 9))), 150 + int(size), 255, -1)
+        image = np.maximum(image, cv2.GaussianBlur(blob, (0, 0), 25))
+
+    for downscale in (4, 5, 7):
+        assert imgutil.detect_penumbra(image, downscale=downscale) == imgutil.get_center(imgutil.threshold(image))
@@ -0,0 +1,13 @@
+import subprocess
+import sys
+
+
+def test_lazy_imports():
+    # Run in a fresh interpreter, as other tests have already imported everything
+    code = ("import sys\n"
+            "import pypenumbra, pypenumbra.cli\n"
+            "heavy = [m for m in ('cv2', 'scipy', 'skimage', 'matplotlib') if m in sys.modules]\n"
+            "assert not heavy, heavy\n"
+            "assert pypenumbra.reconstruct_from_array.__module__ == 'pypenumbra.api'\n"
+            "assert 'matplotlib' not in sys.modules\n")
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,82 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import pypenumbra.output as output
+
+
+def _images(dtype="float64"):
+    # Mostly zero images, like reconstructions, compress well
+    focal_spot = np.zeros((200, 200), dtype=dtype)
+    focal_spot[80:120, 80:120] = np.random.default_rng(0).random((40, 40))
+    sinogram = np.zeros((60, 360), dtype=dtype)
+    sinogram[20:40] = np.random.default_rng(1).random((20, 360))
+    return focal_spot, sinogram
+
+
+def test_get_output_paths():
+    assert output.get_output_paths("fs", "sino", "plate") == ("fs.png", "sino.png")
+    assert output.get_output_paths("fs", "sino", "plate", "npy") == ("fs.npy", "sino.npy")
+    assert output.get_output_paths("fs", "sino", "plate", "tiff", preview=True) == (
+        "fs.tiff", "sino.tiff", "fs_preview.png", "sino_preview.png")
+    assert output.get_output_paths("fs", "sino", "plate", "npz") == ("plate.npz",)
+    # PNG outputs are previews already
+    assert output.get_output_paths("fs", "sino", "plate", "png", preview=True) == ("fs.png", "sino.png")
+    for paths in (("fs_focal_spot.npy",), ("plate_sinogram_preview.png",), ("plate.npz",)):
+        assert paths[0].endswith(output.OUTPUT_SUFFIXES)
+    with pytest.raises(ValueError):
+        output.get_output_paths("fs", "sino", "plate", "jpg")
+
+
+@pytest.mark.parametrize("output_format", output.OUTPUT_FORMATS)
+def test_save_reconstruction(tmp_path, output_format):
+    focal_spot, sinogram = _images()
+    paths = output.get_output_paths(str(tmp_path / "out" / "fs"), str(tmp_path / "out" / "sino"),
+                                    str(tmp_path / "out" / "plate"), output_format, preview=True)
+    metadata = {"center_x": 10, "center_y": 20, "radius": 5, "top": 1, "bottom": 9}
+    output.save_reconstruction(focal_spot, sinogram, paths, output_format=output_format, metadata=metadata)
+
+    assert all(os.path.isfile(path) for path in paths)
+    # No temporary files are left behind
+    assert sorted(os.listdir(str(tmp_path / "out"))) == sorted(os.path.basename(path) for path in paths)
+    if output_format == "png":
+        assert cv2.imread(paths[0], cv2.IMREAD_UNCHANGED).dtype == np.uint8
+    elif output_format == "npy":
+        assert np.array_equal(np.load(paths[0]), focal_spot) and np.array_equal(np.load(paths[1]), sinogram)
+    elif output_format == "tiff":
+        assert np.array_equal(cv2.imread(paths[0], cv2.IMREAD_UNCHANGED), focal_spot)
+        assert np.array_equal(cv2.imread(paths[1], cv2.IMREAD_UNCHANGED), sinogram)
+    else:
+        with np.load(paths[0]) as bundle:
+            assert np.array_equal(bundle["focal_spot"], focal_spot)
+            assert np.array_equal(bundle["sinogram"], sinogram)
+            assert list(bundle["geometry"]) == [10, 20, 5]
+            assert json.loads(str(bundle["metadata"])) == metadata
+
+
+@pytest.mark.parametrize("output_format, dtype", [("npz", "float64"), ("tiff", "float32")])
+def test_save_reconstruction_compress(tmp_path, output_format, dtype):
+    focal_spot, sinogram = _images(dtype)
+    sizes = []
+    for compress in (False, True):
+        stem = str(tmp_path / ("compressed" if compress else "raw"))
+        paths = output.get_output_paths(stem + "_fs", stem + "_sino", stem, output_format)
+        output.save_reconstruction(focal_spot, sinogram, paths, output_format=output_format, compress=compress)
+        sizes.append(os.path.getsize(paths[0]))
+        if output_format == "tiff":
+            assert np.array_equal(cv2.imread(paths[0], cv2.IMREAD_UNCHANGED), focal_spot)
+
+    assert sizes[1] < sizes[0] / 4
+
+
+def test_save_reconstruction_rejects_compressed_float64_tiff(tmp_path):
+    paths = output.get_output_paths(str(tmp_path / "fs"), str(tmp_path / "sino"), str(tmp_path / "plate"), "tiff")
+    with pytest.raises(ValueError):
+        output.save_reconstruction(*_images(), paths, output_format="tiff", compress=True)
+    assert os.listdir(str(tmp_path)) == []
+    with pytest.raises(ValueError):
+        output.check_output_options("tiff", compress=True)
+    output.check_output_options("tiff", compress=True, float_dtype="float32")
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import pypenumbra.api as api
+from pypenumbra.pipeline import PlatePipeline, Stage, StagedPipeline
+
+
+def _checked_inverse(value):
+    if value == 0:
+        raise ValueError("Zero")
+    return 1 / value
+
+
+def test_staged_pipeline():
+    pipeline = StagedPipeline([Stage("double", lambda value: 2 * value, workers=2),
+                               Stage("inverse", _checked_inverse)], max_queue=1)
+    results = dict(pipeline.run(range(10)))
+
+    assert sorted(results) == list(range(10))
+    assert isinstance(results[0], ValueError)
+    assert results[4] == 1 / 8
+    stats = pipeline.stats()
+    assert stats["double"]["processed"] == 10 and stats["double"]["workers"] == 2
+    assert stats["inverse"]["failed"] == 1 and stats["inverse"]["max_queue_depth"] <= 1
+
+    # Closing early stops feeding items
+    results = pipeline.run(range(1000))
+    next(results)
+    results.close()
+    assert pipeline.stats()["double"]["processed"] < 1000
+
+    with pytest.raises(ValueError):
+        StagedPipeline([])
+
+
+def test_plate_pipeline(penumbra_square):
+    image_path = "./tests/data/penumbra_test_square.png"
+    written = []
+    pipeline = PlatePipeline(write=lambda *result: written.append(result), max_queue=1)
+    results = list(pipeline.run([image_path, "./tests/data/missing.png", image_path]))
+
+    focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+    assert [input_path for input_path, result in results] == [image_path, "./tests/data/missing.png", image_path]
+    assert isinstance(results[1][1], Exception) and results[1][1].stage == "load"
+    assert np.allclose(results[0][1][0], focal_spot) and np.allclose(results[2][1][1], sinogram)
+    assert results[0][1][2]["source"] == image_path and results[0][1][2]["radius"] > 0
+    assert len(written) == 2
+    assert set(pipeline.stats()) == {"load", "reconstruct", "write"}
@@ -0,0 +1,42 @@
+import numpy as np
+from skimage import img_as_float64
+
+import pypenumbra.imgutil as imgutil
+import pypenumbra.polar as polar
+
+
+def loop_slices(center_x, center_y, radius, angular_steps, float_image):
+    rads_per_slice = (np.pi/180.0) * (360.0/angular_steps)
+    slices = np.zeros((angular_steps, radius))
+    for i in range(0, angular_steps):
+        angle = i * rads_per_slice
+        outer_x = center_x + radius * np.cos(angle)
+        outer_y = center_y - radius * np.sin(angle)
+        slices[i] = imgutil.get_line(center_x, center_y, outer_x, outer_y, float_image)
+    return slices
+
+def test_sample_polar_matches_get_line(penumbra_square):
+    float_image = img_as_float64(penumbra_square)
+    expected = loop_slices(511, 510, 222, 90, float_image)
+    slices = polar.sample_polar(511, 510, 222, 90, float_image)
+
+    assert slices.shape == (90, 222)
+    assert np.allclose(slices, expected, atol=1e-6)
+
+def test_polar_grid_cache(penumbra_square):
+    float_image = img_as_float64(penumbra_square)
+    cache = polar.grid_cache
+    cache.clear()
+
+    first = polar.sample_polar(511, 510, 222, 90, float_image)
+    second = polar.sample_polar(400, 420, 222, 90, float_image)
+    info = cache.info()
+
+    assert info["misses"] == 1 and info["hits"] == 1
+    assert np.array_equal(first, polar.sample_polar(511, 510, 222, 90, float_image))
+    assert np.allclose(second, loop_slices(400, 420, 222, 90, float_image), atol=1e-6)
+
+    cache.resize(polar.get_polar_grid(222, 90).nbytes)
+    polar.sample_polar(511, 510, 100, 90, float_image)
+    assert len(cache) == 1
+    assert cache.info()["current_bytes"] <= cache.max_bytes
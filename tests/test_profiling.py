@@ -0,0 +1,54 @@
+import threading
+import tracemalloc
+
+import pypenumbra.api as api
+import pypenumbra.profiling as profiling
+
+
+def test_timings(penumbra_square):
+    timings = profiling.Timings()
+    api.reconstruct_from_array(penumbra_square, timings=timings)
+
+    assert [stage[0] for stage in timings.stages] == list(profiling.STAGES)
+    assert all(seconds >= 0 and nbytes is None for stage_name, seconds, nbytes in timings.stages)
+
+def test_hook(penumbra_square):
+    calls = []
+    hook = lambda stage_name, seconds, nbytes: calls.append((stage_name, nbytes))
+    profiling.add_hook(hook)
+    tracemalloc.start()
+    try:
+        api.reconstruct_from_array(penumbra_square)
+    finally:
+        tracemalloc.stop()
+        profiling.remove_hook(hook)
+
+    assert [call[0] for call in calls] == list(profiling.STAGES)
+    assert dict(calls)["slice"] > 0
+
+
+def test_overlapping_stages_skip_bytes():
+    timings = profiling.Timings()
+    entered = threading.Barrier(2)
+
+    def run_stage(stage_name):
+        with profiling.stage(stage_name, timings):
+            entered.wait()
+            bytearray(1 << 20)
+            entered.wait()
+
+    tracemalloc.start()
+    try:
+        threads = [threading.Thread(target=run_stage, args=(stage_name,)) for stage_name in ("load", "detect")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with profiling.stage("crop", timings):
+            bytearray(1 << 20)
+    finally:
+        tracemalloc.stop()
+
+    nbytes = {stage_name: stage_bytes for stage_name, seconds, stage_bytes in timings.stages}
+    assert nbytes["load"] is None and nbytes["detect"] is None
+    assert nbytes["crop"] >= 1 << 20
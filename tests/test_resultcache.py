@@ -0,0 +1,36 @@
+import numpy as np
+
+import pypenumbra.api as api
+import pypenumbra.imgutil as imgutil
+from pypenumbra.resultcache import ResultCache
+
+
+def test_result_cache(tmp_path, penumbra_square):
+    cache = ResultCache(str(tmp_path))
+    image_path = "./tests/data/penumbra_test_square.png"
+    focal_spot, sinogram = api.reconstruct_from_image(image_path)
+
+    assert cache.get(cache.key(penumbra_square, angular_steps=360)) is None
+    for _ in range(2):
+        cached_focal_spot, cached_sinogram = api.reconstruct_from_image(image_path, cache=cache)
+        assert np.array_equal(cached_focal_spot, focal_spot)
+        assert np.array_equal(cached_sinogram, sinogram)
+    # Arrays holding the image's pixels share its entry
+    api.reconstruct_from_array(penumbra_square, cache=cache)
+    assert cache.hits == 2
+
+    key = cache.key(penumbra_square, angular_steps=360, method="fbp", float_dtype="float64")
+    assert cache.get(key)[2] == tuple(int(value) for value in imgutil.detect_penumbra(penumbra_square))
+
+    # Other parameters are other entries
+    api.reconstruct_from_array(penumbra_square, angular_steps=180, cache=cache)
+    assert cache.info()["entries"] == 2
+
+
+def test_result_cache_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=40000)
+    for i in range(4):
+        cache.put(cache.key(np.full(4, i)), np.random.rand(40, 40), np.random.rand(20, 20), (1, 2, 3))
+    info = cache.info()
+    assert 0 < info["entries"] < 4 and info["current_bytes"] <= 40000
+    assert cache.get(cache.key(np.full(4, 3))) is not None
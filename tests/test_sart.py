@@ -0,0 +1,71 @@
+import numpy as np
+from skimage.transform import radon
+
+import pypenumbra.api as api
+import pypenumbra.sart as sart
+
+
+def test_sart_reduces_residual():
+    image = np.zeros((41, 41))
+    image[15:25, 18:22] = 1.0
+    theta = np.linspace(0., 360., 180, endpoint=False)
+    sinogram = radon(image, theta=theta, circle=True)
+
+    solver = sart.get_solver(41, theta)
+    operator = solver.operator
+    measured = np.zeros((operator.diagonal, len(theta)))
+    measured[operator.pad_before:operator.pad_before + 41] = sinogram
+    measured = measured.T.ravel()
+
+    initial = operator(sinogram)
+    reconstructed, iterations = solver(sinogram, initial=initial, max_iterations=20)
+
+    assert 0 < iterations < 20
+    assert (solver.residual(reconstructed[operator.circle_mask], measured)
+            < solver.residual(initial[operator.circle_mask], measured))
+    assert sart.get_solver(41, theta) is solver
+
+
+def _measured(operator, sinogram):
+    measured = np.zeros((operator.diagonal, sinogram.shape[1]))
+    measured[operator.pad_before:operator.pad_before + sinogram.shape[0]] = sinogram
+    return measured.T.ravel()
+
+
+def test_sart_iterations_reduce_residual():
+    # Iterating on a noisy phantom keeps reducing the residual, so every
+    # iteration run is kept
+    image = np.zeros((41, 41))
+    image[15:25, 18:22] = 1.0
+    theta = np.linspace(0., 360., 180, endpoint=False)
+    sinogram = radon(image, theta=theta, circle=True)
+    sinogram += np.random.default_rng(0).normal(0, 0.5, sinogram.shape)
+    solver = sart.get_solver(41, theta)
+    measured = _measured(solver.operator, sinogram)
+
+    residuals = []
+    for max_iterations in range(4):
+        reconstructed, iterations = solver(sinogram, max_iterations=max_iterations, tol=0, min_improvement=0)
+        assert iterations == max_iterations
+        residuals.append(solver.residual(reconstructed[solver.operator.circle_mask], measured))
+    assert residuals == sorted(residuals, reverse=True) and residuals[-1] < residuals[0]
+
+
+def test_sart_never_worse_than_fbp(penumbra_square):
+    # The residual of this plate rises after the first sweep, and an
+    # iteration lowering it again stays above the filtered backprojection's
+    focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+    theta = np.linspace(0., 360., sinogram.shape[1], endpoint=False)
+    solver = sart.get_solver(sinogram.shape[0], theta)
+    operator = solver.operator
+    measured = _measured(operator, sinogram)
+    initial_residual = solver.residual(focal_spot[operator.circle_mask], measured)
+
+    # A negative min_improvement keeps iterating while the residual rises
+    for max_iterations in (1, 2, 5):
+        reconstructed, iterations = solver(sinogram, max_iterations=max_iterations, tol=0, min_improvement=-1)
+        assert solver.residual(reconstructed[operator.circle_mask], measured) <= initial_residual
+        assert iterations == 0 and (reconstructed == focal_spot).all()
+
+    sart_focal_spot, _ = api.reconstruct_from_array(penumbra_square, method="sart")
+    assert (sart_focal_spot == focal_spot).all()
@@ -0,0 +1,36 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import pypenumbra.api as api
+from pypenumbra.client import ReconstructionClient
+from pypenumbra.server import ReconstructionServer
+
+
+def test_server(penumbra_square):
+    server = ReconstructionServer(port=0, jobs=1, batch_window=0.05)
+    server.start()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = ReconstructionClient(*server.address)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(client.reconstruct_array, penumbra_square) for _ in range(3)]
+            futures.append(executor.submit(client.reconstruct_file, "./tests/data/penumbra_test_square.png"))
+            results = [future.result() for future in futures]
+
+        focal_spot, sinogram = api.reconstruct_from_array(penumbra_square)
+        for served_focal_spot, served_sinogram in results:
+            assert np.array_equal(served_focal_spot, focal_spot)
+            assert np.array_equal(served_sinogram, sinogram)
+
+        with pytest.raises(ValueError):
+            client.reconstruct_array(penumbra_square, method="unknown")
+
+        status = client.status()
+        assert status["completed"] == 4 and status["failed"] == 0
+        assert status["batches"] < 4
+    finally:
+        server.shutdown()
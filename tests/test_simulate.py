@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+import pypenumbra.api as api
+import pypenumbra.simulate as psim
+
+
+def test_convolution_methods():
+    blank = psim.generate_blank_penumbra_square(200, 60)
+    simulator = psim.PenumbraSimulator(blank)
+    sparse_kernel = psim.create_dual_point_kernel(31, 11)
+    dense_kernel = np.random.default_rng(0).random((21, 24))
+
+    for kernel in (sparse_kernel, dense_kernel):
+        expected = cv2.filter2D(blank, -1, kernel)
+        assert np.allclose(simulator.convolve(kernel, method="direct"), expected)
+        assert np.allclose(simulator.convolve(kernel, method="fft"), expected)
+
+def test_generate_penumbra_stretch():
+    blank = psim.generate_blank_penumbra_square(200, 60)
+    kernel = psim.create_dual_point_kernel(31, 11)
+
+    assert psim.generate_penumbra(blank, kernel).dtype == np.uint8
+    assert np.allclose(psim.generate_penumbra(blank, kernel, stretch=False), cv2.filter2D(blank, -1, kernel))
+
+def test_sweep():
+    grid = psim.parameter_grid(circle_radius=[80], point_distance=[11, 21])
+    results = list(psim.sweep(grid, width=400, height=300, jobs=1))
+    blank = psim.generate_blank_penumbra_rectangle(400, 300, 80)
+    focal_spot, sinogram = api.reconstruct_from_array(
+        psim.generate_penumbra(blank, psim.create_dual_point_kernel(69, 21)))
+
+    assert [parameters for parameters, result in results] == grid
+    assert np.array_equal(results[1][1][0], focal_spot)
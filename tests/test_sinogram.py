@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from skimage import img_as_float64, img_as_ubyte
+
+import pypenumbra.api as api
+import pypenumbra.imgutil as imgutil
+import pypenumbra.simulate as psim
+import pypenumbra.sinogram as sinogram
+
+
+def slice_square(penumbra_square):
+    float_image = img_as_float64(penumbra_square)
+    center_x, center_y, radius = imgutil.get_center(imgutil.threshold(img_as_ubyte(penumbra_square)))
+    padding = int(round(radius * 0.1))
+    radius = radius + padding
+    center_x, center_y, float_image = imgutil.pad_to_fit(radius, center_x, center_y, float_image)
+    slices = sinogram.slice_penumbra_blob(center_x, center_y, radius, 360, float_image, None)
+    return slices, padding
+
+def test_get_sinogram_size(penumbra_square):
+    slices, padding = slice_square(penumbra_square)
+    top, bottom, center = sinogram.get_sinogram_size(slices, padding)
+    assert (top, bottom, center) == (185, 222, 204)
+
+    # The profile method finds the threshold method's edges, on a test
+    # plate and on a simulated plate with a wider penumbra
+    blank = psim.generate_blank_penumbra_square(450, 150)
+    simulated = psim.generate_penumbra(blank, psim.create_dual_point_kernel(31, 11))
+    for image in (penumbra_square, simulated):
+        slices, padding = slice_square(image)
+        expected = sinogram.get_sinogram_size(slices, padding)
+        bounds = sinogram.get_sinogram_size(slices, padding, method="profile")
+        assert all(abs(value - expected_value) <= 1 for value, expected_value in zip(bounds, expected))
+
+def test_reconstruct_bounds_method(penumbra_square):
+    metadata = {}
+    profile_metadata = {}
+    api.reconstruct_from_array(penumbra_square, metadata=metadata)
+    api.reconstruct_from_array(penumbra_square, metadata=profile_metadata, bounds_method="profile")
+
+    assert abs(profile_metadata["top"] - metadata["top"]) <= 1
+    assert abs(profile_metadata["bottom"] - metadata["bottom"]) <= 1
+    with pytest.raises(ValueError):
+        api.reconstruct_from_array(penumbra_square, bounds_method="mean")
+
+def test_construct_sinogram_band_derivative(penumbra_square):
+    float_image = img_as_float64(penumbra_square)
+    uint8_image = img_as_ubyte(penumbra_square)
+    crop_sinogram = sinogram.construct_sinogram(float_image, uint8_image)
+
+    slices, padding = slice_square(penumbra_square)
+    top, bottom, center = sinogram.get_sinogram_size(slices, padding)
+    expected = imgutil.apply_first_derivative(slices)[top:bottom]
+
+    assert np.array_equal(crop_sinogram, expected)
@@ -0,0 +1,51 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from pypenumbra.store import ResultStore
+
+
+def _append_plates(store_dir, worker):
+    store = ResultStore(store_dir)
+    for i in range(3):
+        store.append("worker%d/plate%d" % (worker, i), np.full((5, 5), worker + i, dtype="float32"),
+                     np.zeros((4, 360)), metadata={"radius": worker})
+    store.close()
+
+
+def test_result_store(tmp_path):
+    # A small chunk size spreads the plates over several chunks
+    store = ResultStore(str(tmp_path), chunk_bytes=1000)
+    rng = np.random.default_rng(0)
+    plates = {}
+    for i in range(5):
+        plates["plate%d" % i] = (rng.random((20 + i, 20 + i)), rng.random((30 + i, 360)).astype("float32"),
+                                 {"center_x": i, "top": 10, "bottom": 40 + i})
+        store.append("plate%d" % i, *plates["plate%d" % i][:2], metadata=plates["plate%d" % i][2])
+    store.append("plate0", plates["plate1"][0], plates["plate1"][1], metadata={"center_x": 10})
+
+    # A separate reader sees every appended plate, the latest result for a repeated ID
+    reader = ResultStore(str(tmp_path))
+    assert reader.ids() == sorted(plates) and len(reader) == 5
+    focal_spot, sinogram, metadata = reader.get("plate3")
+    assert isinstance(focal_spot, np.memmap) and not focal_spot.flags.writeable
+    assert np.array_equal(focal_spot, plates["plate3"][0]) and sinogram.dtype == np.float32
+    assert metadata == plates["plate3"][2]
+    assert reader.metadata("plate0") == {"center_x": 10}
+    assert [plate_id for plate_id, metadata in reader.records()] == sorted(plates)
+
+    streamed = [(plate_id, focal_spot.shape) for plate_id, focal_spot, sinogram, metadata in reader.iterate()]
+    assert streamed[1:] == [("plate%d" % i, (20 + i, 20 + i)) for i in range(1, 5)]
+    with pytest.raises(KeyError):
+        reader.get("missing")
+
+
+def test_result_store_parallel_appends(tmp_path):
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        list(executor.map(_append_plates, [str(tmp_path)] * 2, range(2)))
+
+    store = ResultStore(str(tmp_path))
+    assert len(store) == 6
+    focal_spot, sinogram, metadata = store.get("worker1/plate2")
+    assert focal_spot[0, 0] == 3 and metadata == {"radius": 1}
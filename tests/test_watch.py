@@ -0,0 +1,56 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from pypenumbra.watch import FolderWatcher
+
+
+def test_watch(tmp_path):
+    input_dir = tmp_path / "plates"
+    output_dir = tmp_path / "results"
+    input_dir.mkdir()
+    shutil.copy("./tests/data/penumbra_test_square.png", str(input_dir / "plate.png"))
+    (input_dir / "notes.txt").write_text("not a plate")
+
+    watcher = FolderWatcher(str(input_dir), str(output_dir), jobs=1, pattern="*.png",
+                            poll_interval=0.01, settle_time=0)
+    watcher.run(max_polls=3)
+
+    assert sorted(os.listdir(str(output_dir))) == ["plate_focal_spot.png", "plate_sinogram.png", "watch_status.json"]
+    with open(str(output_dir / "watch_status.json")) as f:
+        status = json.load(f)
+    assert status["completed"] == 1 and status["failed"] == 0 and status["queue_depth"] == 0
+
+
+def test_watch_raw_outputs(tmp_path):
+    input_dir = tmp_path / "plates"
+    input_dir.mkdir()
+    shutil.copy("./tests/data/penumbra_test_square.png", str(input_dir / "plate.png"))
+
+    # Outputs written into the watched directory are not taken as inputs
+    watcher = FolderWatcher(str(input_dir), str(input_dir), jobs=1, poll_interval=0.01, settle_time=0,
+                            output_format="npz", preview=True)
+    watcher.run(max_polls=3)
+
+    assert sorted(os.listdir(str(input_dir))) == ["plate.npz", "plate.png", "plate_focal_spot_preview.png",
+                                                  "plate_sinogram_preview.png", "watch_status.json"]
+    assert watcher.status()["completed"] == 1 and watcher.status()["failed"] == 0
+    with np.load(str(input_dir / "plate.npz")) as bundle:
+        metadata = json.loads(str(bundle["metadata"]))
+        assert bundle["focal_spot"].dtype == np.float64
+        assert list(bundle["geometry"]) == [metadata["center_x"], metadata["center_y"], metadata["radius"]]
+        assert bundle["sinogram"].shape[1] == metadata["angular_steps"]
+    assert metadata["top"] < metadata["bottom"]
+
+
+def test_watch_forgets_removed_files(tmp_path):
+    (tmp_path / "plate.png").write_bytes(b"not decoded by scan")
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path / "results"), jobs=1, settle_time=0)
+    watcher.scan(now=0)
+    assert watcher.scan(now=1) == 1 and str(tmp_path / "plate.png") in watcher._known
+
+    (tmp_path / "plate.png").unlink()
+    watcher.scan(now=2)
+    assert watcher._known == {} and watcher._candidates == {}